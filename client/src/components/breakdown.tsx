@@ -86,6 +86,17 @@ export default function BreakdownComponent({
     const response = await axios.post(apiEndpoint, formData, {
       headers: { "Content-Type": "multipart/form-data" },
     });
+    return filterRegions(response);
+  };
+
+  // Study charts are registered on the server (VISTRUCT_ASSET_DIR), so they
+  // can be analyzed by name without downloading and re-uploading the image.
+  const analyzeAsset = async (assetId: string, apiEndpoint: string) => {
+    const response = await axios.post(`${apiEndpoint}?asset=${encodeURIComponent(assetId)}`);
+    return filterRegions(response);
+  };
+
+  const filterRegions = (response: { data: any }) => {
     let filteredRegions = response.data;
     
     filteredRegions = response.data.regions.filter((region: { rectangular: any; }) => region.rectangular);
@@ -138,10 +149,16 @@ export default function BreakdownComponent({
       try {
         setIsLoading(true);
         const dynamicAPI = getAPIEndpointForChart(chart);
-        const imageResponse = await fetch(`/studyProblem/${chart}.png`);
-        const blob = await imageResponse.blob();
-        const file = new File([blob], `${chart}.png`, { type: blob.type });
-        const result = await analyzeImage(file, dynamicAPI);
+        let result;
+        try {
+          result = await analyzeAsset(chart, dynamicAPI);
+        } catch (error) {
+          // The server has no asset registry (or not this chart): upload it.
+          const imageResponse = await fetch(`/studyProblem/${chart}.png`);
+          const blob = await imageResponse.blob();
+          const file = new File([blob], `${chart}.png`, { type: blob.type });
+          result = await analyzeImage(file, dynamicAPI);
+        }
         setAnalysisOutput(result);
       } catch (error) {
         console.error("Error analyzing image:", error);
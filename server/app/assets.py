@@ -0,0 +1,95 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from app.hashing import content_hash
+
+ASSET_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class Asset:
+    """
+    A chart image known to the server: its encoded bytes (so results are
+    keyed and cached exactly like an upload of the same file) and its
+    decoded pixels, kept read-only because every request shares them.
+    """
+
+    def __init__(self, asset_id: str, path: Path, contents: bytes, image: np.ndarray):
+        self.id = asset_id
+        self.path = path
+        self.contents = contents
+        self.hash = content_hash(contents)
+        self.image = image
+
+    def summary(self) -> Dict:
+        height, width = self.image.shape[:2]
+        return {
+            "id": self.id,
+            "file": self.path.name,
+            "input_hash": self.hash,
+            "width": width,
+            "height": height,
+            "memory_mapped": isinstance(self.image, np.memmap),
+        }
+
+
+class AssetRegistry:
+    """
+    The chart images of a directory, loaded and decoded once at startup so
+    requests can name them (?asset=<id>, the file name without extension)
+    instead of uploading them.
+
+    With `mmap`, decoded pixels are written once to `cache_dir` as .npy
+    files and memory-mapped, so they are shared through the page cache
+    rather than held by each worker process.
+    """
+
+    def __init__(self, directory: str, mmap: bool = False, cache_dir: Optional[str] = None):
+        self.directory = Path(directory) if directory else None
+        self.mmap = mmap
+        self.cache_dir = Path(cache_dir or os.path.join(tempfile.gettempdir(), "vistruct-assets"))
+        self._assets: Dict[str, Asset] = {}
+
+    def load(self) -> "AssetRegistry":
+        if self.directory is None:
+            return self
+        if not self.directory.is_dir():
+            raise RuntimeError(f"Asset directory not found: {self.directory}")
+        assets = {}
+        for path in sorted(self.directory.iterdir()):
+            if path.suffix.lower() not in ASSET_EXTENSIONS:
+                continue
+            contents = path.read_bytes()
+            image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            asset = Asset(path.stem, path, contents, image)
+            if self.mmap:
+                asset.image = self._mapped(asset)
+            else:
+                asset.image.setflags(write=False)
+            assets[asset.id] = asset
+        self._assets = assets
+        return self
+
+    def _mapped(self, asset: Asset) -> np.ndarray:
+        # Named by content hash, so a changed file gets a new cache entry and
+        # concurrent workers starting up agree on the file to map.
+        cached = self.cache_dir / f"{asset.hash}.npy"
+        if not cached.exists():
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            partial = cached.with_suffix(f".{os.getpid()}.tmp")
+            with open(partial, "wb") as f:
+                np.save(f, asset.image)
+            os.replace(partial, cached)
+        return np.load(cached, mmap_mode="r")
+
+    def get(self, asset_id: str) -> Optional[Asset]:
+        return self._assets.get(asset_id)
+
+    def list(self) -> List[Dict]:
+        return [asset.summary() for asset in self._assets.values()]
@@ -0,0 +1,166 @@
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app import config, metrics
+
+
+class IdleBudget:
+    """
+    Bytes of idle buffers all the pools sharing it may keep together.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes: int) -> bool:
+        with self._lock:
+            if self.used_bytes + nbytes > self.max_bytes:
+                return False
+            self.used_bytes += nbytes
+            return True
+
+    def give_back(self, nbytes: int) -> None:
+        with self._lock:
+            self.used_bytes -= nbytes
+
+
+class BufferPool:
+    """
+    Free lists of scratch arrays keyed by (shape, dtype), bounded to
+    `max_bytes` of idle buffers. The least recently used shapes are
+    evicted first.
+
+    Parameters:
+      - max_bytes: Idle bytes this pool may keep.
+      - budget: Optional IdleBudget shared with other pools. A released
+        buffer that does not fit in it evicts this pool's own idle buffers,
+        and is dropped if it still does not fit.
+    """
+
+    def __init__(self, max_bytes: int, budget: Optional[IdleBudget] = None):
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self.free_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._free: "OrderedDict[Tuple, List[np.ndarray]]" = OrderedDict()
+
+    def acquire(self, shape, dtype=np.uint8) -> np.ndarray:
+        key = (tuple(shape), np.dtype(dtype).str)
+        free = self._free.get(key)
+        if free:
+            buf = free.pop()
+            if not free:
+                del self._free[key]
+            self.free_bytes -= buf.nbytes
+            if self.budget is not None:
+                self.budget.give_back(buf.nbytes)
+            self.hits += 1
+            return buf
+        self.misses += 1
+        return np.empty(shape, dtype)
+
+    def release(self, buf: np.ndarray) -> None:
+        if buf.nbytes > self.max_bytes:
+            return
+        while self._free and self.free_bytes + buf.nbytes > self.max_bytes:
+            self._evict_oldest()
+        if self.budget is not None:
+            while not self.budget.reserve(buf.nbytes):
+                if not self._free:
+                    return
+                self._evict_oldest()
+        key = (buf.shape, buf.dtype.str)
+        self._free.setdefault(key, []).append(buf)
+        self._free.move_to_end(key)
+        self.free_bytes += buf.nbytes
+
+    def _evict_oldest(self) -> None:
+        oldest_key, oldest = next(iter(self._free.items()))
+        nbytes = oldest.pop(0).nbytes
+        if not oldest:
+            del self._free[oldest_key]
+        self.free_bytes -= nbytes
+        if self.budget is not None:
+            self.budget.give_back(nbytes)
+
+
+_local = threading.local()
+# BUFFER_POOL_MB bounds the idle buffers of all worker threads together,
+# however many threads the executor grows to.
+idle_budget = IdleBudget(config.BUFFER_POOL_MB * 2**20)
+
+
+def worker_pool() -> BufferPool:
+    """
+    Returns the calling thread's buffer pool.
+    """
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = BufferPool(config.BUFFER_POOL_MB * 2**20, idle_budget)
+        _local.leases = []
+    return pool
+
+def scratch(shape, dtype=np.uint8) -> np.ndarray:
+    """
+    Returns an uninitialized array for use as an OpenCV `dst=` argument.
+
+    Inside a `lease_scope` the array comes from the worker's pool and goes
+    back to it when the innermost scope exits, so it must not outlive that
+    scope. Outside any scope this is just np.empty.
+    """
+    if config.BUFFER_POOL_MB <= 0:
+        return np.empty(shape, dtype)
+    pool = worker_pool()
+    if not _local.leases:
+        return np.empty(shape, dtype)
+    buf = pool.acquire(shape, dtype)
+    _local.leases[-1].append(buf)
+    return buf
+
+@contextmanager
+def lease_scope():
+    """
+    Returns every buffer handed out by `scratch` inside the block to the
+    worker's pool on exit.
+    """
+    pool = worker_pool()
+    _local.leases.append([])
+    try:
+        yield pool
+    finally:
+        for buf in _local.leases.pop():
+            pool.release(buf)
+
+@contextmanager
+def request_scope():
+    """
+    Outermost lease scope for one analysis request; also publishes pool
+    statistics when the request ends.
+    """
+    with lease_scope() as pool:
+        hits, misses = pool.hits, pool.misses
+        try:
+            yield pool
+        finally:
+            metrics.increment("buffer_pool_hits", pool.hits - hits)
+            metrics.increment("buffer_pool_misses", pool.misses - misses)
+    metrics.observe("buffer_pool_free_bytes", idle_budget.used_bytes)
+
+def pooled(func):
+    """
+    Decorator for detectors that take scratch buffers: buffers leased during
+    the call go back to the pool when it returns.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with lease_scope():
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,104 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, TypeVar
+
+from app import config
+
+T = TypeVar("T")
+
+
+class AnalysisCancelled(Exception):
+    """
+    Raised inside an analysis whose request was abandoned (the client
+    disconnected), to stop the detectors at the next check.
+    """
+
+
+class CancelToken:
+    """
+    Cancellation state of one analysis, shared by the request handler,
+    which cancels it when the client goes away, and the worker thread
+    running the detectors, which checks it between stages and in long
+    loops.
+
+    Parameters:
+      - deadline: Seconds the analysis may run before its remaining work
+        is skipped and what it found so far is returned, flagged
+        "truncated" (None or 0: no deadline).
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.expires = time.monotonic() + deadline if deadline else None
+        self.cancelled = False
+        self.truncated = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "cancel_token", default=None)
+
+
+@contextmanager
+def active(token: CancelToken):
+    """
+    Makes `token` the one checked by the analysis code run in the block.
+    """
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+def run(token: CancelToken, fn: Callable[..., T], *args) -> T:
+    # For asyncio.to_thread: fn(*args) with `token` active in the worker thread.
+    with active(token):
+        return fn(*args)
+
+def check() -> None:
+    """
+    Raises AnalysisCancelled if the current analysis was abandoned.
+    """
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        raise AnalysisCancelled()
+
+def within_deadline() -> bool:
+    """
+    Whether the current analysis may go on with more work: False once its
+    deadline has passed (the result is then marked truncated). Raises
+    AnalysisCancelled if it was abandoned.
+    """
+    token = _current_token.get()
+    if token is None:
+        return True
+    if token.cancelled:
+        raise AnalysisCancelled()
+    if token.expires is not None and time.monotonic() > token.expires:
+        token.truncated = True
+        return False
+    return True
+
+def truncated() -> bool:
+    token = _current_token.get()
+    return token is not None and token.truncated
+
+
+def parse_deadlines(spec: str) -> Dict[str, float]:
+    """
+    Per chart type deadlines from "pie_chart=5,map=10".
+    """
+    deadlines = {}
+    for item in spec.split(","):
+        if item.strip():
+            chart_type, _, seconds = item.partition("=")
+            deadlines[chart_type.strip()] = float(seconds)
+    return deadlines
+
+DEADLINES = parse_deadlines(config.ANALYSIS_DEADLINES)
+
+def deadline_for(chart_type: str) -> Optional[float]:
+    seconds = DEADLINES.get(chart_type, config.ANALYSIS_DEADLINE_SECONDS)
+    return seconds if seconds > 0 else None
@@ -0,0 +1,81 @@
+import os
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Memory budget for a single analysis request (0 disables the budget).
+MEMORY_BUDGET_MB = _env_int("VISTRUCT_MEMORY_BUDGET_MB", 512)
+# What to do when a request would exceed the budget: "downscale" or "reject".
+MEMORY_BUDGET_MODE = _env_str("VISTRUCT_MEMORY_BUDGET_MODE", "downscale")
+# Trace allocations for every request (debug requests are always traced).
+TRACE_MEMORY = _env_bool("VISTRUCT_TRACE_MEMORY", False)
+# Idle scratch buffers all worker threads together may keep for reuse (0 disables pooling).
+BUFFER_POOL_MB = _env_int("VISTRUCT_BUFFER_POOL_MB", 64)
+# Where background jobs are kept: "memory" or "sqlite:<path>".
+JOB_STORE = _env_str("VISTRUCT_JOB_STORE", "memory")
+# Number of background jobs analyzed at once.
+JOB_WORKERS = _env_int("VISTRUCT_JOB_WORKERS", 1)
+# How long finished jobs (and their results) are kept.
+JOB_RETENTION_SECONDS = _env_int("VISTRUCT_JOB_RETENTION_SECONDS", 3600)
+# Submissions beyond this many queued jobs are refused with 503.
+JOB_MAX_QUEUED = _env_int("VISTRUCT_JOB_MAX_QUEUED", 100)
+# Analyses run at once for /analyze/* requests (each in a worker thread).
+ANALYSIS_CONCURRENCY = _env_int("VISTRUCT_ANALYSIS_CONCURRENCY", 1)
+# Of those, the most bulk analyses (X-Priority: bulk and background jobs) run at once (0: no limit).
+BULK_CONCURRENCY = _env_int("VISTRUCT_BULK_CONCURRENCY", 0)
+# Allow on-demand profiling (?profile= or X-Profile) and the /debug/profiles endpoints.
+PROFILING = _env_bool("VISTRUCT_PROFILING", False)
+# Keep sampled profiles of this many slowest analyses (0 disables the capture).
+PROFILE_SLOWEST = _env_int("VISTRUCT_PROFILE_SLOWEST", 0)
+# Directory of chart images loaded at startup and analyzable by name (?asset=<id>); empty disables.
+ASSET_DIR = _env_str("VISTRUCT_ASSET_DIR", "")
+# Keep decoded assets in memory-mapped .npy files shared by all worker processes.
+ASSET_MMAP = _env_bool("VISTRUCT_ASSET_MMAP", False)
+# Where memory-mapped assets are written (default: a directory under the system temp dir).
+ASSET_CACHE_DIR = _env_str("VISTRUCT_ASSET_CACHE_DIR", "")
+# Recent analysis results reused for near-duplicate uploads (0 disables the cache).
+NEAR_DUPLICATE_ENTRIES = _env_int("VISTRUCT_NEAR_DUPLICATE_ENTRIES", 128)
+# Largest gray-level difference between 1/4-size thumbnails still taken for the same chart.
+NEAR_DUPLICATE_DIFFERENCE = _env_int("VISTRUCT_NEAR_DUPLICATE_DIFFERENCE", 24)
+# Layouts (title, axis and legend regions) remembered for same-template charts (0 disables).
+LAYOUT_CACHE_ENTRIES = _env_int("VISTRUCT_LAYOUT_CACHE_ENTRIES", 0)
+# Side in pixels of the tiles streamed frames are diffed in (/analyze/<type>/stream).
+STREAM_TILE = _env_int("VISTRUCT_STREAM_TILE", 32)
+# Largest per-channel change between streamed frames still taken as unchanged.
+STREAM_THRESHOLD = _env_int("VISTRUCT_STREAM_THRESHOLD", 24)
+# Gaze samples kept for /eye-tracker/ws subscribers (about 9 minutes at 120 Hz).
+GAZE_BUFFER_SAMPLES = _env_int("VISTRUCT_GAZE_BUFFER_SAMPLES", 65536)
+# Default number of gaze batches pushed per second to each subscriber.
+GAZE_BATCH_HZ = _env_float("VISTRUCT_GAZE_BATCH_HZ", 30.0)
+# Gaze sessions (per-region dwell over an analyzed chart) open at once.
+GAZE_MAX_SESSIONS = _env_int("VISTRUCT_GAZE_MAX_SESSIONS", 32)
+# Read the text of title, x-axis tick and treemap label regions with tesseract (needs pytesseract and the tesseract binary).
+OCR = _env_bool("VISTRUCT_OCR", False)
+# Tesseract processes run at once, shared by all requests.
+OCR_WORKERS = _env_int("VISTRUCT_OCR_WORKERS", 2)
+# Most text crops packed into one tesseract run.
+OCR_BATCH = _env_int("VISTRUCT_OCR_BATCH", 48)
+# Recognized text crops remembered by content hash (0 disables the cache).
+OCR_CACHE_ENTRIES = _env_int("VISTRUCT_OCR_CACHE_ENTRIES", 4096)
+# Seconds an /analyze/* analysis may run before it returns its partial result, flagged "truncated" (0: no deadline).
+ANALYSIS_DEADLINE_SECONDS = _env_float("VISTRUCT_ANALYSIS_DEADLINE_SECONDS", 0.0)
+# Deadlines of single chart types overriding it, as "pie_chart=5,map=10".
+ANALYSIS_DEADLINES = _env_str("VISTRUCT_ANALYSIS_DEADLINES", "")
+# Directory of results precomputed by tools.build_annotations, served before live analysis; empty disables.
+PREBUILT_DIR = _env_str("VISTRUCT_PREBUILT_DIR", "")
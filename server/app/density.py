@@ -0,0 +1,120 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Largest grid accepted (columns, and rows); bounds an aggregated response
+# to MAX_GRID * MAX_GRID counts per color, however many marks were found.
+MAX_GRID = 256
+
+
+def grid_shape(width: int, height: int, columns: int) -> Tuple[int, int]:
+    """
+    The (columns, rows) of a grid `columns` cells wide over a width x height
+    image, with rows chosen so the cells are close to square.
+    """
+    columns = max(1, min(columns, MAX_GRID, width))
+    rows = max(1, min(MAX_GRID, height, int(round(columns * height / width))))
+    return columns, rows
+
+def cell_box(width: int, height: int, columns: int, rows: int, column: int, row: int) -> Dict:
+    return {
+        "xmin": int(round(column * width / columns)),
+        "ymin": int(round(row * height / rows)),
+        "xmax": int(round((column + 1) * width / columns)),
+        "ymax": int(round((row + 1) * height / rows)),
+    }
+
+def region_centers(regions: List[Dict]) -> np.ndarray:
+    """
+    An (N, 2) array of the (x, y) centers of the regions' boxes.
+    """
+    boxes = np.array([[r["rectangular"][k] for k in ("xmin", "ymin", "xmax", "ymax")] for r in regions],
+                     dtype=np.float32).reshape(-1, 4)
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+def point_centers(group: Dict) -> np.ndarray:
+    """
+    An (N, 2) array of a point group's flat "xy" list.
+    """
+    return np.asarray(group["xy"], dtype=np.float64).reshape(-1, 2)
+
+def cell_indices(centers: np.ndarray, width: int, height: int, columns: int, rows: int) -> np.ndarray:
+    """
+    The row-major index of the grid cell holding each (x, y) center.
+    """
+    column = np.clip((centers[:, 0] * columns / width).astype(np.int64), 0, columns - 1)
+    row = np.clip((centers[:, 1] * rows / height).astype(np.int64), 0, rows - 1)
+    return row * columns + column
+
+def density_grid(regions: List[Dict], points: Optional[List[Dict]], width: int, height: int,
+                 columns: int) -> Dict:
+    """
+    Counts marks per grid cell, per color.
+
+    Parameters:
+      - regions: Mark regions (e.g. one per dot or bubble); each is counted at its box center.
+      - points: Point groups ({"color", "xy"}) from dense extraction, or None.
+      - width, height: Image size in pixels.
+      - columns: Requested grid width in cells (at most MAX_GRID).
+
+    Returns:
+      A dictionary with:
+         - "columns", "rows": The grid shape.
+         - "bounds": The image box the grid covers.
+         - "layers": One {"color", "count", "counts"} per color, where
+           "counts" is the row-major list of marks per cell.
+    """
+    columns, rows = grid_shape(width, height, columns)
+    regions_by_color: Dict[str, List[Dict]] = {}
+    for region in regions:
+        regions_by_color.setdefault(region.get("color"), []).append(region)
+    by_color = {color: [region_centers(group)] for color, group in regions_by_color.items()}
+    for group in points or []:
+        by_color.setdefault(group["color"], []).append(point_centers(group))
+
+    layers = []
+    for color, parts in by_color.items():
+        centers = np.concatenate(parts)
+        counts = np.bincount(cell_indices(centers, width, height, columns, rows), minlength=columns * rows)
+        layers.append({"color": color, "count": int(len(centers)), "counts": counts.tolist()})
+    return {
+        "columns": columns,
+        "rows": rows,
+        "bounds": {"xmin": 0, "ymin": 0, "xmax": int(width), "ymax": int(height)},
+        "layers": layers,
+    }
+
+def cell_marks(regions: List[Dict], points: Optional[List[Dict]], width: int, height: int,
+               columns: int, cell: Sequence[int]) -> Tuple[List[Dict], Optional[List[Dict]], Dict]:
+    """
+    Drill-down into one cell of the grid density_grid would build: the
+    regions and points whose centers fall in cell (column, row). A cell
+    outside the grid holds no marks.
+
+    Returns:
+      (regions, points, cell), where cell is {"column", "row", "rectangular"}.
+    """
+    columns, rows = grid_shape(width, height, columns)
+    column, row = cell
+    inside = 0 <= column < columns and 0 <= row < rows
+    wanted = row * columns + column
+
+    kept_regions = []
+    if inside and regions:
+        in_cell = cell_indices(region_centers(regions), width, height, columns, rows) == wanted
+        kept_regions = [r for r, keep in zip(regions, in_cell) if keep]
+    kept_points = None
+    if points is not None:
+        kept_points = []
+        for group in points:
+            centers = point_centers(group)
+            if inside:
+                centers = centers[cell_indices(centers, width, height, columns, rows) == wanted]
+            else:
+                centers = centers[:0]
+            kept_points.append({**group, "count": int(len(centers)), "xy": np.round(centers, 1).ravel().tolist()})
+    return kept_regions, kept_points, {
+        "column": column,
+        "row": row,
+        "rectangular": cell_box(width, height, columns, rows, column, row),
+    }
@@ -0,0 +1,172 @@
+import copy
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.regions import region_boxes
+
+# A pixel box as (xmin, ymin, xmax, ymax), max exclusive.
+Box = Tuple[int, int, int, int]
+
+
+def changed_tiles(previous: np.ndarray, current: np.ndarray, tile: int, threshold: int) -> np.ndarray:
+    """
+    Which `tile` x `tile` tiles of two same-size frames differ: a boolean
+    (rows, columns) grid, True where any channel of any pixel of the tile
+    changed by more than `threshold`.
+    """
+    diff = cv2.absdiff(previous, current)
+    H, W = diff.shape[:2]
+    # Channels stay interleaved along x, so a tile spans tile * channels values.
+    flat = diff.reshape(H, -1)
+    channels = flat.shape[1] // W
+    rows, columns = -(-H // tile), -(-W // tile)
+    changed = np.zeros((rows * tile, columns * tile * channels), np.uint8)
+    cv2.threshold(flat, threshold, 1, cv2.THRESH_BINARY, dst=changed[:H, :W * channels])
+    bands = changed.reshape(rows, tile, -1).max(axis=1)
+    return bands.reshape(rows, columns, tile * channels).max(axis=2).astype(bool)
+
+def dirty_boxes(tiles: np.ndarray, tile: int, width: int, height: int) -> List[Box]:
+    """
+    The pixel boxes of the connected groups of changed tiles.
+    """
+    _, _, stats, _ = cv2.connectedComponentsWithStats(tiles.view(np.uint8), connectivity=8)
+    return [
+        (int(x) * tile, int(y) * tile, min(width, int(x + w) * tile), min(height, int(y + h) * tile))
+        for x, y, w, h, _ in stats[1:]
+    ]
+
+def region_box(region: Dict) -> Optional[Box]:
+    for box in region_boxes(region):
+        return box["xmin"], box["ymin"], box["xmax"] + 1, box["ymax"] + 1
+    return None
+
+def overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def union(a: Box, b: Box) -> Box:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+def grow(box: Box, margin: int, width: int, height: int) -> Box:
+    return max(0, box[0] - margin), max(0, box[1] - margin), min(width, box[2] + margin), min(height, box[3] + margin)
+
+def mark_crops(dirty: Sequence[Box], marks: Sequence[Box], margin: int, width: int, height: int) -> List[Box]:
+    """
+    Boxes to re-detect marks in: the dirty boxes grown by `margin` and by
+    every mark they touch, merged until no crop cuts through a mark or
+    another crop. Each previous mark then lies wholly inside one crop or
+    outside all of them, and a changed mark lies inside the crop that
+    holds its old extent and its changed pixels.
+    """
+    crops = [grow(box, margin, width, height) for box in dirty]
+    changed = True
+    while changed:
+        changed = False
+        for i, crop in enumerate(crops):
+            for mark in marks:
+                if overlaps(crop, mark) and union(crop, mark) != crop:
+                    crop = crops[i] = union(crop, mark)
+                    changed = True
+            for j in range(len(crops) - 1, i, -1):
+                if overlaps(crop, crops[j]):
+                    crop = crops[i] = union(crop, crops.pop(j))
+                    changed = True
+    return crops
+
+
+class FrameStream:
+    """
+    Incremental analysis of a stream of frames of one chart, such as
+    repeated screenshots of a live dashboard.
+
+    Each frame is diffed against the previous one tile by tile. An
+    unchanged frame gets the previous result back. When only data marks
+    changed (no other region touches a changed tile), `detect_marks` runs
+    on crops around the changed tiles and the marks found there replace
+    the ones that were inside; everything else is kept from the previous
+    result. Any other change, a new size or the first frame runs
+    `analyze` on the whole frame.
+
+    Parameters:
+      - analyze: analyze(frame, contents) runs the full analysis of a frame
+        (`contents` being its encoded bytes).
+      - mark_labels: Labels of the regions `detect_marks` finds.
+      - detect_marks: detect_marks(crop, colors) returns the mark regions of
+        a crop, for the colors of the marks seen so far; None for chart
+        types that always need the full analysis.
+      - tile: Side of the diff tiles in pixels.
+      - threshold: Largest per-channel change still taken as unchanged.
+    """
+
+    def __init__(self, analyze: Callable[[np.ndarray, bytes], Dict], mark_labels: Sequence[str] = (),
+                 detect_marks: Optional[Callable[[np.ndarray, List[str]], List[Dict]]] = None,
+                 tile: int = 32, threshold: int = 24, margin: int = 2):
+        self.analyze = analyze
+        self.mark_labels = set(mark_labels)
+        self.detect_marks = detect_marks
+        self.tile = tile
+        self.threshold = threshold
+        self.margin = margin
+        self.previous: Optional[np.ndarray] = None
+        self.result: Optional[Dict] = None
+
+    def update(self, frame: np.ndarray, contents: bytes = b"") -> Tuple[Dict, Dict]:
+        """
+        Analyzes the next frame (decoded from `contents`).
+
+        Returns:
+          (result, update) where update tells how it was obtained:
+             - "mode": "unchanged", "marks" (crops re-detected) or "full".
+             - "changed_tiles" / "tiles": How much of the frame changed.
+             - "crops": The re-detected boxes, for "marks".
+        """
+        H, W = frame.shape[:2]
+        if self.previous is None or self.previous.shape != frame.shape:
+            return self._full(frame, contents, {"mode": "full", "changed_tiles": None, "tiles": None})
+        tiles = changed_tiles(self.previous, frame, self.tile, self.threshold)
+        update = {"changed_tiles": int(tiles.sum()), "tiles": int(tiles.size)}
+        if not update["changed_tiles"]:
+            return copy.deepcopy(self.result), {"mode": "unchanged", **update}
+
+        crops = self._mark_crops(dirty_boxes(tiles, self.tile, W, H), W, H)
+        if crops is None:
+            return self._full(frame, contents, {"mode": "full", **update})
+        regions = self.result["regions"]
+        colors = sorted({region["color"] for region in regions if region.get("label") in self.mark_labels})
+        kept = [region for region in regions
+                if region.get("label") not in self.mark_labels
+                or not any(overlaps(region_box(region), crop) for crop in crops)]
+        for xmin, ymin, xmax, ymax in crops:
+            for region in self.detect_marks(frame[ymin:ymax, xmin:xmax], colors):
+                for box in region_boxes(region):
+                    box["xmin"] += xmin
+                    box["xmax"] += xmin
+                    box["ymin"] += ymin
+                    box["ymax"] += ymin
+                kept.append(region)
+        self.previous = frame
+        self.result = {**self.result, "regions": kept}
+        return copy.deepcopy(self.result), {"mode": "marks", **update, "crops": [list(crop) for crop in crops]}
+
+    def _mark_crops(self, dirty: List[Box], width: int, height: int) -> Optional[List[Box]]:
+        # The crops to re-detect, or None when the change touches anything
+        # but marks (or no crop-safe mark detector exists).
+        if self.detect_marks is None or set(self.result) != {"regions"}:
+            return None
+        marks, others = [], []
+        for region in self.result["regions"]:
+            box = region_box(region)
+            if box is not None:
+                (marks if region.get("label") in self.mark_labels else others).append(box)
+        if not marks:
+            return None
+        crops = mark_crops(dirty, marks, self.margin, width, height)
+        if any(overlaps(crop, other) for crop in crops for other in others):
+            return None
+        return crops
+
+    def _full(self, frame: np.ndarray, contents: bytes, update: Dict) -> Tuple[Dict, Dict]:
+        self.previous = frame
+        self.result = self.analyze(frame, contents)
+        return copy.deepcopy(self.result), update
@@ -0,0 +1,213 @@
+import math
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import tobii_research as tr
+except ImportError:  # The Tobii SDK is only needed with real hardware.
+    tr = None
+
+# Columns of a gaze sample: timestamp (seconds), gaze point on the display
+# area (0-1 in x and y, NaN when no eye was tracked), and validity (0/1).
+FIELDS = ("t", "x", "y", "valid")
+
+
+class GazeRing:
+    """
+    The most recent `capacity` gaze samples, in one preallocated array.
+
+    `append` only writes four numbers into the next row (no per-sample
+    allocation), so it keeps up with trackers at 600 Hz and more.
+    Samples are numbered from 0 in arrival order; readers remember the
+    number they read up to and ask for what came after it.
+    """
+
+    def __init__(self, capacity: int = 65536):
+        self.capacity = capacity
+        self._samples = np.full((capacity, len(FIELDS)), np.nan)
+        self._written = 0
+        self._lock = threading.Lock()
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    def append(self, t: float, x: float, y: float, valid: bool) -> None:
+        with self._lock:
+            row = self._written % self.capacity
+            samples = self._samples
+            samples[row, 0] = t
+            samples[row, 1] = x
+            samples[row, 2] = y
+            samples[row, 3] = valid
+            self._written += 1
+
+    def read_since(self, position: int) -> Tuple[np.ndarray, int, int]:
+        """
+        The samples appended after sample number `position`.
+
+        Returns:
+          (samples, new position, dropped): an (n, 4) array of copies, the
+          position to pass next time, and how many samples were
+          overwritten before this reader got to them.
+        """
+        with self._lock:
+            end = self._written
+            start = max(position, end - self.capacity)
+            first, last = start % self.capacity, end % self.capacity
+            if end - start == 0:
+                samples = self._samples[:0].copy()
+            elif first < last:
+                samples = self._samples[first:last].copy()
+            else:
+                samples = np.concatenate([self._samples[first:], self._samples[:last]])
+        return samples, end, start - position
+
+
+def tobii_sample(gaze_data: Dict) -> Tuple[float, float, float, bool]:
+    """
+    A ring row from a Tobii gaze_data dictionary: the mean of the valid
+    eyes' display-area gaze points, at the system timestamp.
+    """
+    points = [gaze_data[f"{eye}_gaze_point_on_display_area"] for eye in ("left", "right")
+              if gaze_data[f"{eye}_gaze_point_validity"]]
+    t = gaze_data["system_time_stamp"] / 1e6
+    if not points:
+        return t, math.nan, math.nan, False
+    return t, sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points), True
+
+
+class TobiiSource:
+    """
+    Streams the first connected Tobii eye tracker into a ring.
+    """
+
+    name = "tobii"
+
+    def __init__(self, ring: GazeRing):
+        if tr is None:
+            raise RuntimeError("tobii_research is not installed")
+        devices = tr.find_all_eyetrackers()
+        if not devices:
+            raise RuntimeError("No eye tracker connected")
+        self.tracker = devices[0]
+        self.ring = ring
+        self.rate = self.tracker.get_gaze_output_frequency()
+
+    def _on_gaze(self, gaze_data: Dict) -> None:
+        self.ring.append(*tobii_sample(gaze_data))
+
+    def start(self) -> None:
+        self.tracker.subscribe_to(tr.EYETRACKER_GAZE_DATA, self._on_gaze, as_dictionary=True)
+
+    def stop(self) -> None:
+        self.tracker.unsubscribe_from(tr.EYETRACKER_GAZE_DATA, self._on_gaze)
+
+    def describe(self) -> Dict:
+        return {"device_name": self.tracker.device_name, "serial_number": self.tracker.serial_number}
+
+
+class SimulatedSource:
+    """
+    A stand-in tracker for running without hardware: from a background
+    thread, `rate` samples per second of fixations (200-600 ms of small
+    jitter around a point) joined by saccades of a few samples, with an
+    occasional blink of invalid samples.
+    """
+
+    name = "simulated"
+
+    def __init__(self, ring: GazeRing, rate: float = 120, seed: Optional[int] = None):
+        self.ring = ring
+        self.rate = rate
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gaze-simulator", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def describe(self) -> Dict:
+        return {"device_name": "simulated", "serial_number": None}
+
+    def _run(self) -> None:
+        rng = self._random
+        interval = 1.0 / self.rate
+        x, y = 0.5, 0.5
+        target, remaining, saccade = (x, y), 0, 0
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            if remaining == 0:
+                target = (rng.uniform(0.05, 0.95), rng.uniform(0.05, 0.95))
+                remaining = int(rng.uniform(0.2, 0.6) * self.rate)
+                saccade = max(1, int(0.03 * self.rate))
+            if saccade:
+                # Move a share of the way to the next fixation per sample.
+                x += (target[0] - x) / saccade
+                y += (target[1] - y) / saccade
+                saccade -= 1
+            else:
+                remaining -= 1
+            if rng.random() < 0.002:
+                self.ring.append(next_time, math.nan, math.nan, False)
+            else:
+                self.ring.append(next_time, x + rng.gauss(0, 0.003), y + rng.gauss(0, 0.003), True)
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+
+
+SOURCES = {"simulated": SimulatedSource, "tobii": TobiiSource}
+
+
+class GazeHub:
+    """
+    The gaze ingest of the server: one ring of samples, filled by at most
+    one running source (a Tobii tracker or the simulator) and read by any
+    number of websocket subscribers and gaze sessions (by id).
+    """
+
+    def __init__(self, capacity: int = 65536):
+        self.ring = GazeRing(capacity)
+        self.source = None
+        self.sessions: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def start(self, source: str = "simulated", rate: float = 120) -> Dict:
+        with self._lock:
+            self._stop_source()
+            self.source = SimulatedSource(self.ring, rate) if source == "simulated" else SOURCES[source](self.ring)
+            self.source.start()
+        return self.status()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stop_source()
+
+    def _stop_source(self) -> None:
+        if self.source is not None:
+            self.source.stop()
+            self.source = None
+
+    def status(self) -> Dict:
+        source = self.source
+        return {
+            "tracking": source is not None,
+            "source": source.name if source is not None else None,
+            "rate": source.rate if source is not None else None,
+            "samples": self.ring.written,
+            **(source.describe() if source is not None else {}),
+        }
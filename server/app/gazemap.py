@@ -0,0 +1,245 @@
+import math
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.gaze import GazeRing
+from app.regions import region_boxes
+
+# Cells of the region grid per side, at most (fewer for few regions).
+MAX_GRID = 64
+
+
+class RegionIndex:
+    """
+    A uniform-grid index of region boxes for hit-testing many points at
+    once.
+
+    Every region is listed in the grid cells its box covers, in one flat
+    array with per-cell offsets, so a batch of points finds its candidate
+    regions with array operations only. A point inside several regions
+    (e.g. a legend item inside the legend box) hits the smallest.
+    """
+
+    def __init__(self, regions: Sequence[Dict], width: int, height: int):
+        self.width, self.height = width, height
+        boxes, ids = [], []
+        for index, region in enumerate(regions):
+            for box in region_boxes(region):
+                boxes.append((box["xmin"], box["ymin"], box["xmax"], box["ymax"]))
+                ids.append(index)
+                break
+        self.boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.areas = (self.boxes[:, 2] - self.boxes[:, 0]) * (self.boxes[:, 3] - self.boxes[:, 1])
+
+        self.grid = max(1, min(MAX_GRID, int(math.sqrt(len(boxes))) * 2))
+        self.cell_w, self.cell_h = max(width, 1) / self.grid, max(height, 1) / self.grid
+        x0, y0, x1, y1 = (self._cell(self.boxes[:, i], size)
+                          for i, size in enumerate((self.cell_w, self.cell_h) * 2))
+        cells, members = [], []
+        for box, (cx0, cy0, cx1, cy1) in enumerate(zip(x0, y0, x1, y1)):
+            covered = (np.arange(cy0, cy1 + 1)[:, None] * self.grid + np.arange(cx0, cx1 + 1)).ravel()
+            cells.append(covered)
+            members.append(np.full(covered.size, box))
+        cells = np.concatenate(cells) if cells else np.zeros(0, np.int64)
+        members = np.concatenate(members) if members else np.zeros(0, np.int64)
+        order = np.argsort(cells, kind="stable")
+        self.cell_members = members[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.grid * self.grid + 1))
+
+    def _cell(self, values: np.ndarray, size: float) -> np.ndarray:
+        return np.clip((values // size).astype(np.int64), 0, self.grid - 1)
+
+    def hit(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        The region (index into the regions given) under each point, or -1.
+        Points are in image pixels; NaN points hit nothing.
+        """
+        hits = np.full(len(xs), -1, dtype=np.int64)
+        inside = np.isfinite(xs) & np.isfinite(ys) & (xs >= 0) & (ys >= 0) & (xs <= self.width) & (ys <= self.height)
+        points = np.flatnonzero(inside)
+        if not points.size or not self.ids.size:
+            return hits
+        cell = self._cell(ys[points], self.cell_h) * self.grid + self._cell(xs[points], self.cell_w)
+        starts, counts = self.cell_start[cell], self.cell_start[cell + 1] - self.cell_start[cell]
+        # One row per (point, candidate box) pair.
+        pair_point = np.repeat(np.arange(points.size), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_box = self.cell_members[np.repeat(starts, counts) + offsets]
+        px, py = xs[points][pair_point], ys[points][pair_point]
+        box = self.boxes[pair_box]
+        contained = (px >= box[:, 0]) & (px <= box[:, 2]) & (py >= box[:, 1]) & (py <= box[:, 3])
+        pair_point, pair_box = pair_point[contained], pair_box[contained]
+        # Smallest box per point: sort by (point, area) and keep each point's first.
+        order = np.lexsort((self.areas[pair_box], pair_point))
+        pair_point, pair_box = pair_point[order], pair_box[order]
+        first = np.ones(pair_point.size, bool)
+        first[1:] = pair_point[1:] != pair_point[:-1]
+        hits[points[pair_point[first]]] = self.ids[pair_box[first]]
+        return hits
+
+
+class GazeSession:
+    """
+    Where gaze landed on one analyzed chart: reads new samples from a
+    GazeRing, detects fixations with a velocity threshold (I-VT) and
+    accumulates dwell time per region, incrementally, batch by batch.
+
+    Parameters:
+      - regions: The "regions" of an /analyze/* result.
+      - width, height: Size of the analyzed image in pixels.
+      - viewport: Where the image is shown, as (left, top, right, bottom)
+        in display-area coordinates (0-1); the whole display by default.
+      - velocity: Largest gaze speed of a fixation, in display widths per second.
+      - min_duration: Shortest fixation in seconds.
+      - window: Time over which the gaze speed is measured, in seconds.
+      - max_gap: Longest break (noise, a blink) between two slow stretches
+        that still continue one fixation, in seconds.
+      - merge_distance: Farthest apart, in display widths, two slow stretches
+        of one fixation are.
+    """
+
+    def __init__(self, ring: GazeRing, regions: Sequence[Dict], width: int, height: int,
+                 viewport: Sequence[float] = (0.0, 0.0, 1.0, 1.0), velocity: float = 0.5,
+                 min_duration: float = 0.06, window: float = 0.02, max_gap: float = 0.075,
+                 merge_distance: float = 0.015):
+        self.ring = ring
+        self.regions = list(regions)
+        self.index = RegionIndex(self.regions, width, height)
+        self.viewport = tuple(viewport)
+        self.velocity = velocity
+        self.min_duration = min_duration
+        self.window = window
+        self.max_gap = max_gap
+        self.merge_distance = merge_distance
+        self.position = ring.written
+        self.dropped = 0
+        count = len(self.regions)
+        self.dwell = np.zeros(count)
+        self.fixation_counts = np.zeros(count, dtype=np.int64)
+        self.gaze_seconds = np.zeros(count)
+        self.fixation_total = 0
+        # The last `window` seconds of samples, and the fixation still open.
+        self._tail: Optional[np.ndarray] = None
+        self._open: Optional[List[float]] = None  # [start, end, sum x, sum y, count]
+        self._lock = threading.Lock()
+
+    def to_image(self, xs: np.ndarray, ys: np.ndarray):
+        left, top, right, bottom = self.viewport
+        return ((xs - left) / (right - left) * self.index.width,
+                (ys - top) / (bottom - top) * self.index.height)
+
+    def process(self) -> List[Dict]:
+        """
+        Consumes the samples that arrived since the last call.
+
+        Returns:
+          The fixations completed meanwhile, each {"start", "end", "x", "y",
+          "region"} with x, y in image pixels and region an index into
+          `regions` (or None).
+        """
+        with self._lock:
+            samples, self.position, dropped = self.ring.read_since(self.position)
+            self.dropped += dropped
+            if not len(samples):
+                return []
+            # Velocity over `window` seconds rather than between adjacent
+            # samples, which tracker noise dominates at high rates. The
+            # samples of the last window of the previous batch lead in.
+            history = samples if self._tail is None else np.vstack([self._tail, samples])
+            lead = len(history) - len(samples)
+            th, xh, yh, vh = history.T
+            current = np.arange(lead, len(history))
+            back = np.minimum(np.searchsorted(th, th[lead:] - self.window), current - 1)
+            has_back = back >= 0
+            back = np.maximum(back, 0)
+            t, x, y, valid = samples.T
+            valid = valid > 0
+            dt = np.maximum(t - th[back], 1e-6)
+            speed = np.hypot(x - xh[back], y - yh[back]) / dt
+            slow = valid & has_back & (vh[back] > 0) & (speed <= self.velocity)
+            self._tail = history[th >= th[-1] - self.window]
+            # Each sample stands for the time since the one before it.
+            dt = np.diff(th[lead - 1:]) if lead else np.r_[0.0, np.diff(t)]
+
+            # Gaze time per region: each valid sample counts for its interval
+            # (capped, so a gap in the data is not credited to one region).
+            ix, iy = self.to_image(x, y)
+            hits = self.index.hit(ix, iy)
+            counted = valid & (hits >= 0)
+            self.gaze_seconds += np.bincount(hits[counted], weights=np.minimum(dt[counted], 0.1),
+                                             minlength=len(self.regions))
+
+            completed = self._fixations(t, x, y, slow)
+            if completed:
+                cx, cy = self.to_image(np.array([f[2] for f in completed]), np.array([f[3] for f in completed]))
+                regions = self.index.hit(cx, cy)
+                hit = regions >= 0
+                np.add.at(self.dwell, regions[hit], [end - start for (start, end, _, _), h in zip(completed, hit) if h])
+                np.add.at(self.fixation_counts, regions[hit], 1)
+                self.fixation_total += len(completed)
+            return [
+                {"start": start, "end": end, "x": round(float(fx), 1), "y": round(float(fy), 1),
+                 "region": int(region) if region >= 0 else None}
+                for (start, end, _, _), fx, fy, region in zip(completed, cx, cy, regions)
+            ] if completed else []
+
+    def _fixations(self, t: np.ndarray, x: np.ndarray, y: np.ndarray, slow: np.ndarray) -> List[tuple]:
+        # Runs of slow samples are fixation candidates; a run shortly after
+        # and close to the open fixation continues it. The open fixation
+        # stays open across batches until the gaze has been away too long.
+        runs = np.flatnonzero(np.diff(np.r_[0, slow.astype(np.int8), 0])).reshape(-1, 2)
+        completed = []
+        for run_start, run_end in runs:
+            sx, sy, n = x[run_start:run_end].sum(), y[run_start:run_end].sum(), run_end - run_start
+            if self._open is not None and not self._continues(t[run_start], sx / n, sy / n):
+                self._close(completed)
+            if self._open is not None:
+                self._open[1] = t[run_end - 1]
+                self._open[2] += sx
+                self._open[3] += sy
+                self._open[4] += n
+            else:
+                self._open = [t[run_start], t[run_end - 1], sx, sy, n]
+        if self._open is not None and t[-1] - self._open[1] > self.max_gap:
+            self._close(completed)
+        return completed
+
+    def _continues(self, start: float, x: float, y: float) -> bool:
+        _, end, sx, sy, n = self._open
+        return start - end <= self.max_gap and math.hypot(x - sx / n, y - sy / n) <= self.merge_distance
+
+    def _close(self, completed: List[tuple]) -> None:
+        if self._open is None:
+            return
+        start, end, sx, sy, n = self._open
+        self._open = None
+        if end - start >= self.min_duration:
+            completed.append((float(start), float(end), sx / n, sy / n))
+
+    def summary(self, limit: Optional[int] = None) -> Dict:
+        """
+        Dwell per region so far, most looked-at first: only regions that
+        were looked at, each with its index, label, fixation dwell time,
+        fixation count and total gaze time.
+        """
+        with self._lock:
+            looked = np.flatnonzero((self.dwell > 0) | (self.gaze_seconds > 0))
+            looked = looked[np.argsort(-self.dwell[looked] - 1e-3 * self.gaze_seconds[looked], kind="stable")]
+            return {
+                "samples": self.position,
+                "dropped": self.dropped,
+                "fixations": self.fixation_total,
+                "regions": [
+                    {
+                        "index": int(i),
+                        "label": self.regions[i].get("label"),
+                        "dwell_seconds": round(float(self.dwell[i]), 3),
+                        "fixations": int(self.fixation_counts[i]),
+                        "gaze_seconds": round(float(self.gaze_seconds[i]), 3),
+                    }
+                    for i in looked[:limit]
+                ],
+            }
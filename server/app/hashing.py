@@ -0,0 +1,57 @@
+import functools
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+from app import config, ocr
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+
+
+def content_hash(contents: bytes) -> str:
+    """
+    Returns the hex SHA-256 of an uploaded file's bytes.
+    """
+    return hashlib.sha256(contents).hexdigest()
+
+def analysis_key(chart_type: str, contents: bytes, debug: bool = False, options: Optional[Dict] = None) -> str:
+    """
+    Identifies an analysis by what determines its result: the chart type,
+    whether debug output was requested, any analyzer options, and the
+    uploaded bytes.
+    """
+    key = f"{chart_type}:{int(debug)}:{content_hash(contents)}"
+    if options:
+        key += ":" + json.dumps(options, sort_keys=True, separators=(",", ":"))
+    return key
+
+def output_settings() -> Dict:
+    """
+    The settings that change what an analysis returns for the same image
+    and sources: reduced decodes under the memory budget, results reused
+    from near-duplicates and cached layouts, and recognized text.
+    """
+    return {
+        "memory_budget_mb": config.MEMORY_BUDGET_MB,
+        "memory_budget_mode": config.MEMORY_BUDGET_MODE,
+        "near_duplicate_difference": config.NEAR_DUPLICATE_DIFFERENCE if config.NEAR_DUPLICATE_ENTRIES > 0 else None,
+        "layout_cache": config.LAYOUT_CACHE_ENTRIES > 0,
+        "ocr": config.OCR and ocr.available(),
+    }
+
+@functools.lru_cache(maxsize=None)
+def detector_version() -> str:
+    """
+    A short hash of the detector sources (main.py, the openCV*.py modules
+    and the app package) and of the output_settings in effect. Any change
+    to them yields a new version, so results stored under an older version
+    (or built with other settings) are never mistaken for current ones.
+    """
+    digest = hashlib.sha256()
+    sources = sorted(SERVER_DIR.glob("openCV*.py")) + sorted(SERVER_DIR.glob("app/*.py")) + [SERVER_DIR / "main.py"]
+    for path in sources:
+        digest.update(str(path.relative_to(SERVER_DIR)).encode())
+        digest.update(path.read_bytes())
+    digest.update(json.dumps(output_settings(), sort_keys=True).encode())
+    return digest.hexdigest()[:12]
@@ -0,0 +1,303 @@
+import asyncio
+import contextlib
+import functools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app import metrics
+from app.hashing import analysis_key
+
+FINAL_STATUSES = ("done", "failed")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class MemoryJobStore:
+    """
+    Keeps jobs in a dict; they are lost when the process exits.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def find_by_key(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            matches = [j for j in self._jobs.values() if j["key"] == key and j["status"] != "failed"]
+            return dict(max(matches, key=lambda j: j["created_at"])) if matches else None
+
+    def pending(self) -> List[Dict]:
+        with self._lock:
+            jobs = [dict(j) for j in self._jobs.values() if j["status"] not in FINAL_STATUSES]
+        return sorted(jobs, key=lambda j: j["created_at"])
+
+    def delete_finished_before(self, cutoff: float) -> int:
+        with self._lock:
+            expired = [
+                job_id for job_id, j in self._jobs.items()
+                if j["status"] in FINAL_STATUSES and j["updated_at"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore:
+    """
+    Persists jobs (including the uploaded bytes of unfinished jobs) in a
+    local SQLite file, so queued work and finished results survive restarts.
+    """
+
+    COLUMNS = ("id", "key", "chart_type", "status", "debug", "created_at",
+               "updated_at", "input", "result", "error")
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, key TEXT, chart_type TEXT, status TEXT,"
+                " debug INTEGER, created_at REAL, updated_at REAL,"
+                " input BLOB, result TEXT, error TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+
+    def _row_to_job(self, row) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job["debug"] = bool(job["debug"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _select(self, where: str, params: Iterable) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE {where}", tuple(params)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def create(self, job: Dict) -> None:
+        row = dict(job, debug=int(job["debug"]), result=None)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                tuple(row.get(c) for c in self.COLUMNS),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        jobs = self._select("id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def update(self, job_id: str, **fields) -> None:
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def find_by_key(self, key: str) -> Optional[Dict]:
+        jobs = self._select("key = ? AND status != 'failed' ORDER BY created_at DESC LIMIT 1", (key,))
+        return jobs[0] if jobs else None
+
+    def pending(self) -> List[Dict]:
+        return self._select("status NOT IN ('done', 'failed') ORDER BY created_at", ())
+
+    def delete_finished_before(self, cutoff: float) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+            )
+        return cursor.rowcount
+
+
+def open_store(spec: str):
+    """
+    Opens a job store from a spec string: "memory" or "sqlite:<path>".
+    """
+    if spec == "memory":
+        return MemoryJobStore()
+    if spec.startswith("sqlite:"):
+        return SQLiteJobStore(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown job store: {spec}")
+
+
+def public_view(job: Dict) -> Dict:
+    """
+    The fields of a job returned to clients (never the uploaded bytes).
+    """
+    view = {
+        "id": job["id"],
+        "chart_type": job["chart_type"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] == "done":
+        view["result"] = job["result"]
+    if job["status"] == "failed":
+        view["error"] = job["error"]
+    return view
+
+
+class JobQueue:
+    """
+    Runs analyses in the background so they outlive the HTTP request that
+    submitted them.
+
+    Jobs are processed by `workers` asyncio tasks, each running `run` in a
+    worker thread, so at most `workers` analyses execute at once. Given a
+    `scheduler`, each job also waits for a bulk-class slot from it, behind
+    any queued interactive request. Finished
+    jobs are kept for `retention_seconds`; resubmitting the same upload for
+    the same chart type within that window returns the existing job instead
+    of computing it again.
+
+    Store calls run on one thread of their own, in order, so SQLite writes
+    of uploads and results never block the event loop; watchers are
+    notified from the loop.
+    """
+
+    def __init__(self, store, run: Callable[[str, bytes, bool], Dict], chart_types: Iterable[str],
+                 workers: int = 1, retention_seconds: float = 3600, max_queued: int = 100,
+                 scheduler=None):
+        self.store = store
+        self.chart_types = set(chart_types)
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self.max_queued = max_queued
+        self._run = run
+        self._scheduler = scheduler
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._watchers: Dict[str, List[asyncio.Queue]] = {}
+        self._store_thread = ThreadPoolExecutor(1, thread_name_prefix="job-store")
+        self._submit_lock = asyncio.Lock()
+
+    async def _store(self, method: str, *args, **kwargs):
+        # Runs self.store.<method>(*args, **kwargs) on the store thread.
+        call = functools.partial(getattr(self.store, method), *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._store_thread, call)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        # Jobs interrupted by a restart go back on the queue.
+        for job in await self._store("pending"):
+            await self._store("update", job["id"], status="queued")
+            self._queue.put_nowait(job["id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._store_thread.shutdown(wait=True)
+
+    async def submit(self, chart_type: str, contents: bytes, debug: bool = False) -> Dict:
+        if chart_type not in self.chart_types:
+            raise ValueError(f"Unknown chart type: {chart_type}")
+        key = analysis_key(chart_type, contents, debug)
+        # Held across the lookup and the insert, so two identical uploads
+        # submitted together still share one job.
+        async with self._submit_lock:
+            await self._store("delete_finished_before", time.time() - self.retention_seconds)
+            existing = await self._store("find_by_key", key)
+            if existing is not None:
+                metrics.increment("jobs_reused", chart_type=chart_type)
+                return existing
+            if self._queue.qsize() >= self.max_queued:
+                raise JobQueueFull(f"{self._queue.qsize()} jobs are already queued")
+
+            now = time.time()
+            job = {
+                "id": uuid.uuid4().hex,
+                "key": key,
+                "chart_type": chart_type,
+                "status": "queued",
+                "debug": debug,
+                "created_at": now,
+                "updated_at": now,
+                "input": contents,
+                "result": None,
+                "error": None,
+            }
+            await self._store("create", job)
+        self._queue.put_nowait(job["id"])
+        metrics.increment("jobs_submitted", chart_type=chart_type)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self._store("get", job_id)
+
+    def watch(self, job_id: str) -> asyncio.Queue:
+        """
+        Returns a queue that receives the public view of the job on every
+        status change. Call `unwatch` when done.
+        """
+        updates: asyncio.Queue = asyncio.Queue()
+        self._watchers.setdefault(job_id, []).append(updates)
+        return updates
+
+    def unwatch(self, job_id: str, updates: asyncio.Queue) -> None:
+        watchers = self._watchers.get(job_id, [])
+        if updates in watchers:
+            watchers.remove(updates)
+        if not watchers:
+            self._watchers.pop(job_id, None)
+
+    async def _set(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        await self._store("update", job_id, **fields)
+        job = await self._store("get", job_id)
+        for updates in self._watchers.get(job_id, []):
+            updates.put_nowait(public_view(job))
+
+    def _slot(self):
+        if self._scheduler is None:
+            return contextlib.nullcontext()
+        return self._scheduler.slot("bulk", "jobs")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = await self._store("get", job_id)
+            if job is None or job["status"] in FINAL_STATUSES:
+                continue
+            try:
+                async with self._slot():
+                    await self._set(job_id, status="running")
+                    metrics.observe("job_queue_wait_seconds", time.time() - job["created_at"],
+                                    chart_type=job["chart_type"])
+                    result = await asyncio.to_thread(self._run, job["chart_type"], job["input"], job["debug"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                error = getattr(exc, "detail", None) or str(exc) or type(exc).__name__
+                await self._set(job_id, status="failed", error=error, input=None)
+                metrics.increment("jobs_failed", chart_type=job["chart_type"])
+            else:
+                await self._set(job_id, status="done", result=result, input=None)
+                metrics.increment("jobs_completed", chart_type=job["chart_type"])
@@ -0,0 +1,97 @@
+import copy
+import functools
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app import cancellation, config, metrics
+
+# Pixels with no channel above this count as text (and axes); colored
+# data marks have at least one brighter channel and are left out.
+TEXT_MAX_LEVEL = 150
+
+
+def layout_fingerprint(image: np.ndarray) -> Tuple[int, int, str]:
+    """
+    The structural signature of a chart image: its size plus a hash of
+    its mask of dark, text-like pixels. Panels rendered from one template
+    with different data share it, since their titles, ticks and legends
+    are drawn identically; any different label or layout changes it.
+    """
+    H, W = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    text = cv2.inRange(image, (0,) * channels, (TEXT_MAX_LEVEL,) * channels)
+    return H, W, hashlib.blake2b(np.packbits(text), digest_size=16).hexdigest()
+
+
+class LayoutCache:
+    """
+    Results of the layout detectors (title, axes, legends), keyed by
+    detector and `layout_fingerprint`, for at most `max_entries` layouts
+    (least recently used evicted first).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def fingerprint(self, image: np.ndarray) -> Tuple[int, int, str]:
+        # Several layout detectors run on the same image of a request;
+        # fingerprint it once.
+        last = getattr(self._local, "last", None)
+        if last is not None and last[0]() is image:
+            return last[1]
+        key = layout_fingerprint(image)
+        self._local.last = (weakref.ref(image), key)
+        return key
+
+    def get(self, key: Hashable) -> Optional[object]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(result)
+
+    def put(self, key: Hashable, result: object) -> None:
+        with self._lock:
+            self._entries[key] = copy.deepcopy(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+layout_cache = LayoutCache(config.LAYOUT_CACHE_ENTRIES)
+
+
+def layout_cached(fn: Callable) -> Callable:
+    """
+    Serves a layout detector `fn(image)` from `layout_cache`: a chart
+    whose layout fingerprint was seen before gets that chart's regions
+    without running the detector.
+    """
+    @functools.wraps(fn)
+    def wrapper(image: np.ndarray):
+        if layout_cache.max_entries <= 0:
+            return fn(image)
+        key = (fn.__name__, layout_cache.fingerprint(image))
+        result = layout_cache.get(key)
+        metrics.increment("layout_cache_hits" if result is not None else "layout_cache_misses",
+                          detector=fn.__name__)
+        if result is None:
+            result = fn(image)
+            # A detector cut short by the analysis deadline saw only part of the layout.
+            if not cancellation.truncated():
+                layout_cache.put(key, result)
+        return result
+    return wrapper
@@ -0,0 +1,214 @@
+import io
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from app import cancellation, config, metrics
+
+# Only image headers are read through PIL; oversized images are handled by
+# the memory budget rather than PIL's decompression-bomb guard.
+Image.MAX_IMAGE_PIXELS = None
+
+# Peak bytes allocated per decoded pixel, by chart type. Traced peaks on
+# the study images run at 5-8 bytes/pixel, but tracemalloc only sees
+# numpy-backed arrays, so the defaults leave headroom for OpenCV's internal
+# temporaries. Observed peaks from traced requests can only raise them
+# (see `record_observed_peak`).
+DEFAULT_BYTES_PER_PIXEL = 16
+BYTES_PER_PIXEL = {
+    "line_chart": 20,
+    "area_chart": 20,
+    "pie_chart": 20,
+}
+
+# Reduction factors supported natively by cv2.imdecode.
+DECODE_REDUCTIONS = (1, 2, 4, 8)
+
+_observed_lock = threading.Lock()
+_observed_bytes_per_pixel: Dict[str, float] = {}
+
+_current_profile: ContextVar[Optional["MemoryProfile"]] = ContextVar("memory_profile", default=None)
+
+# tracemalloc is process-wide: one traced request at a time, and a trace
+# that overlapped any other analysis is marked concurrent.
+_trace_lock = threading.Lock()
+_requests_lock = threading.Lock()
+_active_requests = 0
+_tracing: Optional["MemoryProfile"] = None
+
+
+class MemoryBudgetExceeded(Exception):
+    def __init__(self, estimated_bytes: int, budget_bytes: int):
+        super().__init__(
+            f"Estimated peak memory {estimated_bytes // 2**20} MB exceeds the "
+            f"per-request budget of {budget_bytes // 2**20} MB"
+        )
+        self.estimated_bytes = estimated_bytes
+        self.budget_bytes = budget_bytes
+
+
+class MemoryProfile:
+    """
+    Collects peak traced allocations for the named stages of one request.
+
+    Stages may nest; a parent stage's peak always includes its children.
+    Peaks are measured relative to the traced memory in use when the stage
+    started, so they report what the stage itself allocated. tracemalloc
+    sees every thread, so `concurrent` says whether other analyses ran
+    during the trace (and inflated its numbers).
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, int] = {}
+        self.peak_bytes = 0
+        self.concurrent = False
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        # Absolute peaks seen by each open stage, innermost last.
+        self._open: List[int] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._open:
+            self._open[-1] = max(self._open[-1], peak)
+        tracemalloc.reset_peak()
+        self._open.append(current)
+        try:
+            yield
+        finally:
+            stage_peak = max(self._open.pop(), tracemalloc.get_traced_memory()[1])
+            self.stages[name] = max(self.stages.get(name, 0), stage_peak - current)
+            if self._open:
+                self._open[-1] = max(self._open[-1], stage_peak)
+            self.peak_bytes = max(self.peak_bytes, stage_peak - self._baseline)
+
+    def as_dict(self) -> Dict:
+        return {
+            "peak_bytes": self.peak_bytes,
+            "stages": dict(self.stages),
+            "concurrent": self.concurrent,
+        }
+
+
+@contextmanager
+def profile_request(enabled: bool, required: bool = False):
+    """
+    Traces allocations for the duration of the block when `enabled`.
+    Yields the MemoryProfile (or None when tracing is off).
+
+    Every analysis request passes through here, traced or not, so a trace
+    knows whether other requests overlapped it. Only one request is traced
+    at a time: a `required` trace (a debug request) waits for the running
+    one to finish, any other is skipped while one runs.
+    """
+    global _active_requests, _tracing
+    traced = enabled and _trace_lock.acquire(blocking=required)
+    with _requests_lock:
+        _active_requests += 1
+        if _tracing is not None:
+            _tracing.concurrent = True
+    try:
+        if not traced:
+            yield None
+            return
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        profile = MemoryProfile()
+        with _requests_lock:
+            profile.concurrent = _active_requests > 1
+            _tracing = profile
+        token = _current_profile.set(profile)
+        try:
+            yield profile
+        finally:
+            _current_profile.reset(token)
+            with _requests_lock:
+                _tracing = None
+            if started:
+                tracemalloc.stop()
+    finally:
+        with _requests_lock:
+            _active_requests -= 1
+        if traced:
+            _trace_lock.release()
+
+@contextmanager
+def stage(name: str):
+    """
+    Marks a pipeline stage for the active request profile, if any. An
+    abandoned analysis stops here (AnalysisCancelled) before the stage runs.
+    """
+    cancellation.check()
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+def image_size(contents: bytes) -> Optional[tuple]:
+    """
+    Reads (width, height) from the encoded image header without decoding pixels.
+    """
+    try:
+        with Image.open(io.BytesIO(contents)) as img:
+            return img.size
+    except Exception:
+        return None
+
+def bytes_per_pixel(chart_type: str) -> float:
+    with _observed_lock:
+        observed = _observed_bytes_per_pixel.get(chart_type, 0)
+    return max(BYTES_PER_PIXEL.get(chart_type, DEFAULT_BYTES_PER_PIXEL), observed)
+
+def estimate_peak_bytes(chart_type: str, width: int, height: int) -> int:
+    return int(width * height * bytes_per_pixel(chart_type))
+
+def budget_bytes() -> int:
+    return config.MEMORY_BUDGET_MB * 2**20
+
+def plan_decode_reduction(chart_type: str, width: int, height: int) -> int:
+    """
+    Picks the smallest decode reduction (1, 2, 4 or 8) that keeps the
+    estimated peak within the memory budget.
+
+    Raises MemoryBudgetExceeded when no reduction fits, or when the budget
+    mode is "reject" and the full-size image does not fit.
+    """
+    budget = budget_bytes()
+    estimate = estimate_peak_bytes(chart_type, width, height)
+    if budget <= 0 or estimate <= budget:
+        return 1
+    if config.MEMORY_BUDGET_MODE == "reject":
+        raise MemoryBudgetExceeded(estimate, budget)
+    for reduction in DECODE_REDUCTIONS[1:]:
+        if estimate // (reduction * reduction) <= budget:
+            return reduction
+    raise MemoryBudgetExceeded(estimate, budget)
+
+def record_observed_peak(chart_type: str, profile: MemoryProfile, pixels: int) -> None:
+    """
+    Publishes a traced request's stage peaks as metrics and folds its
+    bytes-per-pixel ratio into future estimates for the chart type. A
+    trace that overlapped other analyses counted their allocations too,
+    so it is only counted, never learned from.
+    """
+    if profile.concurrent:
+        metrics.increment("analysis_trace_concurrent", chart_type=chart_type)
+        return
+    metrics.observe("analysis_peak_bytes", profile.peak_bytes, chart_type=chart_type)
+    for name, peak in profile.stages.items():
+        metrics.observe("analysis_stage_peak_bytes", peak, chart_type=chart_type, stage=name)
+    if pixels > 0:
+        ratio = profile.peak_bytes / pixels
+        metrics.observe("analysis_bytes_per_pixel", ratio, chart_type=chart_type)
+        with _observed_lock:
+            _observed_bytes_per_pixel[chart_type] = max(
+                _observed_bytes_per_pixel.get(chart_type, 0), ratio
+            )
@@ -0,0 +1,50 @@
+import threading
+from typing import Dict, Tuple
+
+# In-process metrics registry. Each series is keyed by metric name plus
+# its sorted label pairs and keeps a running count/sum/max/last summary.
+
+_lock = threading.Lock()
+_series: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, float]] = {}
+
+
+def _key(name: str, labels: Dict[str, object]):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Records one observation of `value` for the metric `name`.
+    """
+    key = _key(name, labels)
+    with _lock:
+        summary = _series.get(key)
+        if summary is None:
+            summary = _series[key] = {"count": 0, "sum": 0.0, "max": value, "last": value}
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+        summary["last"] = value
+
+def increment(name: str, amount: float = 1, **labels) -> None:
+    """
+    Increments the counter `name` by `amount`.
+    """
+    key = _key(name, labels)
+    with _lock:
+        summary = _series.setdefault(key, {"count": 0, "sum": 0.0, "max": 0, "last": 0})
+        summary["count"] += 1
+        summary["sum"] += amount
+        summary["last"] = summary["sum"]
+        summary["max"] = summary["sum"]
+
+def snapshot() -> Dict[str, list]:
+    """
+    Returns all recorded series grouped by metric name.
+    """
+    result: Dict[str, list] = {}
+    with _lock:
+        for (name, labels), summary in sorted(_series.items()):
+            entry = dict(labels)
+            entry.update(summary)
+            result.setdefault(name, []).append(entry)
+    return result
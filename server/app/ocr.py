@@ -0,0 +1,185 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app import config, metrics
+from app.regions import region_boxes
+
+try:
+    import pytesseract
+except ImportError:  # Text extraction is optional.
+    pytesseract = None
+
+# Labels of the regions whose text is read.
+TEXT_LABELS = ("title", "x_axis_tick", "treemap-label")
+# Crops are scaled up to at least this height (tesseract reads ~30 px text best).
+MIN_HEIGHT = 32
+# Blank pixels around and between the crops packed into one sheet.
+GAP = 16
+
+
+def crop_key(crop: np.ndarray) -> str:
+    return hashlib.blake2b(crop.tobytes() + repr(crop.shape).encode(), digest_size=16).hexdigest()
+
+def text_crop(image: np.ndarray, box: Dict, pad: int = 2) -> Optional[np.ndarray]:
+    H, W = image.shape[:2]
+    xmin, ymin = max(0, int(box["xmin"]) - pad), max(0, int(box["ymin"]) - pad)
+    xmax, ymax = min(W, int(box["xmax"]) + pad + 1), min(H, int(box["ymax"]) + pad + 1)
+    if xmax - xmin < 2 or ymax - ymin < 2:
+        return None
+    return image[ymin:ymax, xmin:xmax]
+
+def normalized(crop: np.ndarray) -> np.ndarray:
+    # Dark text on white, at a readable height.
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    if gray.mean() < 128:
+        gray = 255 - gray
+    scale = min(4.0, MIN_HEIGHT / gray.shape[0])
+    if scale > 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    return gray
+
+def pack(crops: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stacks grayscale crops into one white sheet, one per line.
+
+    Returns:
+      (sheet, spans) where spans[i] is the (top, bottom) of crop i.
+    """
+    width = max(crop.shape[1] for crop in crops) + 2 * GAP
+    height = sum(crop.shape[0] for crop in crops) + GAP * (len(crops) + 1)
+    sheet = np.full((height, width), 255, np.uint8)
+    spans = np.zeros((len(crops), 2), np.int64)
+    y = GAP
+    for i, crop in enumerate(crops):
+        h, w = crop.shape
+        sheet[y:y + h, GAP:GAP + w] = crop
+        spans[i] = y, y + h
+        y += h + GAP
+    return sheet, spans
+
+def read_sheet(sheet: np.ndarray, spans: np.ndarray) -> List[str]:
+    """
+    The text of every crop of a packed sheet, from one tesseract run:
+    each recognized word goes to the crop its vertical center lies in.
+    """
+    data = pytesseract.image_to_data(sheet, config="--psm 4", output_type=pytesseract.Output.DICT)
+    words: List[List[str]] = [[] for _ in range(len(spans))]
+    for text, top, height in zip(data["text"], data["top"], data["height"]):
+        text = text.strip()
+        if not text:
+            continue
+        center = top + height / 2
+        i = int(np.searchsorted(spans[:, 0], center, side="right")) - 1
+        if i >= 0 and center <= spans[i, 1] + GAP / 2:
+            words[i].append(text)
+    return [" ".join(line) for line in words]
+
+
+class TextCache:
+    """
+    Recognized text by crop hash, for at most `max_entries` crops (least
+    recently used evicted first). Charts from one template repeat their
+    titles and ticks, so most of their crops are read only once.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+text_cache = TextCache(config.OCR_CACHE_ENTRIES)
+# Tesseract runs shared by all requests; each sheet is one tesseract process.
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_available: Optional[bool] = None
+
+
+def available() -> bool:
+    """
+    Whether pytesseract and the tesseract binary are installed.
+    """
+    global _available
+    if _available is None:
+        try:
+            _available = pytesseract is not None and bool(pytesseract.get_tesseract_version())
+        except (pytesseract.TesseractNotFoundError, OSError):
+            _available = False
+    return _available
+
+def pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max(1, config.OCR_WORKERS), thread_name_prefix="ocr")
+        return _pool
+
+def read_text(image: np.ndarray, regions: List[Dict], labels: Sequence[str] = TEXT_LABELS) -> int:
+    """
+    Sets "text" on every region labeled one of `labels`, reading all of
+    an image's uncached text crops in batched tesseract runs (up to
+    OCR_BATCH crops each, spread over the OCR worker pool) instead of one
+    run per region.
+
+    Returns:
+      How many crops were sent to tesseract.
+    """
+    pending: Dict[str, Tuple[np.ndarray, List[Dict]]] = {}
+    for region in regions:
+        if region.get("label") not in labels:
+            continue
+        box = next(region_boxes(region), None)
+        if box is None:
+            continue
+        crop = text_crop(image, box)
+        if crop is None:
+            region["text"] = ""
+            continue
+        key = crop_key(crop)
+        text = text_cache.get(key)
+        metrics.increment("ocr_cache_hits" if text is not None else "ocr_cache_misses")
+        if text is not None:
+            region["text"] = text
+        else:
+            pending.setdefault(key, (crop, []))[1].append(region)
+    if not pending:
+        return 0
+
+    keys = list(pending)
+    batch = max(1, config.OCR_BATCH)
+    chunks = [keys[i:i + batch] for i in range(0, len(keys), batch)]
+    started = time.perf_counter()
+    sheets = [pack([normalized(pending[key][0]) for key in chunk]) for chunk in chunks]
+    for chunk, texts in zip(chunks, pool().map(lambda sheet: read_sheet(*sheet), sheets)):
+        for key, text in zip(chunk, texts):
+            text_cache.put(key, text)
+            for region in pending[key][1]:
+                region["text"] = text
+    metrics.observe("ocr_batch_seconds", time.perf_counter() - started)
+    return len(keys)
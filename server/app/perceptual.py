@@ -0,0 +1,107 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Side of the grayscale image the fingerprint's DCT is taken of, and of
+# the block of lowest frequencies kept from it (8 x 8 = 64 bits).
+FINGERPRINT_SIZE = 32
+FINGERPRINT_BLOCK = 8
+# Verification compares images downscaled by this factor.
+VERIFY_REDUCTION = 4
+
+
+def grayscale(image: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+def fingerprint(image: np.ndarray) -> int:
+    """
+    A 64-bit perceptual hash of an image: which of the lowest spatial
+    frequencies of a 32 x 32 grayscale thumbnail lie above their median.
+    Re-encoding or re-screenshotting a chart flips few if any bits, so
+    near-duplicates are images at a small Hamming distance.
+    """
+    small = cv2.resize(grayscale(image), (FINGERPRINT_SIZE, FINGERPRINT_SIZE), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small.astype(np.float32))[:FINGERPRINT_BLOCK, :FINGERPRINT_BLOCK].ravel()
+    # The DC term only says how bright the image is; leave it out of the median.
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+def verification_thumbnail(image: np.ndarray) -> np.ndarray:
+    H, W = image.shape[:2]
+    size = (max(1, W // VERIFY_REDUCTION), max(1, H // VERIFY_REDUCTION))
+    return cv2.resize(grayscale(image), size, interpolation=cv2.INTER_AREA)
+
+
+class NearDuplicateCache:
+    """
+    Analysis results of recent images, found again for near-duplicate
+    uploads (a fresh screenshot or a re-encoded copy of the same chart).
+
+    Entries are indexed by `fingerprint`; a lookup scans the fingerprints
+    of its scope (chart type and options) for ones within `max_distance`
+    bits. A candidate only counts as a hit if it has the same resolution
+    and its 1/4-size grayscale thumbnail differs from the query's by at
+    most `max_difference` gray levels anywhere, which lets compression
+    noise through but not a moved mark. The least recently used of
+    `max_entries` entries is evicted first.
+    """
+
+    def __init__(self, max_entries: int = 256, max_distance: int = 6, max_difference: int = 24):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self._entries: "OrderedDict[int, Tuple]" = OrderedDict()
+        self._index: Dict[Hashable, Dict[int, int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, scope: Hashable, image: np.ndarray) -> Tuple[Optional[Dict], int, np.ndarray]:
+        """
+        Returns (a copy of the cached result or None, the image's
+        fingerprint, its verification thumbnail); pass the last two to
+        `store` after a miss.
+        """
+        key = fingerprint(image)
+        thumbnail = verification_thumbnail(image)
+        with self._lock:
+            index = self._index.get(scope)
+            candidates = []
+            if index:
+                ids = np.fromiter(index.keys(), dtype=np.int64, count=len(index))
+                prints = np.fromiter(index.values(), dtype=np.uint64, count=len(index))
+                distances = np.bitwise_count(prints ^ np.uint64(key))
+                close = np.flatnonzero(distances <= self.max_distance)
+                candidates = [self._entries[int(ids[i])][2:] + (int(ids[i]),)
+                              for i in close[np.argsort(distances[close], kind="stable")]]
+        for shape, cached_thumbnail, result, entry_id in candidates:
+            if shape == image.shape and self._verified(cached_thumbnail, thumbnail):
+                with self._lock:
+                    if entry_id in self._entries:
+                        self._entries.move_to_end(entry_id)
+                return copy.deepcopy(result), key, thumbnail
+        return None, key, thumbnail
+
+    def store(self, scope: Hashable, image_shape: Tuple[int, ...], key: int, thumbnail: np.ndarray,
+              result: Dict) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, key, image_shape, thumbnail, copy.deepcopy(result))
+            self._index.setdefault(scope, {})[entry_id] = key
+            while len(self._entries) > self.max_entries:
+                old_id, (old_scope, *_) = self._entries.popitem(last=False)
+                del self._index[old_scope][old_id]
+                if not self._index[old_scope]:
+                    del self._index[old_scope]
+
+    def _verified(self, cached: np.ndarray, thumbnail: np.ndarray) -> bool:
+        return int(cv2.absdiff(cached, thumbnail).max()) <= self.max_difference
@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+def artifact_path(root, version: str, chart_type: str, input_hash: str) -> Path:
+    """
+    Where tools.build_annotations writes the result for one image:
+    ROOT/<detector version>/<chart type>/<content hash>.json.
+    """
+    return Path(root) / version / chart_type / f"{input_hash}.json"
+
+
+class PrebuiltResults:
+    """
+    Analyzer results built ahead of time (see tools/build_annotations.py)
+    for the current detector version, looked up by chart type and content
+    hash. Artifacts of other versions are ignored.
+    """
+
+    def __init__(self, directory: str, version: str):
+        self.directory = Path(directory) if directory else None
+        self.version = version
+        self._index: Dict[Tuple[str, str], Path] = {}
+
+    def load(self) -> "PrebuiltResults":
+        if self.directory is None:
+            return self
+        index = {}
+        for path in (self.directory / self.version).glob("*/*.json"):
+            index[(path.parent.name, path.stem)] = path
+        self._index = index
+        return self
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, chart_type: str, input_hash: str) -> Optional[Dict]:
+        path = self._index.get((chart_type, input_hash))
+        if path is None:
+            return None
+        try:
+            return json.loads(path.read_text())["result"]
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,204 @@
+import cProfile
+import heapq
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app import config
+from app.hashing import content_hash
+
+PROFILE_FORMATS = ("collapsed", "pstats")
+
+# Seconds between stack samples of the profiled thread.
+SAMPLE_INTERVAL = 0.005
+
+# On-demand profiles kept for retrieval; the oldest are dropped first.
+MAX_REQUESTED_PROFILES = 50
+
+
+def capture_enabled() -> bool:
+    return config.PROFILING or config.PROFILE_SLOWEST > 0
+
+
+class StackSampler:
+    """
+    Samples the Python stack of one thread from a background thread and
+    counts the collapsed stacks, so overhead stays low enough to run on
+    every request.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        """
+        Stacks in the collapsed format read by flamegraph tools: one
+        "root;...;leaf count" line per distinct stack.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Capture:
+    """
+    A profile of one analysis, plus what identifies it.
+    """
+
+    def __init__(self, chart_type: str, contents: bytes, fmt: str):
+        self.id = uuid.uuid4().hex
+        self.chart_type = chart_type
+        self.input_hash = content_hash(contents)
+        self.format = fmt
+        self.duration_ms = 0.0
+        self.created_at = time.time()
+        self.data = b""
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "chart_type": self.chart_type,
+            "input_hash": self.input_hash,
+            "format": self.format,
+            "duration_ms": round(self.duration_ms, 1),
+            "created_at": self.created_at,
+            "url": f"/debug/profiles/{self.id}",
+        }
+
+
+class ProfileStore:
+    """
+    Keeps requested profiles (most recent MAX_REQUESTED_PROFILES) and the
+    profiles of the slowest `slowest` analyses seen.
+    """
+
+    def __init__(self, slowest: int):
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        self._requested: "OrderedDict[str, Capture]" = OrderedDict()
+        # Min-heap of (duration, id, capture): the fastest kept capture is evicted first.
+        self._slow: List = []
+
+    def add_requested(self, capture: Capture) -> None:
+        with self._lock:
+            self._requested[capture.id] = capture
+            while len(self._requested) > MAX_REQUESTED_PROFILES:
+                self._requested.popitem(last=False)
+
+    def offer_slow(self, capture: Capture) -> None:
+        if self.slowest <= 0:
+            return
+        entry = (capture.duration_ms, capture.id, capture)
+        with self._lock:
+            if len(self._slow) < self.slowest:
+                heapq.heappush(self._slow, entry)
+            elif capture.duration_ms > self._slow[0][0]:
+                heapq.heapreplace(self._slow, entry)
+
+    def get(self, profile_id: str) -> Optional[Capture]:
+        with self._lock:
+            if profile_id in self._requested:
+                return self._requested[profile_id]
+            for _, capture_id, capture in self._slow:
+                if capture_id == profile_id:
+                    return capture
+        return None
+
+    def list(self) -> Dict:
+        with self._lock:
+            slowest = sorted(self._slow, reverse=True)
+            requested = list(self._requested.values())
+        return {
+            "slowest": [capture.summary() for _, _, capture in slowest],
+            "requested": [capture.summary() for capture in reversed(requested)],
+        }
+
+
+store = ProfileStore(config.PROFILE_SLOWEST)
+
+
+@contextmanager
+def profile_analysis(chart_type: str, contents: bytes, requested: Optional[str] = None):
+    """
+    Profiles the enclosed analysis if it was requested (`requested` is
+    "collapsed" or "pstats") or if slow-request capture is enabled.
+
+    Yields the Capture (or None when nothing is profiled). Requested
+    profiles are stored for retrieval; sampled ones also compete for the
+    slowest-N list.
+    """
+    if requested is None and config.PROFILE_SLOWEST <= 0:
+        yield None
+        return
+
+    capture = Capture(chart_type, contents, requested or "collapsed")
+    sampler = profiler = None
+    if capture.format == "pstats":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+    start = time.perf_counter()
+    try:
+        yield capture
+    finally:
+        capture.duration_ms = (time.perf_counter() - start) * 1000
+        if profiler is not None:
+            profiler.disable()
+            capture.data = pstats_bytes(profiler)
+        else:
+            sampler.stop()
+            capture.data = sampler.collapsed().encode()
+        if requested is not None:
+            store.add_requested(capture)
+        # cProfile slows the code it traces, so only sampled durations are comparable.
+        if capture.format == "collapsed":
+            store.offer_slow(capture)
+
+def pstats_bytes(profiler: cProfile.Profile) -> bytes:
+    """
+    The profile in the binary format pstats.Stats(path) loads.
+    """
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+def pstats_text(data: bytes, limit: int = 40) -> str:
+    """
+    A cumulative-time report of a pstats capture.
+    """
+    out = io.StringIO()
+    stats = pstats.Stats(stream=out)
+    stats.stats = marshal.loads(data)
+    stats.get_top_level_stats()
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
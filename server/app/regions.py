@@ -0,0 +1,48 @@
+from typing import Dict, List
+
+BOX_KEYS = ("xmin", "ymin", "xmax", "ymax")
+
+
+def region_boxes(region: Dict):
+    """
+    Yields the box dicts ({"xmin", "ymin", "xmax", "ymax"}) held by a region,
+    whatever shape key they are stored under (e.g. "rectangular").
+    """
+    for value in region.values():
+        if isinstance(value, dict) and all(k in value for k in BOX_KEYS):
+            yield value
+
+def scale_regions(regions: List[Dict], sx: float, sy: float) -> List[Dict]:
+    """
+    Scales every region box in place by (sx, sy) and returns the list.
+    Used to map results computed on a downscaled image back to full size.
+    """
+    for region in regions:
+        for box in region_boxes(region):
+            box["xmin"] = int(round(box["xmin"] * sx))
+            box["xmax"] = int(round(box["xmax"] * sx))
+            box["ymin"] = int(round(box["ymin"] * sy))
+            box["ymax"] = int(round(box["ymax"] * sy))
+    return regions
+
+def scale_points(points: List[Dict], sx: float, sy: float) -> List[Dict]:
+    """
+    Scales the flat [x0, y0, x1, y1, ...] "xy" lists of point groups in
+    place by (sx, sy), like scale_regions does for boxes.
+    """
+    for group in points:
+        xy = group["xy"]
+        xy[0::2] = [round(x * sx, 1) for x in xy[0::2]]
+        xy[1::2] = [round(y * sy, 1) for y in xy[1::2]]
+        group["radius"] = round(group["radius"] * (sx + sy) / 2, 2)
+    return points
+
+def scale_values(values: List[Dict], xs: List[int], sy: float) -> List[Dict]:
+    """
+    Maps series values looked up on a downscaled image back to full size:
+    the requested full-size columns `xs`, and y scaled by sy.
+    """
+    for series in values:
+        series["x"] = list(xs)
+        series["y"] = [None if y is None else int(round(y * sy)) for y in series["y"]]
+    return values
@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Request
+
+router = APIRouter()
+
+@router.get("/assets")
+def list_assets(request: Request):
+    """
+    The registered chart images, usable as /analyze/*?asset=<id>.
+    """
+    return request.app.state.assets.list()
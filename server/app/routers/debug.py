@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse, Response
+
+from app import profiling
+
+router = APIRouter()
+
+def require_capture():
+    if not profiling.capture_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+@router.get("/debug/profiles")
+def list_profiles():
+    require_capture()
+    return profiling.store.list()
+
+@router.get("/debug/profiles/{profile_id}")
+def get_profile(profile_id: str, text: bool = False):
+    """
+    Collapsed stacks are returned as text. pstats captures are returned in
+    the binary format `pstats.Stats(path)` loads, or as a cumulative-time
+    report with ?text=true.
+    """
+    require_capture()
+    capture = profiling.store.get(profile_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if capture.format == "collapsed":
+        return PlainTextResponse(capture.data.decode())
+    if text:
+        return PlainTextResponse(profiling.pstats_text(capture.data))
+    return Response(
+        capture.data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{capture.id}.pstats"'},
+    )
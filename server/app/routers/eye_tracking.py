@@ -1,33 +1,170 @@
-from fastapi import APIRouter
-# import tobii_research as tr
+import asyncio
+import uuid
+from typing import Dict, List, Literal, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+
+from app import config, gaze
+from app.gazemap import GazeSession
 
 router = APIRouter()
 
 @router.get("/eye-tracker/status")
-def get_status():
-    devices = tr.find_all_eyetrackers()
-    print("finidng devices")
-    if not devices:
-        return {"status": "No eye tracker connected"}
-    
-    tracker = devices[0]
-    return {
-        "status": "Eye tracker connected",
-        "device_name": tracker.device_name,
-        "serial_number": tracker.serial_number
-    }
+def get_status(request: Request):
+    status = request.app.state.gaze.status()
+    if not status["tracking"]:
+        devices = gaze.tr.find_all_eyetrackers() if gaze.tr is not None else []
+        status["status"] = "Eye tracker connected" if devices else "No eye tracker connected"
+    return status
 
 @router.post("/eye-tracker/start")
-def start_tracking():
-    devices = tr.find_all_eyetrackers()
-    if not devices:
-        return {"error": "No eye tracker connected"}
-    
-    tracker = devices[0]
+def start_tracking(request: Request, source: Literal["tobii", "simulated"] = "tobii", rate: float = 120):
+    """
+    Starts filling the gaze buffer from the first connected Tobii tracker,
+    or with source=simulated from a simulated one sampling at `rate` Hz.
+    """
+    if not 1 <= rate <= 2000:
+        raise HTTPException(status_code=400, detail="rate must be between 1 and 2000")
+    try:
+        return request.app.state.gaze.start(source, rate)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+@router.post("/eye-tracker/stop")
+def stop_tracking(request: Request):
+    request.app.state.gaze.stop()
+    return request.app.state.gaze.status()
+
+def watch_disconnect(websocket: WebSocket) -> asyncio.Task:
+    """
+    Reads (and ignores) client messages in the background. The task ends
+    when the client disconnects, so push-only endpoints that wait on it
+    instead of sleeping notice a client that left even while they have
+    nothing to send.
+    """
+    async def receive_until_disconnect():
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        except RuntimeError:  # Receiving after the disconnect.
+            pass
+    return asyncio.create_task(receive_until_disconnect())
+
+async def disconnected_within(watcher: asyncio.Task, interval: float) -> bool:
+    """
+    Waits `interval` seconds, or less if the client disconnects first.
+    """
+    done, _ = await asyncio.wait({watcher}, timeout=interval)
+    return bool(done)
+
+@router.websocket("/eye-tracker/ws")
+async def stream_gaze(websocket: WebSocket, batch_hz: float = config.GAZE_BATCH_HZ):
+    """
+    Pushes the gaze samples arriving after the connection opens, batched
+    `batch_hz` times a second as columns: {"t": [...], "x": [...],
+    "y": [...], "valid": [...], "dropped": n}. `dropped` counts samples
+    that were overwritten before this subscriber could be sent them.
+    Empty batches are not sent.
+    """
+    ring = websocket.app.state.gaze.ring
+    await websocket.accept()
+    interval = 1.0 / min(max(batch_hz, 1.0), 240.0)
+    position = ring.written
+    watcher = watch_disconnect(websocket)
+    try:
+        while not await disconnected_within(watcher, interval):
+            samples, position, dropped = ring.read_since(position)
+            if not len(samples) and not dropped:
+                continue
+            batch = {field: samples[:, column].tolist() for column, field in enumerate(gaze.FIELDS)}
+            batch["x"] = [None if x != x else x for x in batch["x"]]
+            batch["y"] = [None if y != y else y for y in batch["y"]]
+            batch["valid"] = [bool(valid) for valid in batch["valid"]]
+            await websocket.send_json({**batch, "dropped": dropped})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
+
+
+class SessionRequest(BaseModel):
+    # The "regions" of an /analyze/* result and the analyzed image's size.
+    regions: List[Dict]
+    width: int
+    height: int
+    # Where the image is shown: (left, top, right, bottom) in display-area coordinates.
+    viewport: Tuple[float, float, float, float] = (0.0, 0.0, 1.0, 1.0)
+    velocity: float = 0.5
+    min_duration: float = 0.06
+
+def find_session(hub, session_id: str) -> GazeSession:
+    session = hub.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@router.post("/eye-tracker/sessions", status_code=201)
+def create_session(request: Request, body: SessionRequest):
+    """
+    Starts attributing gaze to the regions of an analyzed chart: fixations
+    from now on are hit-tested against the regions and their dwell time
+    accumulated per region.
+    """
+    hub = request.app.state.gaze
+    left, top, right, bottom = body.viewport
+    if right <= left or bottom <= top:
+        raise HTTPException(status_code=400, detail="viewport must have right > left and bottom > top")
+    if len(hub.sessions) >= config.GAZE_MAX_SESSIONS:
+        raise HTTPException(status_code=503, detail=f"{len(hub.sessions)} gaze sessions are already open")
+    session_id = uuid.uuid4().hex
+    hub.sessions[session_id] = GazeSession(hub.ring, body.regions, body.width, body.height, body.viewport,
+                                           body.velocity, body.min_duration)
+    return {"id": session_id, "regions": len(body.regions)}
 
-    def gaze_data_callback(gaze_data):
-        print("Gaze data:", gaze_data)
+@router.get("/eye-tracker/sessions/{session_id}")
+def get_session(request: Request, session_id: str, limit: Optional[int] = None):
+    """
+    Dwell per region so far (most looked-at first, at most `limit`).
+    """
+    session = find_session(request.app.state.gaze, session_id)
+    session.process()
+    return session.summary(limit)
 
-    tracker.subscribe_to(tr.EYETRACKER_GAZE_DATA, gaze_data_callback, as_dictionary=True)
+@router.delete("/eye-tracker/sessions/{session_id}")
+def end_session(request: Request, session_id: str):
+    hub = request.app.state.gaze
+    session = find_session(hub, session_id)
+    session.process()
+    del hub.sessions[session_id]
+    return session.summary()
 
-    return {"status": "Tracking started"}
+@router.websocket("/eye-tracker/sessions/{session_id}/ws")
+async def watch_session(websocket: WebSocket, session_id: str, batch_hz: float = config.GAZE_BATCH_HZ,
+                        limit: Optional[int] = 20):
+    """
+    Pushes {"fixations": [...new fixations...], "dwell": summary} at up to
+    `batch_hz` times a second, whenever fixations complete.
+    """
+    await websocket.accept()
+    hub = websocket.app.state.gaze
+    if session_id not in hub.sessions:
+        await websocket.close(code=4404, reason="Session not found")
+        return
+    interval = 1.0 / min(max(batch_hz, 1.0), 240.0)
+    watcher = watch_disconnect(websocket)
+    try:
+        while session_id in hub.sessions:
+            if await disconnected_within(watcher, interval):
+                return
+            session = hub.sessions.get(session_id)
+            if session is None:
+                break
+            fixations = session.process()
+            if fixations:
+                await websocket.send_json({"fixations": fixations, "dwell": session.summary(limit)})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
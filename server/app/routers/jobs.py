@@ -0,0 +1,56 @@
+from typing import Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+
+from app.jobs import FINAL_STATUSES, JobQueueFull, public_view
+
+router = APIRouter()
+
+@router.post("/jobs", status_code=202)
+async def create_job(request: Request, chart_type: str = Form(...), file: Optional[UploadFile] = File(None),
+                     asset: Optional[str] = Form(None), debug: bool = False):
+    queue = request.app.state.jobs
+    if chart_type not in queue.chart_types:
+        raise HTTPException(status_code=400, detail=f"Unknown chart type: {chart_type}")
+    if asset is not None:
+        registered = request.app.state.assets.get(asset)
+        if registered is None:
+            raise HTTPException(status_code=404, detail=f"Unknown asset: {asset}")
+        contents = registered.contents
+    elif file is not None:
+        contents = await file.read()
+    else:
+        raise HTTPException(status_code=400, detail="Upload a file or name an asset")
+    try:
+        job = await queue.submit(chart_type, contents, debug)
+    except JobQueueFull as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    return public_view(job)
+
+@router.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    job = await request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_view(job)
+
+@router.websocket("/jobs/{job_id}/ws")
+async def watch_job(websocket: WebSocket, job_id: str):
+    queue = websocket.app.state.jobs
+    await websocket.accept()
+    updates = queue.watch(job_id)
+    try:
+        job = await queue.get(job_id)
+        if job is None:
+            await websocket.close(code=4404, reason="Job not found")
+            return
+        view = public_view(job)
+        await websocket.send_json(view)
+        while view["status"] not in FINAL_STATUSES:
+            view = await updates.get()
+            await websocket.send_json(view)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        queue.unwatch(job_id, updates)
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+
+from app import metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
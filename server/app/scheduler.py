@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from app import metrics
+
+# Priority classes, highest first. Queued requests of a class are all
+# started before any request of a later class.
+PRIORITY_CLASSES = ("interactive", "bulk")
+
+# Client virtual finish times kept per class before stale ones are pruned.
+MAX_TRACKED_CLIENTS = 1024
+
+
+class _Ticket:
+    __slots__ = ("priority", "future", "enqueued_at", "cancelled")
+
+    def __init__(self, priority: str, future: asyncio.Future):
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.cancelled = False
+
+
+class Scheduler:
+    """
+    Hands out `slots` analysis slots to queued requests.
+
+    A freed slot goes to the highest priority class with a request waiting
+    and room under its cap (`caps`, slots a class may hold at once; no cap
+    by default), so interactive requests overtake queued bulk work (running
+    work is never interrupted). Within a class, requests are ordered by
+    weighted fair queuing over client keys: each client's requests get
+    virtual finish times 1/weight apart, so a client with a burst of
+    uploads is interleaved with the others instead of served first.
+    """
+
+    def __init__(self, slots: int, caps: Optional[Dict[str, int]] = None):
+        self.slots = slots
+        self.caps = {priority: slots for priority in PRIORITY_CLASSES}
+        self.caps.update({priority: cap for priority, cap in (caps or {}).items() if cap > 0})
+        self.running = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._queues: Dict[str, List] = {priority: [] for priority in PRIORITY_CLASSES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._client_finish: Dict[str, Dict[str, float]] = {priority: {} for priority in PRIORITY_CLASSES}
+        self._order = itertools.count()
+
+    def queued(self, priority: str) -> int:
+        return sum(1 for _, _, ticket in self._queues[priority]
+                   if not ticket.cancelled and not ticket.future.done())
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive", client: str = "", weight: float = 1.0):
+        """
+        Waits for a slot for one analysis and holds it for the with block.
+        The wait is recorded as analysis_queue_wait_seconds{priority}.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        ticket = self._enqueue(priority, client, weight)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Granted just as the waiter went away: hand the slot on.
+                self._release(priority)
+            else:
+                ticket.cancelled = True
+            raise
+        metrics.observe("analysis_queue_wait_seconds", time.perf_counter() - ticket.enqueued_at,
+                        priority=priority)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def _enqueue(self, priority: str, client: str, weight: float) -> _Ticket:
+        ticket = _Ticket(priority, asyncio.get_running_loop().create_future())
+        finish = self._client_finish[priority]
+        tag = max(self._virtual_time[priority], finish.get(client, 0.0)) + 1.0 / weight
+        finish[client] = tag
+        heapq.heappush(self._queues[priority], (tag, next(self._order), ticket))
+        self._dispatch()
+        return ticket
+
+    def _release(self, priority: str) -> None:
+        self.running[priority] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while sum(self.running.values()) < self.slots:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self.running[ticket.priority] += 1
+            if not ticket.future.done():
+                ticket.future.set_result(None)
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        for priority in PRIORITY_CLASSES:
+            if self.running[priority] >= self.caps[priority]:
+                continue
+            queue = self._queues[priority]
+            while queue:
+                tag, _, ticket = heapq.heappop(queue)
+                # A waiter cancelled in this loop tick has its future
+                # cancelled before slot() gets to mark the ticket.
+                if ticket.cancelled or ticket.future.done():
+                    continue
+                self._virtual_time[priority] = tag
+                self._prune(priority)
+                return ticket
+        return None
+
+    def _prune(self, priority: str) -> None:
+        # Clients whose finish time is behind the class's virtual time
+        # would restart from it anyway; forget them.
+        finish = self._client_finish[priority]
+        if len(finish) > MAX_TRACKED_CLIENTS:
+            now = self._virtual_time[priority]
+            for client in [c for c, tag in finish.items() if tag <= now]:
+                del finish[client]
@@ -0,0 +1,94 @@
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+
+class ImageHandle(NamedTuple):
+    """
+    What a worker process needs to attach to a shared image: a few dozen
+    bytes to pickle, whatever the image size.
+    """
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class SharedImage:
+    """
+    A decoded image copied once into a shared-memory segment, so process
+    pool workers can read it without it being pickled to them.
+
+    The creating process owns the segment and counts references to it:
+    retain() before handing `handle` to a worker, release() when that
+    worker is done. The segment is unlinked when the count drops to zero.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        self.array = np.ndarray(image.shape, dtype=image.dtype, buffer=self._shm.buf)
+        self.array[...] = image
+        self.handle = ImageHandle(self._shm.name, tuple(image.shape), image.dtype.str)
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    def retain(self) -> ImageHandle:
+        with self._lock:
+            if self._refs <= 0:
+                raise RuntimeError("Shared image already released")
+            self._refs += 1
+        return self.handle
+
+    def release(self) -> None:
+        with self._lock:
+            self._refs -= 1
+            last = self._refs == 0
+        if last:
+            self.array = None
+            _close(self._shm)
+            self._shm.unlink()
+
+    def __enter__(self) -> "SharedImage":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+@contextmanager
+def attached(handle: ImageHandle):
+    """
+    In a worker: the shared image as a read-only array, valid inside the
+    with block. Nothing is copied.
+    """
+    shm = _open_untracked(handle.name)
+    image = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+    image.flags.writeable = False
+    try:
+        yield image
+    finally:
+        del image
+        _close(shm)
+
+def _open_untracked(name: str) -> shared_memory.SharedMemory:
+    # Attaching must not make this process an owner: before 3.13 it would
+    # register the segment with this process's resource tracker, which
+    # unlinks it (with a "leaked" warning) when the worker exits.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _close(shm: shared_memory.SharedMemory) -> None:
+    try:
+        shm.close()
+    except BufferError:
+        # An array still views the segment; the mapping goes away with the
+        # last such array instead.
+        pass
@@ -0,0 +1,49 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from app import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key: while a computation for a key is
+    in flight, later callers with the same key await its result instead of
+    starting their own.
+
+    The computation runs as its own task, so a caller that goes away (e.g.
+    a client disconnect) does not cancel it for the others; it is
+    cancelled when the last caller waiting for it goes away.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        else:
+            metrics.increment("singleflight_coalesced", flight=self.name)
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1:
+                # Later callers start afresh rather than join a cancelled task.
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
@@ -1,18 +1,62 @@
-from typing import Dict
-from fastapi import FastAPI, File, UploadFile
+import asyncio
+import inspect
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Dict, Literal, NamedTuple
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from openCVdetectBar import detect_title, detect_multiple_colors, detect_axes_and_title_with_legends, detect_legend_items
-# from app.routers import eye_tracking
+from app.routers import eye_tracking
+from app import buffers, cancellation, config, memory, metrics, ocr, profiling
+from app.assets import AssetRegistry
+from app.cancellation import CancelToken, within_deadline
+from app.density import MAX_GRID, cell_marks, density_grid
+from app.framediff import FrameStream
+from app.gaze import GazeHub
+from app.hashing import analysis_key, content_hash, detector_version
+from app.jobs import JobQueue, open_store
+from app.memory import stage
+from app.perceptual import NearDuplicateCache
+from app.prebuilt import PrebuiltResults
+from app.regions import scale_points, scale_regions, scale_values
+from app.scheduler import PRIORITY_CLASSES, Scheduler
+from app.singleflight import SingleFlight
+from app.routers import assets as assets_router
+from app.routers import debug as debug_router
+from app.routers import jobs as jobs_router
+from app.routers import metrics as metrics_router
 from openCVdetectComponent import detect_treemap_labels, detect_chart_title, detect_multiple_colors_tree
-from openCVdetectDots import detect_scatterplot_dots, detect_colored_bubbles, detect_bubble_labels, detect_bubble_legend_items
+from openCVdetectDots import detect_scatterplot_dots, detect_dense_points, detect_colored_bubbles, detect_bubble_labels, detect_bubble_legend_items
 import cv2
 import numpy as np
 from openCVmapContinous import extract_specific_axis_labels, find_intersection_bounding_boxes, extract_axis_labels_advanced
 from openCVdetectShape import detect_pie_slices
+from openCVdetectLines import line_series, sample_series, series_ranges, series_values, trace_lines
+from openCVdetectPalette import discover_palette, resolve_palette, present_colors
 from openCVmapIrregular import detect_legend_colors,detect_stacked_boundaries, detect_abbreviations
 from typing import Dict, List, Tuple, Optional
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.assets = AssetRegistry(config.ASSET_DIR, config.ASSET_MMAP, config.ASSET_CACHE_DIR).load()
+    prebuilt_results.load()
+    app.state.jobs = JobQueue(
+        open_store(config.JOB_STORE),
+        run_analysis,
+        ANALYZERS,
+        workers=config.JOB_WORKERS,
+        retention_seconds=config.JOB_RETENTION_SECONDS,
+        max_queued=config.JOB_MAX_QUEUED,
+        scheduler=analysis_scheduler,
+    )
+    app.state.gaze = GazeHub(config.GAZE_BUFFER_SAMPLES)
+    await app.state.jobs.start()
+    yield
+    await app.state.jobs.stop()
+    app.state.gaze.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend access
 app.add_middleware(
@@ -24,7 +68,11 @@ app.add_middleware(
 )
 
 # Include the eye tracking router
-# app.include_router(eye_tracking.router)
+app.include_router(eye_tracking.router)
+app.include_router(metrics_router.router)
+app.include_router(jobs_router.router)
+app.include_router(assets_router.router)
+app.include_router(debug_router.router)
 
 @app.get("/")
 def read_root():
@@ -35,20 +83,21 @@ def read_root():
 # for example 100% stacked bar would be Chart, Surface, Rectangular
 # so if a chart that is chart, area, and rectangular, we put it with the below api
 
-async def analyze_100_stacked_bar_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
+def analyze_100_stacked_bar_chart(image: np.ndarray) -> Dict:
     # 1. Detect area segments by color
     colors = ['#cd7f32', '#bec36f', '#feb24c']
-    color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=4)
+    with stage("resolve_palette"):
+        colors = resolve_palette(image, colors)
+    with stage("detect_multiple_colors"):
+        color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=4)
 
     # 2. Detect axes and title
-    axes_title_result = detect_axes_and_title_with_legends(image)
+    with stage("detect_axes_and_title_with_legends"):
+        axes_title_result = detect_axes_and_title_with_legends(image) if within_deadline() else {}
 
     # 3. Detect legend items
-    legend_items_result = detect_legend_items(image)
+    with stage("detect_legend_items"):
+        legend_items_result = detect_legend_items(image) if within_deadline() else {}
 
     # Combine all regions from the results
     combined_regions = []
@@ -62,17 +111,17 @@ async def analyze_100_stacked_bar_chart(file: UploadFile) -> Dict:
         "regions": combined_regions
     }
 
-async def analyze_bar_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
+def analyze_bar_chart(image: np.ndarray) -> Dict:
     # 1. Detect bar segments by color
     colors = ['#3182bd']
-    color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=14)
+    with stage("resolve_palette"):
+        colors = resolve_palette(image, colors)
+    with stage("detect_multiple_colors"):
+        color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=14)
 
     # 2. Detect axes and title
-    axes_title_result = detect_axes_and_title_with_legends(image)
+    with stage("detect_axes_and_title_with_legends"):
+        axes_title_result = detect_axes_and_title_with_legends(image) if within_deadline() else {}
 
     # 3. Detect legend items
     # legend_items_result = detect_legend_items(image)
@@ -87,20 +136,21 @@ async def analyze_bar_chart(file: UploadFile) -> Dict:
         "regions": combined_regions
     }
 
-async def analyze_stacked_bar_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
+def analyze_stacked_bar_chart(image: np.ndarray) -> Dict:
     # 1. Detect bar segments by color
     colors = ['#386cb0', '#fb9a99', '#fdc086', '#beaed4', '#7fc97f']
-    color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=11)
+    with stage("resolve_palette"):
+        colors = resolve_palette(image, colors)
+    with stage("detect_multiple_colors"):
+        color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=11)
 
     # 2. Detect axes and title
-    axes_title_result = detect_axes_and_title_with_legends(image)
+    with stage("detect_axes_and_title_with_legends"):
+        axes_title_result = detect_axes_and_title_with_legends(image) if within_deadline() else {}
 
     # 3. Detect legend items
-    legend_items_result = detect_legend_items(image)
+    with stage("detect_legend_items"):
+        legend_items_result = detect_legend_items(image) if within_deadline() else {}
 
     # Combine all regions from the results
     combined_regions = []
@@ -114,85 +164,141 @@ async def analyze_stacked_bar_chart(file: UploadFile) -> Dict:
         "regions": combined_regions
     }
 
-async def analyze_scatter_plot(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
+def aggregate_marks(image: np.ndarray, marks: List[Dict], points: Optional[List[Dict]],
+                    grid: int, cell: Optional[List[int]] = None):
+    """
+    Replaces per-mark output with per-cell counts on a `grid`-column grid,
+    or, with `cell` ([column, row]), with just the marks in that cell.
+
+    Returns:
+      (regions, points, extra), where extra holds the "density" or "cell" key.
+    """
+    height, width = image.shape[:2]
+    if cell is None:
+        return [], None, {"density": density_grid(marks, points, width, height, grid)}
+    marks, points, box = cell_marks(marks, points, width, height, grid, cell)
+    return marks, points, {"cell": box}
+
+def analyze_scatter_plot(image: np.ndarray, dense: bool = False, grid: Optional[int] = None,
+                         cell: Optional[List[int]] = None) -> Dict:
     # 1. Detect bar segments by color
     colors = ['#3182bd']
-    color_result = detect_scatterplot_dots(image, colors)
+    with stage("resolve_palette"):
+        colors = resolve_palette(image, colors)
+    points = None
+    if dense:
+        # Dense plots return point centers as flat [x0, y0, x1, y1, ...]
+        # lists instead of one region per dot.
+        with stage("detect_dense_points"):
+            points = [
+                {
+                    "color": group["color"],
+                    "radius": round(group["radius"], 2),
+                    "count": len(group["centers"]),
+                    "xy": np.round(group["centers"].astype(np.float64), 1).ravel().tolist(),
+                }
+                for group in detect_dense_points(image, colors)
+            ]
+        color_result = {}
+    else:
+        with stage("detect_scatterplot_dots"):
+            color_result = detect_scatterplot_dots(image, colors)
+    marks, extra = color_result.get("regions", []), {}
+    if grid is not None:
+        with stage("aggregate_marks"):
+            marks, points, extra = aggregate_marks(image, marks, points, grid, cell)
 
     # 2. Detect axes and title
-    axes_title_result = detect_axes_and_title_with_legends(image)
+    with stage("detect_axes_and_title_with_legends"):
+        axes_title_result = detect_axes_and_title_with_legends(image) if within_deadline() else {}
 
 
     # Combine all regions from the results
     combined_regions = []
-    if "regions" in color_result:
-        combined_regions.extend(color_result["regions"])
+    combined_regions.extend(marks)
     if "regions" in axes_title_result:
         combined_regions.extend(axes_title_result["regions"])
+    if points is not None:
+        extra["points"] = points
     return {
-        "regions": combined_regions
+        "regions": combined_regions,
+        **extra
     }
 
-async def analyze_bubble_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
+def analyze_bubble_chart(image: np.ndarray, grid: Optional[int] = None, cell: Optional[List[int]] = None) -> Dict:
     # 1. Detect bar segments by color
     colors = '#6ea7d1'
-    color_result = detect_colored_bubbles(image, colors, expected_count=1)
+    with stage("resolve_palette"):
+        colors = (resolve_palette(image, [colors]) or [colors])[0]
+    with stage("detect_colored_bubbles"):
+        color_result = detect_colored_bubbles(image, colors, expected_count=1)
+    marks, extra = color_result.get("regions", []), {}
+    if grid is not None:
+        with stage("aggregate_marks"):
+            marks, _, extra = aggregate_marks(image, marks, None, grid, cell)
     # bubble_labels_result = detect_bubble_labels(image, color_result["regions"])
     # 2. Detect axes and title
     # axes_title_result = detect_axes_and_title_with_legends(image)
-    axes_title_result = extract_axis_labels_advanced(image)
+    with stage("extract_axis_labels_advanced"):
+        axes_title_result = extract_axis_labels_advanced(image) if within_deadline() else []
 
     # 3. Detect legend items
-    legend_items_result = detect_bubble_legend_items(image, 3)
+    with stage("detect_bubble_legend_items"):
+        legend_items_result = detect_bubble_legend_items(image, 3) if within_deadline() else {}
 
     # Combine all regions from the results
     combined_regions = []
-    if "regions" in color_result:
-        combined_regions.extend(color_result["regions"])
-        # combined_regions.extend(bubble_labels_result["regions"])
+    combined_regions.extend(marks)
+    # combined_regions.extend(bubble_labels_result["regions"])
     # if "regions" in axes_title_result:
     combined_regions.extend(axes_title_result)
     if "regions" in legend_items_result:
         combined_regions.extend(legend_items_result["regions"])
     return {
-        "regions": combined_regions
+        "regions": combined_regions,
+        **extra
     }
 
-async def analyze_line_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-    combined_regions = extract_specific_axis_labels(image)
+def analyze_line_chart(image: np.ndarray, samples: Optional[int] = None, at: Optional[List[int]] = None) -> Dict:
+    with stage("extract_specific_axis_labels"):
+        combined_regions = extract_specific_axis_labels(image)
 
     middle_x = get_x_axis_tick_centers(combined_regions)
 
-    intersection_regions = find_intersection_bounding_boxes(image, middle_x)
-
-    return {
+    # Every series is traced across every column once; tick values,
+    # samples and values at requested columns are then lookups. Only the
+    # expected series are boxed; discovered ones are in points and values.
+    expected = ['#3282bd']
+    with stage("resolve_palette"):
+        colors = line_series(image, expected, plot_area(combined_regions, image.shape))
+    with stage("trace_lines"):
+        trace = trace_lines(image, series_ranges(colors)) if within_deadline() else None
+    with stage("find_intersection_bounding_boxes"):
+        intersection_regions = (find_intersection_bounding_boxes(image, middle_x, trace=trace,
+                                                                 series=range(len(expected)))
+                                if trace is not None and within_deadline() else [])
+
+    result = {
         "regions": combined_regions + intersection_regions
     }
+    if samples and trace is not None:
+        result["points"] = sample_series(trace, samples, colors)
+    if at and trace is not None:
+        result["values"] = series_values(trace, at, colors)
+    return result
     
 
-async def analyze_histogram(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
+def analyze_histogram(image: np.ndarray) -> Dict:
     # 1. Detect bar segments by color
     colors = ['#3182bd']
-    color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=11)
+    with stage("resolve_palette"):
+        colors = resolve_palette(image, colors)
+    with stage("detect_multiple_colors"):
+        color_result = detect_multiple_colors(image, "rectangular", colors, expected_count=11)
 
     # 2. Detect axes and title
-    axes_title_result = detect_axes_and_title_with_legends(image)
+    with stage("detect_axes_and_title_with_legends"):
+        axes_title_result = detect_axes_and_title_with_legends(image) if within_deadline() else {}
 
     # 3. Detect legend items
     # legend_items_result = detect_legend_items(image)
@@ -207,20 +313,49 @@ async def analyze_histogram(file: UploadFile) -> Dict:
         "regions": combined_regions
     }
 
-async def analyze_area_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-    combined_regions = extract_specific_axis_labels(image)
+def analyze_area_chart(image: np.ndarray, samples: Optional[int] = None, at: Optional[List[int]] = None) -> Dict:
+    with stage("extract_specific_axis_labels"):
+        combined_regions = extract_specific_axis_labels(image)
 
     middle_x = get_x_axis_tick_centers(combined_regions)
 
-    intersection_regions = find_intersection_bounding_boxes(image, middle_x)
-
-    return {
+    # Every series is traced across every column once; tick values,
+    # samples and values at requested columns are then lookups. Only the
+    # expected series are boxed; discovered ones are in points and values.
+    expected = ['#3282bd']
+    with stage("resolve_palette"):
+        colors = line_series(image, expected, plot_area(combined_regions, image.shape))
+    with stage("trace_lines"):
+        trace = trace_lines(image, series_ranges(colors)) if within_deadline() else None
+    with stage("find_intersection_bounding_boxes"):
+        intersection_regions = (find_intersection_bounding_boxes(image, middle_x, trace=trace,
+                                                                 series=range(len(expected)))
+                                if trace is not None and within_deadline() else [])
+
+    result = {
         "regions": combined_regions + intersection_regions
     }
+    if samples and trace is not None:
+        result["points"] = sample_series(trace, samples, colors)
+    if at and trace is not None:
+        result["values"] = series_values(trace, at, colors)
+    return result
+
+def plot_area(regions: List[Dict], shape) -> Tuple[int, int, int, int]:
+    """
+    (left, top, right, bottom) of a chart's plot area, from its axis ticks:
+    right of the y tick labels, from the top one down to the x tick labels,
+    and up to the right end of the x ticks. Sides without ticks to go by
+    are the image's.
+    """
+    H, W = shape[:2]
+    x_ticks = [r["rectangular"] for r in regions if r.get("label") == "x_axis_tick"]
+    y_ticks = [r["rectangular"] for r in regions if r.get("label") == "y_axis_tick"]
+    left = max((t["xmax"] for t in y_ticks), default=0)
+    top = min((t["ymin"] for t in y_ticks), default=0)
+    right = max((t["xmax"] for t in x_ticks), default=W)
+    bottom = min((t["ymin"] for t in x_ticks), default=H)
+    return left, top, max(left, right), max(top, bottom)
 
 def get_x_axis_tick_centers(regions: List[Dict]) -> List[int]:
 
@@ -236,10 +371,7 @@ def get_x_axis_tick_centers(regions: List[Dict]) -> List[int]:
 
 
 
-async def analyze_stacked_area_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+def analyze_stacked_area_chart(image: np.ndarray) -> Dict:
     H, W, _ = image.shape
     
     # Define the areas:
@@ -249,7 +381,8 @@ async def analyze_stacked_area_chart(file: UploadFile) -> Dict:
     legend_area = image[:, int(0.8 * W):]
     
     # 1) Process the axis area (ensuring that the right 20% is NOT considered).
-    axis_regions = extract_specific_axis_labels(axis_area)
+    with stage("extract_specific_axis_labels"):
+        axis_regions = extract_specific_axis_labels(axis_area)
 
     target_colors = ["#3282bd", "#9ecae1", "#deebf7"] 
     
@@ -257,8 +390,11 @@ async def analyze_stacked_area_chart(file: UploadFile) -> Dict:
     
 
     middle_x = get_x_axis_tick_centers(axis_regions)
-    for x in middle_x:
-        axis_regions.extend(detect_stacked_boundaries(image, x, target_colors, tolerance=30, white_thresh=240, box_offset=20))
+    with stage("detect_stacked_boundaries"):
+        for x in middle_x:
+            if not within_deadline():
+                break
+            axis_regions.extend(detect_stacked_boundaries(image, x, target_colors, tolerance=30, white_thresh=240, box_offset=20))
 
 
     # intersection_regions = find_intersection_bounding_boxes(image, middle_x)
@@ -267,17 +403,19 @@ async def analyze_stacked_area_chart(file: UploadFile) -> Dict:
         "regions": axis_regions
     }
 
-async def analyze_pie_chart(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
+def analyze_pie_chart(image: np.ndarray, rect_mode: str = "exact") -> Dict:
     # 1. Detect bar segments by color
     colors = ['#9e97c8', '#5295c4', '#f47562', '#fec981', '#a9daaa', '#ffffc9']
-    color_result = detect_pie_slices(image, colors, expected_count=6)
+    # Stray anti-aliased pixels are not a slice; skip colors covering
+    # less than 0.05% of the image rather than scanning for them.
+    with stage("resolve_palette"):
+        colors = resolve_palette(image, colors, min_fraction=0.0005)
+    with stage("detect_pie_slices"):
+        color_result = detect_pie_slices(image, colors, expected_count=6, rect_mode=rect_mode)
 
     # 2. Detect axes and title
-    axes_title_result = detect_title(image)
+    with stage("detect_title"):
+        axes_title_result = detect_title(image) if within_deadline() else {}
 
     # 3. Detect legend items
     # legend_items_result = detect_legend_items(image)
@@ -294,108 +432,477 @@ async def analyze_pie_chart(file: UploadFile) -> Dict:
         "regions": combined_regions
     }
 
-async def analyze_map(file: UploadFile) -> Dict:
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-    regions = detect_abbreviations(image)
+def analyze_map(image: np.ndarray) -> Dict:
+    with stage("detect_abbreviations"):
+        regions = detect_abbreviations(image)
 
     return {
         "regions": regions
     }
 
-async def analyze_treemap(file) -> Dict:
-    # Read the file contents and decode the image
-    contents = await file.read()
-    np_arr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-    
+def analyze_treemap(image: np.ndarray) -> Dict:
     # Define parameters for the treemap detection
     colors = ['#a5d9a5', '#fed3aa', '#fcb8b7', '#d1c6e1', '#7398c8']
     expected = [4, 5, 5, 4, 3]
+    with stage("resolve_palette"):
+        present = set(present_colors(image, colors))
+    expected = [count for color, count in zip(colors, expected) if color in present]
+    colors = [color for color in colors if color in present]
     
     # Detect treemap segments based on color
-    segments_result = detect_multiple_colors_tree(image, "rectangular", colors, expected)
+    with stage("detect_multiple_colors_tree"):
+        segments_result = detect_multiple_colors_tree(image, "rectangular", colors, expected)
     segment_regions = segments_result.get("regions", [])
     
     # Detect labels for each region
-    labels_result = detect_treemap_labels(image, segment_regions, label_height=30)
+    with stage("detect_treemap_labels"):
+        labels_result = detect_treemap_labels(image, segment_regions, label_height=30) if within_deadline() else {}
     label_regions = labels_result.get("labels", [])
     
     # Detect the title of the chart
-    title_region = detect_chart_title(image)
+    with stage("detect_chart_title"):
+        title_region = detect_chart_title(image) if within_deadline() else None
     
     # Combine all regions together
     combined_regions = []
     combined_regions.extend(segment_regions)
     combined_regions.extend(label_regions)
-    combined_regions.append(title_region)
+    if title_region is not None:
+        combined_regions.append(title_region)
     
     return {
         "regions": combined_regions
     }
 
 
-@app.post("/analyze/100_stacked_bar_chart")
-async def endpoint_chart_surface_rectangular(file: UploadFile = File(...)):
-    result = await analyze_100_stacked_bar_chart(file)
+ANALYZERS = {
+    "100_stacked_bar_chart": analyze_100_stacked_bar_chart,
+    "bar_chart": analyze_bar_chart,
+    "stacked_bar_chart": analyze_stacked_bar_chart,
+    "scatter_plot": analyze_scatter_plot,
+    "bubble_chart": analyze_bubble_chart,
+    "line_chart": analyze_line_chart,
+    "histogram": analyze_histogram,
+    "area_chart": analyze_area_chart,
+    "stacked_area_chart": analyze_stacked_area_chart,
+    "pie_chart": analyze_pie_chart,
+    "map": analyze_map,
+    "treemap": analyze_treemap,
+}
+
+IMREAD_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def decode_image(contents: bytes, reduction: int = 1) -> np.ndarray:
+    np_arr = np.frombuffer(contents, np.uint8)
+    image = cv2.imdecode(np_arr, IMREAD_FLAGS[reduction])
+    if image is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    return image
+
+# Results of recent analyses, reused for re-encoded or re-captured copies of a chart.
+near_duplicates = NearDuplicateCache(config.NEAR_DUPLICATE_ENTRIES,
+                                     max_difference=config.NEAR_DUPLICATE_DIFFERENCE)
+
+def run_analysis(chart_type: str, contents: bytes, debug: bool = False, options: Optional[Dict] = None,
+                 profile: Optional[str] = None, decoded: Optional[np.ndarray] = None) -> Dict:
+    """
+    Decodes an uploaded image and runs the analyzer for `chart_type` on it,
+    passing `options` to the analyzer as keyword arguments.
+
+    The image header is read first so the per-request memory budget can be
+    enforced before any pixels are decoded: an image whose estimated peak
+    would exceed the budget is decoded at 1/2, 1/4 or 1/8 size (and its
+    regions scaled back up), or rejected with 413 in "reject" mode.
+
+    With `debug`, the response carries a "debug" key with the traced peak
+    allocations of every stage. With `profile` ("collapsed" or "pstats"),
+    the analyzer run is profiled and "debug.profile" says where to fetch it.
+
+    `decoded` is the already decoded image of `contents` (a registered
+    asset); it is used as is unless the budget calls for a reduced decode.
+
+    With VISTRUCT_OCR, text regions (titles, x-axis ticks, treemap labels)
+    get their recognized "text".
+
+    Without debug or profile, a decoded image that near-duplicates a recent
+    one of the same chart type (and options) at the same resolution gets
+    that image's result without being analyzed.
+
+    Run with an active CancelToken (see run_analysis_in_worker), the
+    analysis stops with AnalysisCancelled once the token is cancelled, and
+    past the token's deadline skips its remaining stages and returns the
+    regions found so far with "truncated": true.
+    """
+    size = memory.image_size(contents) if decoded is None else decoded.shape[1::-1]
+    reduction = 1
+    if size is not None:
+        try:
+            reduction = memory.plan_decode_reduction(chart_type, *size)
+        except memory.MemoryBudgetExceeded as exc:
+            metrics.increment("analysis_budget_rejections", chart_type=chart_type)
+            raise HTTPException(status_code=413, detail=str(exc))
+
+    with memory.profile_request(debug or config.TRACE_MEMORY, required=debug) as memory_profile, buffers.request_scope():
+        with stage("decode"):
+            image = decoded if decoded is not None and reduction == 1 else decode_image(contents, reduction)
+        near_duplicate = None
+        if near_duplicates.max_entries > 0 and not debug and profile is None:
+            scope = (chart_type, json.dumps(options or {}, sort_keys=True))
+            cached, fingerprint, thumbnail = near_duplicates.lookup(scope, image)
+            metrics.increment("near_duplicate_hits" if cached is not None else "near_duplicate_misses",
+                              chart_type=chart_type)
+            if cached is not None:
+                return cached
+            near_duplicate = (scope, image.shape, fingerprint, thumbnail)
+        analyzer_options = options or {}
+        if reduction > 1 and analyzer_options.get("at"):
+            # Requested columns are in full-size pixels.
+            analyzer_options = {**analyzer_options, "at": [x * image.shape[1] // size[0] for x in analyzer_options["at"]]}
+        with stage("analyze"), profiling.profile_analysis(chart_type, contents, profile) as capture:
+            result = ANALYZERS[chart_type](image, **analyzer_options)
+        if config.OCR and ocr.available() and within_deadline():
+            with stage("ocr"):
+                ocr.read_text(image, result.get("regions", []))
+
+    height, width = image.shape[:2]
+    if reduction > 1:
+        metrics.increment("analysis_downscaled", chart_type=chart_type)
+        scale_regions(result["regions"], size[0] / width, size[1] / height)
+        if "points" in result:
+            scale_points(result["points"], size[0] / width, size[1] / height)
+        if "values" in result:
+            scale_values(result["values"], options["at"], size[1] / height)
+        # The density bounds and drill-down cell hold boxes too.
+        scale_regions([result[key] for key in ("density", "cell") if key in result],
+                      size[0] / width, size[1] / height)
+    if memory_profile is not None:
+        memory.record_observed_peak(chart_type, memory_profile, width * height)
+    if cancellation.truncated():
+        # Stopped at its deadline: what was found so far, never cached.
+        result["truncated"] = True
+        metrics.increment("analysis_truncated", chart_type=chart_type)
+    elif near_duplicate is not None:
+        near_duplicates.store(*near_duplicate, result)
+
+    if debug:
+        result["debug"] = {
+            "memory": {
+                **memory_profile.as_dict(),
+                "estimated_peak_bytes": memory.estimate_peak_bytes(chart_type, width, height),
+                "budget_bytes": memory.budget_bytes(),
+                "decode_reduction": reduction,
+            }
+        }
+    if profile is not None:
+        result.setdefault("debug", {})["profile"] = capture.summary()
     return result
 
+# Identical uploads to the same endpoint that arrive while the first is
+# still being analyzed share its result instead of running again.
+analysis_flight = SingleFlight("analyze")
+# Analysis slots shared by /analyze/* requests and background jobs (bulk).
+analysis_scheduler = Scheduler(config.ANALYSIS_CONCURRENCY, {"bulk": config.BULK_CONCURRENCY})
+
+async def run_analysis_in_worker(chart_type: str, contents: bytes, debug: bool = False,
+                                 options: Optional[Dict] = None, profile: Optional[str] = None,
+                                 decoded: Optional[np.ndarray] = None, priority: str = "interactive",
+                                 client: str = "") -> Dict:
+    """
+    Runs run_analysis in a worker thread once the scheduler grants a slot,
+    under the chart type's deadline. Cancelling the awaiting task cancels
+    the analysis itself: the thread stops at its next check, and the slot
+    is held until it has.
+    """
+    async with analysis_scheduler.slot(priority, client):
+        token = CancelToken(cancellation.deadline_for(chart_type))
+        work = asyncio.ensure_future(asyncio.to_thread(
+            cancellation.run, token, run_analysis, chart_type, contents, debug, options, profile, decoded))
+        try:
+            return await asyncio.shield(work)
+        except asyncio.CancelledError:
+            token.cancel()
+            metrics.increment("analysis_cancelled", chart_type=chart_type)
+            await asyncio.gather(work, return_exceptions=True)
+            raise
+
+# How often a waiting /analyze/* request checks whether its client is still there.
+DISCONNECT_POLL_SECONDS = 0.25
+
+async def unless_disconnected(request: Optional[Request], work: Awaitable[Dict]) -> Dict:
+    """
+    Awaits `work` while watching the client of `request`: if it disconnects
+    first (closed panel, proxy timeout), the work is cancelled and the
+    request ends with 499 (client closed request).
+    """
+    task = asyncio.ensure_future(work)
+    if request is None:
+        return await task
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        task.cancel()
+
+class AnalysisInput(NamedTuple):
+    contents: bytes
+    # Pixels of a registered asset, which need no decode.
+    decoded: Optional[np.ndarray] = None
+    # Scheduling class and fair-queuing key of the request.
+    priority: str = "interactive"
+    client: str = ""
+    # The request, watched for a disconnect while the analysis runs.
+    request: Optional[Request] = None
+
+async def analysis_input(request: Request, file: Optional[UploadFile] = File(None),
+                         asset: Optional[str] = None, x_priority: Optional[str] = Header(None),
+                         x_client_key: Optional[str] = Header(None)) -> AnalysisInput:
+    """
+    The image to analyze: an uploaded file, or with ?asset=<id> a chart
+    image the server loaded at startup from VISTRUCT_ASSET_DIR.
+
+    Analyses are scheduled as interactive unless an X-Priority: bulk header
+    says otherwise, and shared fairly between X-Client-Key values (the
+    client address without one).
+    """
+    priority = (x_priority or "interactive").lower()
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority: {priority}")
+    client = x_client_key or (request.client.host if request.client else "")
+    if asset is not None:
+        registered = request.app.state.assets.get(asset)
+        if registered is None:
+            raise HTTPException(status_code=404, detail=f"Unknown asset: {asset}")
+        metrics.increment("analysis_asset_requests")
+        return AnalysisInput(registered.contents, registered.image, priority, client, request)
+    if file is None:
+        raise HTTPException(status_code=400, detail="Upload a file or name an asset")
+    return AnalysisInput(await file.read(), None, priority, client, request)
+
+# Results built ahead of time by tools.build_annotations (indexed at startup).
+prebuilt_results = PrebuiltResults(config.PREBUILT_DIR, detector_version())
+
+def default_options(chart_type: str, options: Optional[Dict]) -> bool:
+    """
+    Whether `options` only repeat the analyzer's defaults, i.e. whether the
+    result is the one tools.build_annotations precomputes.
+    """
+    parameters = inspect.signature(ANALYZERS[chart_type]).parameters
+    return all(name in parameters and parameters[name].default == value
+               for name, value in (options or {}).items())
+
+async def analyze_upload(chart_type: str, source: AnalysisInput, debug: bool = False,
+                         options: Optional[Dict] = None, profile: Optional[str] = None) -> Dict:
+    contents, decoded, priority, client, request = source
+    if not debug and profile is None and len(prebuilt_results) and default_options(chart_type, options):
+        result = prebuilt_results.get(chart_type, content_hash(contents))
+        metrics.increment("analysis_prebuilt_hits" if result is not None else "analysis_prebuilt_misses",
+                          chart_type=chart_type)
+        if result is not None:
+            return result
+    if profile is not None:
+        # A profiled request must run itself rather than share another's result.
+        return await unless_disconnected(request, run_analysis_in_worker(
+            chart_type, contents, debug, options, profile, decoded, priority, client))
+    key = analysis_key(chart_type, contents, debug, options)
+    # Identical requests share the first one's place in the schedule.
+    return await unless_disconnected(request, analysis_flight.do(
+        key, lambda: run_analysis_in_worker(chart_type, contents, debug, options, decoded=decoded,
+                                            priority=priority, client=client)))
+
+def requested_profile(profile: Optional[str] = None, x_profile: Optional[str] = Header(None)) -> Optional[str]:
+    """
+    The profile format asked for with ?profile= or an X-Profile header:
+    "collapsed" (sampled stacks; also "1"/"true") or "pstats" (cProfile).
+    Only honored when the server enables VISTRUCT_PROFILING.
+    """
+    value = profile or x_profile
+    if not value or value.lower() in ("0", "false"):
+        return None
+    if not config.PROFILING:
+        raise HTTPException(status_code=403, detail="Profiling is disabled on this server")
+    value = value.lower()
+    if value in ("1", "true"):
+        return "collapsed"
+    if value not in profiling.PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown profile format: {value}")
+    return value
+
+def requested_aggregation(grid: Optional[int] = None, cell: Optional[str] = None) -> Dict:
+    """
+    Analyzer options for the aggregated output of scatter and bubble charts:
+    ?grid=N returns mark counts on an N-column grid instead of one region
+    per mark, and ?grid=N&cell=COLUMN,ROW drills into one cell of it.
+    """
+    if grid is None:
+        if cell is not None:
+            raise HTTPException(status_code=400, detail="cell requires grid")
+        return {}
+    if not 1 <= grid <= MAX_GRID:
+        raise HTTPException(status_code=400, detail=f"grid must be between 1 and {MAX_GRID}")
+    if cell is None:
+        return {"grid": grid}
+    try:
+        column, row = (int(part) for part in cell.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cell must be COLUMN,ROW")
+    return {"grid": grid, "cell": [column, row]}
+
+# Most columns one request may ask series values at (?at=).
+MAX_VALUE_COLUMNS = 1000
+
+def requested_samples(samples: Optional[int], at: Optional[List[int]] = None) -> Optional[Dict]:
+    options = {}
+    if samples is not None:
+        if samples < 1:
+            raise HTTPException(status_code=400, detail="samples must be at least 1")
+        options["samples"] = samples
+    if at:
+        if len(at) > MAX_VALUE_COLUMNS:
+            raise HTTPException(status_code=400, detail=f"at takes at most {MAX_VALUE_COLUMNS} columns")
+        if min(at) < 0:
+            raise HTTPException(status_code=400, detail="at columns must not be negative")
+        options["at"] = at
+    return options or None
+
+
+@app.post("/analyze/100_stacked_bar_chart")
+async def endpoint_chart_surface_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("100_stacked_bar_chart", source, debug, profile=profile)
+
 @app.post("/analyze/line_chart")
-async def endpoint_chart_line_line(file: UploadFile = File(...)):
-    result = await analyze_line_chart(file)
-    return result
+async def endpoint_chart_line_line(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        samples: Optional[int] = None, at: Optional[List[int]] = Query(None),
+        profile: Optional[str] = Depends(requested_profile)):
+    # samples=N adds every series' position at N evenly spaced columns as
+    # "points"; at=X (repeatable) its position at column X as "values".
+    return await analyze_upload("line_chart", source, debug, requested_samples(samples, at), profile)
 
 @app.post("/analyze/area_chart")
-async def endpoint_chart_area_vary(file: UploadFile = File(...)):
-    result = await analyze_area_chart(file)
-    return result
+async def endpoint_chart_area_vary(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        samples: Optional[int] = None, at: Optional[List[int]] = Query(None),
+        profile: Optional[str] = Depends(requested_profile)):
+    # samples=N adds every series' position at N evenly spaced columns as
+    # "points"; at=X (repeatable) its position at column X as "values".
+    return await analyze_upload("area_chart", source, debug, requested_samples(samples, at), profile)
 
 @app.post("/analyze/scatter_plot")
-async def endpoint_chart_point_circle(file: UploadFile = File(...)):
-    result = await analyze_scatter_plot(file)
-    return result
+async def endpoint_chart_point_circle(source: AnalysisInput = Depends(analysis_input), debug: bool = False, dense: bool = False,
+        aggregation: Dict = Depends(requested_aggregation),
+        profile: Optional[str] = Depends(requested_profile)):
+    # dense=true returns point centers (split out of overlapping dots) instead of dot regions.
+    return await analyze_upload("scatter_plot", source, debug, {"dense": dense, **aggregation}, profile)
 
 @app.post("/analyze/bubble_chart")
-async def endpoint_chart_point_circle(file: UploadFile = File(...)):
-    result = await analyze_bubble_chart(file)
-    return result
+async def endpoint_chart_point_circle(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        aggregation: Dict = Depends(requested_aggregation),
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("bubble_chart", source, debug, aggregation or None, profile)
 
 @app.post("/analyze/bar_chart")
-async def endpoint_chart_rectangular_rectangular(file: UploadFile = File(...)):
-    result = await analyze_bar_chart(file)
-    return result
+async def endpoint_chart_rectangular_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("bar_chart", source, debug, profile=profile)
 
 @app.post("/analyze/stacked_bar_chart")
-async def endpoint_chart_rectangular_rectangular(file: UploadFile = File(...)):
-    result = await analyze_stacked_bar_chart(file)
-    return result
+async def endpoint_chart_rectangular_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("stacked_bar_chart", source, debug, profile=profile)
 
 @app.post("/analyze/histogram")
-async def endpoint_chart_rectangular_rectangular(file: UploadFile = File(...)):
-    result = await analyze_histogram(file)
-    return result
+async def endpoint_chart_rectangular_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("histogram", source, debug, profile=profile)
 
 @app.post("/analyze/stacked_area_chart")
-async def endpoint_chart_rectangular_rectangular(file: UploadFile = File(...)):
-    result = await analyze_stacked_area_chart(file)
-    return result
+async def endpoint_chart_rectangular_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("stacked_area_chart", source, debug, profile=profile)
 
 @app.post("/analyze/pie_chart")
-async def endpoint_chart_rectangular_rectangular(file: UploadFile = File(...)):
-    result = await analyze_pie_chart(file)
-    return result
+async def endpoint_chart_rectangular_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+                                                 rect_mode: Literal["exact", "approx"] = "exact",
+                                                 profile: Optional[str] = Depends(requested_profile)):
+    # rect_mode=approx trades a few pixels of slice rectangle for much less work.
+    return await analyze_upload("pie_chart", source, debug, {"rect_mode": rect_mode}, profile)
 
 @app.post("/analyze/map")
-async def endpoint_chart_rectangular_rectangular(file: UploadFile = File(...)):
-    result = await analyze_map(file)
-    return result
+async def endpoint_chart_rectangular_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("map", source, debug, profile=profile)
 
 @app.post("/analyze/treemap")
-async def endpoint_chart_rectangular_rectangular(file: UploadFile = File(...)):
-    result = await analyze_treemap(file)
-    return result
+async def endpoint_chart_rectangular_rectangular(source: AnalysisInput = Depends(analysis_input), debug: bool = False,
+        profile: Optional[str] = Depends(requested_profile)):
+    return await analyze_upload("treemap", source, debug, profile=profile)
+
+def rectangular_marks(image: np.ndarray, colors: List[str]) -> List[Dict]:
+    return detect_multiple_colors(image, "rectangular", colors, expected_count=None)["regions"]
+
+def dot_marks(image: np.ndarray, colors: List[str]) -> List[Dict]:
+    return detect_scatterplot_dots(image, colors)["regions"]
+
+# Mark detectors that find the same marks in a crop as in the whole chart,
+# used to update streamed frames where only marks changed: the labels of
+# the regions they return, and the detector.
+STREAM_MARKS = {
+    "100_stacked_bar_chart": (("rectangular region",), rectangular_marks),
+    "bar_chart": (("rectangular region",), rectangular_marks),
+    "stacked_bar_chart": (("rectangular region",), rectangular_marks),
+    "histogram": (("rectangular region",), rectangular_marks),
+    "scatter_plot": (("series-legend-item",), dot_marks),
+}
+
+@app.websocket("/analyze/{chart_type}/stream")
+async def stream_analysis(websocket: WebSocket, chart_type: str):
+    """
+    Analyzes a stream of screenshots of one chart. Every binary message is
+    an encoded frame and is answered with {"frame", "result", "update"}.
+    The connection keeps the previous frame and its result, so a frame
+    identical to it costs a diff, and one where only data marks changed
+    only re-detects the marks around the change (see FrameStream).
+    """
+    await websocket.accept()
+    if chart_type not in ANALYZERS:
+        await websocket.close(code=4404, reason=f"Unknown chart type: {chart_type}")
+        return
+    mark_labels, detect_marks = STREAM_MARKS.get(chart_type, ((), None))
+    stream = FrameStream(lambda frame, contents: run_analysis(chart_type, contents, decoded=frame),
+                         mark_labels, detect_marks, config.STREAM_TILE, config.STREAM_THRESHOLD)
+    client = websocket.client.host if websocket.client else ""
+    frame_number = 0
+    try:
+        while True:
+            contents = await websocket.receive_bytes()
+            start = time.perf_counter()
+            try:
+                async with analysis_scheduler.slot("interactive", client):
+                    frame = await asyncio.to_thread(decode_image, contents)
+                    result, update = await asyncio.to_thread(stream.update, frame, contents)
+            except HTTPException as exc:
+                await websocket.send_json({"frame": frame_number, "error": exc.detail})
+            else:
+                update["ms"] = round((time.perf_counter() - start) * 1000, 1)
+                metrics.observe("stream_frame_seconds", time.perf_counter() - start, mode=update["mode"])
+                await websocket.send_json({"frame": frame_number, "result": result, "update": update})
+            frame_number += 1
+    except WebSocketDisconnect:
+        pass
+
+@app.post("/palette")
+async def endpoint_palette(file: UploadFile = File(...), max_colors: int = 12, min_fraction: float = 0.002):
+    contents = await file.read()
+    image = decode_image(contents)
+    return discover_palette(image, max_colors=max_colors, min_fraction=min_fraction)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
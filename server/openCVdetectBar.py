@@ -1,24 +1,9 @@
 import cv2
 import numpy as np
+from app.buffers import pooled, scratch
+from app.layout import layout_cached
+from openCVdetectGlyphs import detect_text_boxes, glyph_boxes, extract_glyphs
 
-def detect_text_boxes(image: np.ndarray):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    thresh = cv2.adaptiveThreshold(
-        gray, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV,
-        15, 4
-    )
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=1)
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    boxes = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        if w < 5 or h < 5:
-            continue
-        boxes.append((x, y, w, h))
-    return boxes
 
 def group_boxes_by_alignment(boxes, alignment='vertical', x_delta=15, y_delta=15):
     groups = []
@@ -63,6 +48,7 @@ def unify_component_bounding_box(groups, label_name: str):
         "color": "#000000"
     }
 
+@layout_cached
 def detect_title(img: np.ndarray):
     """
     Detects the chart title in an image.
@@ -88,6 +74,7 @@ def detect_title(img: np.ndarray):
         "regions": [title_box]
     }
 
+@layout_cached
 def detect_axes_and_title_with_legends(img: np.ndarray):
     text_boxes = detect_text_boxes(img)
     height, width = img.shape[:2]
@@ -145,45 +132,31 @@ def detect_axes_and_title_with_legends(img: np.ndarray):
 import cv2
 import numpy as np
 
+@layout_cached
+@pooled
 def detect_legend_items(image: np.ndarray):
     height, width = image.shape[:2]
     legend_region = image[0:int(height * 0.3), int(width * 0.7):width]
+    plane = legend_region.shape[:2]
 
-    hsv = cv2.cvtColor(legend_region, cv2.COLOR_BGR2HSV)
+    hsv = cv2.cvtColor(legend_region, cv2.COLOR_BGR2HSV, dst=scratch(legend_region.shape))
 
     # Create a mask for non-white regions (likely color patches)
     lower = np.array([0, 50, 50])  # adjust as needed
     upper = np.array([180, 255, 255])
-    color_mask = cv2.inRange(hsv, lower, upper)
+    color_mask = cv2.inRange(hsv, lower, upper, dst=scratch(plane))
 
     # Morphological clean-up
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_OPEN, kernel, iterations=1, dst=scratch(plane))
 
-    # Detect contours for color patches
-    contours, _ = cv2.findContours(color_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    patches = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        area = w * h
-        if 10 < area < 5000:
-            patches.append((x, y, w, h))
+    # Detect contours for color patches (10 < w * h < 5000)
+    patches = [tuple(box) for box in glyph_boxes(color_mask, min_area=11, max_area=4999).tolist()]
 
     # Detect text boxes in legend region
-    gray = cv2.cvtColor(legend_region, cv2.COLOR_BGR2GRAY)
-    text_thresh = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV, 15, 4
-    )
-    closed = cv2.morphologyEx(text_thresh, cv2.MORPH_CLOSE, kernel, iterations=1)
-    text_contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    text_boxes = []
-    for cnt in text_contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        if w > 5 and h > 5:
-            text_boxes.append((x, y, w, h))
+    text_boxes = extract_glyphs(legend_region, method="adaptive_gaussian", block_size=15, c=4,
+                                close_kernel=(3, 3), min_width=6, min_height=6)
+    text_boxes = [tuple(box) for box in text_boxes.tolist()]
 
     # Pair color patches with nearest text boxes
     legend_items = []
@@ -230,6 +203,7 @@ import cv2
 import numpy as np
 import json
 
+@pooled
 def detect_specific_color_region(image, shape, target_hex, expected_count):
     # Convert hex to BGR (OpenCV uses BGR)
     target_rgb = tuple(int(target_hex[i:i+2], 16) for i in (1, 3, 5))
@@ -244,7 +218,7 @@ def detect_specific_color_region(image, shape, target_hex, expected_count):
     # Create mask for target color
     lower_bound = np.array([max(0, c - color_tolerance) for c in target_bgr], dtype=np.uint8)
     upper_bound = np.array([min(255, c + color_tolerance) for c in target_bgr], dtype=np.uint8)
-    mask = cv2.inRange(image, lower_bound, upper_bound)
+    mask = cv2.inRange(image, lower_bound, upper_bound, dst=scratch(image.shape[:2]))
 
     # Find contours
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
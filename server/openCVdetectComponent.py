@@ -1,25 +1,9 @@
 import cv2
 import numpy as np
 from typing import Dict
+from app.buffers import pooled, scratch
+from openCVdetectGlyphs import detect_text_boxes
 
-def detect_text_boxes(image: np.ndarray):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    thresh = cv2.adaptiveThreshold(
-        gray, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV,
-        15, 4
-    )
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=1)
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    boxes = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        if w < 5 or h < 5:
-            continue
-        boxes.append((x, y, w, h))
-    return boxes
 
 def group_boxes_by_alignment(boxes, alignment='vertical', x_delta=15, y_delta=15):
     groups = []
@@ -147,6 +131,7 @@ def detect_chart_title(image: np.ndarray):
 import cv2
 import numpy as np
 
+@pooled
 def detect_specific_color_region(image, shape, target_hex, expected_count, indices=None, fallback_behavior='keep_detected'):
     """
     Detect regions in the image that match the target_hex color.
@@ -174,7 +159,7 @@ def detect_specific_color_region(image, shape, target_hex, expected_count, indic
     # Create mask for target color
     lower_bound = np.array([max(0, c - color_tolerance) for c in target_bgr], dtype=np.uint8)
     upper_bound = np.array([min(255, c + color_tolerance) for c in target_bgr], dtype=np.uint8)
-    mask = cv2.inRange(image, lower_bound, upper_bound)
+    mask = cv2.inRange(image, lower_bound, upper_bound, dst=scratch(image.shape[:2]))
 
     # Find contours in the mask
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -1,7 +1,10 @@
 import cv2
 import numpy as np
 import math
+from app.buffers import pooled, scratch
+from openCVdetectGlyphs import detect_text_boxes, extract_glyphs
 
+@pooled
 def detect_scatterplot_dots(image: np.ndarray, color_list, min_area=10, max_area=200, offsetX=0):
     """
     Detects small colored dots in a scatterplot based on a list of target color hex codes.
@@ -30,11 +33,11 @@ def detect_scatterplot_dots(image: np.ndarray, color_list, min_area=10, max_area
         upper_bound = np.array([min(255, c + color_tolerance) for c in target_bgr], dtype=np.uint8)
 
         # Create a mask for the target color
-        mask = cv2.inRange(image, lower_bound, upper_bound)
+        mask = cv2.inRange(image, lower_bound, upper_bound, dst=scratch(image.shape[:2]))
         
         # Optional: clean up noise with a morphological opening
         kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1, dst=scratch(image.shape[:2]))
         
         # Find contours from the mask
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -64,6 +67,72 @@ def detect_scatterplot_dots(image: np.ndarray, color_list, min_area=10, max_area
 # colors = ['#ff0000', '#00ff00', '#0000ff']  # Example: red, green, blue
 # result = detect_scatterplot_dots(image, colors)
 # print(result)
+
+@pooled
+def detect_dense_points(image: np.ndarray, color_list, color_tolerance=30, radius=None, min_peak=0.5):
+    """
+    Recovers point centers in dense scatterplots, where overlapping dots
+    merge into blobs that detect_scatterplot_dots would drop.
+
+    Every dot center is a peak of the distance transform of the color mask
+    (its distance to the background is the dot radius), and two overlapping
+    dots keep separate peaks as long as their centers are more than half a
+    radius apart. Peaks are found with a dilation, so the cost depends on
+    the image size rather than the number of points.
+
+    Parameters:
+      - image: Input image as a NumPy array (BGR format).
+      - color_list: List of color hex strings.
+      - color_tolerance: Tolerance for color thresholding.
+      - radius: Dot radius in pixels; estimated from the peaks when None.
+      - min_peak: Peaks lower than min_peak * radius (thin slivers) are ignored.
+
+    Returns:
+      A list with one dict per color:
+         - "color": The hex color.
+         - "radius": The dot radius used.
+         - "centers": An (N, 2) float32 array of (x, y) point centers.
+    """
+    plane = image.shape[:2]
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    results = []
+    for color_hex in color_list:
+        target_rgb = tuple(int(color_hex[i:i+2], 16) for i in (1, 3, 5))
+        target_bgr = target_rgb[::-1]
+        lower_bound = np.array([max(0, c - color_tolerance) for c in target_bgr], dtype=np.uint8)
+        upper_bound = np.array([min(255, c + color_tolerance) for c in target_bgr], dtype=np.uint8)
+        mask = cv2.inRange(image, lower_bound, upper_bound, dst=scratch(plane))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1, dst=scratch(plane))
+
+        dist = cv2.distanceTransform(mask, cv2.DIST_L2, cv2.DIST_MASK_5, dst=scratch(plane, np.float32))
+        dot_radius = radius
+        if dot_radius is None:
+            # Local maxima of at least 1.5px are dot centers (or ridges of
+            # merged blobs); their median height is the typical radius.
+            local_max = cv2.dilate(dist, kernel, dst=scratch(plane, np.float32))
+            heights = dist[(dist >= local_max) & (dist >= 1.5)]
+            if heights.size == 0:
+                results.append({"color": color_hex, "radius": 0.0, "centers": np.empty((0, 2), np.float32)})
+                continue
+            dot_radius = float(np.median(heights))
+
+        window = 2 * max(1, int(round(dot_radius / 2))) + 1
+        neighborhood = cv2.dilate(dist, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (window, window)),
+                                  dst=scratch(plane, np.float32))
+        peaks = scratch(plane)
+        np.greater_equal(dist, neighborhood, out=peaks.view(bool))
+        peaks &= (dist >= max(1.0, min_peak * dot_radius))
+
+        # A flat peak spans several pixels; each connected patch is one center.
+        count, _, _, centroids = cv2.connectedComponentsWithStats(peaks, connectivity=8)
+        results.append({
+            "color": color_hex,
+            "radius": dot_radius,
+            "centers": centroids[1:count].astype(np.float32),
+        })
+    return results
+
+@pooled
 def detect_colored_bubbles(image: np.ndarray, target_hex: str, expected_count=None,
                              color_tolerance=30, circularity_thresh=0.7, min_area=1):
     """
@@ -93,11 +162,11 @@ def detect_colored_bubbles(image: np.ndarray, target_hex: str, expected_count=No
     upper_bound = np.array([min(255, c + color_tolerance) for c in target_bgr], dtype=np.uint8)
     
     # Create a mask that isolates the target color regions
-    mask = cv2.inRange(image, lower_bound, upper_bound)
+    mask = cv2.inRange(image, lower_bound, upper_bound, dst=scratch(image.shape[:2]))
     
     # Clean up noise with a morphological opening
     kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2, dst=scratch(image.shape[:2]))
     
     # Find contours from the mask
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -137,31 +206,6 @@ def detect_colored_bubbles(image: np.ndarray, target_hex: str, expected_count=No
          "match": (expected_count is None or len(regions) == expected_count)
     }
 
-    
-def detect_text_boxes(image: np.ndarray):
-    """
-    Detect potential text regions in an image using adaptive thresholding and contour detection.
-    Returns a list of bounding boxes (x, y, width, height) for candidate text areas.
-    """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    thresh = cv2.adaptiveThreshold(
-        gray, 255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV,
-        15, 4
-    )
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=1)
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    boxes = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        if w < 5 or h < 5:
-            continue
-        boxes.append((x, y, w, h))
-    return boxes
-
 
 def detect_bubble_labels(image: np.ndarray, bubbles: list, y_tolerance=30, x_margin=5, roi_width=100):
     """
@@ -246,6 +290,7 @@ def detect_bubble_labels(image: np.ndarray, bubbles: list, y_tolerance=30, x_mar
     return {"regions": labels}
 
 
+@pooled
 def detect_bubble_legend_items(image: np.ndarray, expected_count: int):
     """
     Detects legend items in a bubble chart where the legends are located in the
@@ -268,26 +313,11 @@ def detect_bubble_legend_items(image: np.ndarray, expected_count: int):
     offsetX = int(width * 0.7)
     legend_region = image[0:int(height * 0.3), offsetX:width]
     
-    # Convert the legend region to grayscale.
-    gray = cv2.cvtColor(legend_region, cv2.COLOR_BGR2GRAY)
-    
-    # Apply a binary inverse threshold to detect dark (black) regions.
-    # Pixels below 50 (dark) become white (foreground) after inversion.
-    ret, thresh = cv2.threshold(gray, 50, 255, cv2.THRESH_BINARY_INV)
-    
-    # Use a morphological closing to fill gaps in the black borders.
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=1)
-    
-    # Find contours in the processed image.
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    boxes = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        # Filter out very small contours (noise).
-        if w < 10 or h < 10:
-            continue
-        boxes.append((x, y, w, h))
+    # Dark (black) regions below 50 become foreground; a closing fills gaps in
+    # the borders, and contours smaller than 10px on a side are noise.
+    boxes = extract_glyphs(legend_region, method="fixed", threshold=50,
+                           close_kernel=(3, 3), min_width=10, min_height=10)
+    boxes = [tuple(box) for box in boxes.tolist()]
     
     # Sort boxes by area (largest first).
     boxes = sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
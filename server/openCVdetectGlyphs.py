@@ -0,0 +1,175 @@
+import cv2
+import numpy as np
+from app.buffers import pooled, scratch
+
+# What a 2x2 window covering 0-4 pixels of a component misses of its area,
+# as counted by outline_areas.
+WINDOW_MISSES = np.zeros(256, dtype=np.float64)
+WINDOW_MISSES[1:4] = 1, 2, 1
+
+def binarize_glyphs(image: np.ndarray, method="adaptive_gaussian", block_size=15, c=4, threshold=50,
+                    blur=False, close_kernel=None, open_kernel=None):
+    """
+    Turns an image into a mask where dark glyphs (text, borders) are white.
+
+    Parameters:
+      - image: Input image (BGR or grayscale) as a NumPy array.
+      - method: "adaptive_gaussian", "adaptive_mean", "otsu" or "fixed".
+      - block_size, c: Adaptive threshold neighborhood size and offset.
+      - threshold: Cut-off for the "fixed" method (pixels darker than it are glyphs).
+      - blur: Apply a 3x3 Gaussian blur before thresholding.
+      - close_kernel: (w, h) of a rectangular closing applied to the mask, or None.
+      - open_kernel: (w, h) of a rectangular opening applied to the mask, or None.
+
+    Returns:
+      A uint8 mask of the image's height and width. It is a scratch buffer, so
+      callers outside extract_glyphs must be inside their own lease scope.
+    """
+    plane = image.shape[:2]
+    if image.ndim == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=scratch(plane))
+    else:
+        gray = image
+    if blur:
+        gray = cv2.GaussianBlur(gray, (3, 3), 0, dst=scratch(plane))
+
+    if method == "adaptive_gaussian":
+        mask = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY_INV, block_size, c, dst=scratch(plane))
+    elif method == "adaptive_mean":
+        mask = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                     cv2.THRESH_BINARY_INV, block_size, c, dst=scratch(plane))
+    elif method == "otsu":
+        _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=scratch(plane))
+    elif method == "fixed":
+        _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV, dst=scratch(plane))
+    else:
+        raise ValueError(f"Unknown binarization method: {method}")
+
+    if close_kernel is not None:
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, close_kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1, dst=scratch(plane))
+    if open_kernel is not None:
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, open_kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, dst=scratch(plane))
+    return mask
+
+def filled_components(mask: np.ndarray):
+    """
+    Labels the external blobs of a mask: its 8-connected components once
+    every hole (background not connected to the image border) is filled, so
+    each one covers exactly what an external contour of the mask encloses.
+
+    Returns:
+      (count, labels, stats) as from cv2.connectedComponentsWithStats,
+      background being label 0, for the mask padded with one pixel of
+      background on every side (x and y are one more than in the mask).
+    """
+    padded = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    outside = padded.copy()
+    cv2.floodFill(outside, None, (0, 0), 255)
+    filled = cv2.bitwise_or(padded, cv2.bitwise_not(outside, dst=outside), dst=padded)
+    ltype = cv2.CV_16U if cv2.countNonZero(filled) < 2**16 - 1 else cv2.CV_32S
+    count, labels, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+        filled, 8, ltype, cv2.CCL_GRANA)
+    return count, labels, stats
+
+def outline_areas(labels: np.ndarray, stats: np.ndarray) -> np.ndarray:
+    """
+    cv2.contourArea of every component's external outline, whose polygon
+    runs through the centers of its boundary pixels, from the padded labels
+    of filled_components.
+
+    A 2x2 window of pixels adds 1 to the area when the component covers all
+    four and 1/2 when it covers three. As every pixel lies in 4 windows,
+    that is the pixel count less a quarter of WINDOW_MISSES over the
+    windows on the boundary.
+    """
+    on = (labels != 0).view(np.uint8)
+    inside = on[:-1, :-1] + on[:-1, 1:] + on[1:, :-1] + on[1:, 1:]
+    # All the pixels of a window belong to one component.
+    owner = cv2.max(cv2.max(labels[:-1, :-1], labels[:-1, 1:]),
+                    cv2.max(labels[1:, :-1], labels[1:, 1:]))
+    missed = np.bincount(owner.ravel(), weights=cv2.LUT(inside, WINDOW_MISSES).ravel(),
+                         minlength=len(stats))
+    return stats[:, cv2.CC_STAT_AREA] - missed / 4
+
+def contour_order(labels: np.ndarray, stats: np.ndarray) -> np.ndarray:
+    """
+    Orders components (rows of stats after the background) the way
+    cv2.findContours lists their external contours: by the raster position
+    of their first pixel, the leftmost of their top row, last first.
+    """
+    x, y, w = stats[1:, 0], stats[1:, 1], stats[1:, 2]
+    if not len(w):
+        return np.empty(0, dtype=np.intp)
+    # The top row of every box, one segment per component.
+    starts = np.cumsum(w) - w
+    columns = np.arange(w.sum()) - np.repeat(starts, w)
+    owners = np.repeat(np.arange(1, len(w) + 1), w)
+    found = labels[np.repeat(y, w), np.repeat(x, w) + columns] == owners
+    first = np.minimum.reduceat(np.where(found, columns, w.max()), starts)
+    return np.argsort(-(y.astype(np.int64) * labels.shape[1] + x + first))
+
+def glyph_boxes(mask: np.ndarray, min_width=0, min_height=0, min_area=None, max_area=None,
+                area_measure="box", max_aspect=None):
+    """
+    Finds the external blobs of a mask and filters them by size.
+
+    Parameters:
+      - mask: uint8 mask with glyphs in white.
+      - min_width, min_height: Minimum bounding-box size in pixels.
+      - min_area, max_area: Inclusive area bounds, or None.
+      - area_measure: "box" (w * h) or "contour" (cv2.contourArea of the outline).
+      - max_aspect: Maximum of w/h and h/w, or None.
+
+    Returns:
+      An (N, 4) int32 array of [x, y, w, h] boxes in contour order.
+    """
+    _, labels, stats = filled_components(mask)
+    order = contour_order(labels, stats)
+    boxes = stats[1:, :4][order].astype(np.int32)
+    boxes[:, :2] -= 1
+    w, h = boxes[:, 2], boxes[:, 3]
+
+    keep = (w >= min_width) & (h >= min_height)
+    if max_aspect is not None:
+        keep &= np.maximum(w, h) <= max_aspect * np.minimum(w, h)
+    if min_area is not None or max_area is not None:
+        if area_measure == "contour":
+            areas = outline_areas(labels, stats)[1:][order]
+        else:
+            areas = w.astype(np.int64) * h
+        if min_area is not None:
+            keep &= areas >= min_area
+        if max_area is not None:
+            keep &= areas <= max_area
+    return boxes[keep]
+
+@pooled
+def extract_glyphs(image: np.ndarray, method="adaptive_gaussian", block_size=15, c=4, threshold=50,
+                   blur=False, close_kernel=None, open_kernel=None, min_width=0, min_height=0,
+                   min_area=None, max_area=None, area_measure="box", max_aspect=None):
+    """
+    Glyph-extraction engine shared by the text and character detectors:
+    binarizes the image (see binarize_glyphs) and returns the filtered blob
+    boxes (see glyph_boxes) as an (N, 4) int32 array of [x, y, w, h].
+    """
+    mask = binarize_glyphs(image, method=method, block_size=block_size, c=c, threshold=threshold,
+                           blur=blur, close_kernel=close_kernel, open_kernel=open_kernel)
+    return glyph_boxes(mask, min_width=min_width, min_height=min_height, min_area=min_area,
+                       max_area=max_area, area_measure=area_measure, max_aspect=max_aspect)
+
+def detect_text_boxes(image: np.ndarray):
+    """
+    Detect potential text regions in an image using adaptive thresholding and contour detection.
+    Returns a list of bounding boxes (x, y, width, height) for candidate text areas.
+    """
+    boxes = extract_glyphs(image, method="adaptive_gaussian", block_size=15, c=4,
+                           close_kernel=(3, 3), min_width=5, min_height=5)
+    return [tuple(box) for box in boxes.tolist()]
+
+# Example usage:
+# image = cv2.imread("line_chart.png")
+# boxes = extract_glyphs(image, method="adaptive_mean", block_size=11, c=2, min_area=30, max_area=1000)
+# print(boxes)
@@ -0,0 +1,237 @@
+import colorsys
+import cv2
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+from app.buffers import pooled, scratch
+from openCVdetectPalette import discover_palette
+
+# HSV ranges (OpenCV scale: H 0-180, S and V 0-255).
+WHITE_RANGE = (np.array([0, 0, 200]), np.array([180, 30, 255]))
+# The blue (#3282bd) of our line and area charts.
+BLUE_RANGE = (np.array([90, 100, 50]), np.array([110, 255, 255]))
+
+def hsv_ranges(color_hex: str, hue_tolerance=10, min_saturation=100, min_value=50) -> List[Tuple]:
+    """
+    HSV ranges matching a series color: its hue +- hue_tolerance, split in
+    two when the window wraps around red.
+    """
+    hue = hex_hsv(color_hex)[0]
+    low, high = int(round(hue - hue_tolerance)), int(round(hue + hue_tolerance))
+    windows = [(max(low, 0), min(high, 180))]
+    if low < 0:
+        windows.append((180 + low, 180))
+    if high > 180:
+        windows.append((0, high - 180))
+    return [(np.array([lo, min_saturation, min_value]), np.array([hi, 255, 255])) for lo, hi in windows]
+
+def hex_hsv(color_hex: str) -> Tuple[float, float, float]:
+    # (hue 0-180, saturation 0-255, value 0-255), as OpenCV scales them.
+    r, g, b = (int(color_hex[i:i+2], 16) / 255 for i in (1, 3, 5))
+    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+    return h * 180, s * 255, v * 255
+
+def line_series(image: np.ndarray, expected: Sequence[str] = ('#3282bd',),
+                plot: Optional[Tuple[int, int, int, int]] = None, max_series=8, hue_tolerance=10,
+                min_saturation=100, min_value=50, min_span=0.5) -> List[str]:
+    """
+    The series colors of a line or area chart: the `expected` colors
+    (always, present or not), then other dominant colors of the plot area
+    that look like a series. A discovered color must be saturated, its hue
+    more than 2 * hue_tolerance from every series already found (closer
+    ones are an area fill or anti-aliasing of that series), and it must
+    run through at least `min_span` of the plot's columns, so a logo,
+    colored title or legend swatch is not taken for a series.
+
+    Parameters:
+      - image: Input image (BGR format) as a NumPy array.
+      - expected: The chart's own series colors.
+      - plot: (left, top, right, bottom) of the plot area, or None for the
+        whole image.
+      - max_series: Maximum number of colors returned.
+      - hue_tolerance, min_saturation, min_value: As for hsv_ranges.
+      - min_span: Fraction of the plot's columns a discovered series must reach.
+    """
+    if plot is not None:
+        left, top, right, bottom = plot
+        image = image[top:bottom, left:right]
+    colors = list(expected)
+    if image.size == 0:
+        return colors
+    hues = [hex_hsv(color)[0] for color in colors]
+    hsv = None
+    for entry in discover_palette(image, max_colors=max_series * 2)["colors"]:
+        if len(colors) >= max_series:
+            break
+        hue, saturation, value = hex_hsv(entry["color"])
+        if saturation < min_saturation or value < min_value:
+            continue
+        if any(min(abs(hue - other), 180 - abs(hue - other)) <= 2 * hue_tolerance for other in hues):
+            continue
+        if hsv is None:
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        columns = np.zeros(image.shape[1], dtype=bool)
+        for lower, upper in hsv_ranges(entry["color"], hue_tolerance, min_saturation, min_value):
+            columns |= cv2.inRange(hsv, lower, upper).any(axis=0)
+        if columns.sum() < min_span * image.shape[1]:
+            continue
+        colors.append(entry["color"])
+        hues.append(hue)
+    return colors
+
+def series_ranges(colors: Sequence[str]) -> List[List[Tuple]]:
+    """
+    The HSV ranges of each series color for trace_lines: BLUE_RANGE for our
+    default blue, hsv_ranges for any other color.
+    """
+    return [[BLUE_RANGE] if color.lower() == '#3282bd' else hsv_ranges(color) for color in colors]
+
+
+class LineTrace:
+    """
+    Where every series of a line or area chart lies in every column,
+    computed once per image.
+
+    `labels` holds 1 + the series index of each pixel (0 elsewhere) and
+    `white` the background mask. `top[s, x]` is the first pixel of series s
+    below the first white pixel of column x (-1 if there is none), so the
+    value of a series at any x is a lookup.
+    """
+
+    def __init__(self, labels: np.ndarray, white: np.ndarray, series_count: int):
+        self.labels = labels
+        self.white = white
+        self.series_count = series_count
+        self.top = self._top_edges()
+
+    def _top_edges(self) -> np.ndarray:
+        H, W = self.labels.shape
+        columns = np.arange(W)
+        # argmax finds the first True row of every column at once; a column
+        # without any True row gives 0, told apart by reading that pixel.
+        first_white = self.white.argmax(axis=0)
+        first_white[~self.white[first_white, columns]] = H
+        top = np.full((self.series_count, W), -1, dtype=np.int32)
+        for series in range(self.series_count):
+            own = self.labels == series + 1
+            first = own.argmax(axis=0)
+            present = own[first, columns]
+            below = present & (first > first_white)
+            top[series, below] = first[below]
+            # Columns where the series starts above the first white pixel
+            # (rare: a series touching the top) need the first pixel past it.
+            redo = np.flatnonzero(present & ~below & (first_white < H))
+            if redo.size:
+                edge = own[:, redo] & (np.arange(H)[:, None] > first_white[redo])
+                top[series, redo] = np.where(edge.any(axis=0), edge.argmax(axis=0), -1)
+        return top
+
+    def y_at(self, series: int, x: int) -> Optional[int]:
+        """
+        The top edge of `series` at column x, or None.
+        """
+        if not 0 <= x < self.top.shape[1]:
+            return None
+        y = int(self.top[series, x])
+        return y if y >= 0 else None
+
+    def ys_at(self, series: int, xs: Sequence[int]) -> List[Optional[int]]:
+        """
+        y_at for many columns at once.
+        """
+        xs = np.asarray(xs, dtype=np.int64)
+        inside = (xs >= 0) & (xs < self.top.shape[1])
+        ys = np.full(xs.shape, -1, dtype=np.int64)
+        ys[inside] = self.top[series, xs[inside]]
+        return [int(y) if y >= 0 else None for y in ys]
+
+    def upward_edge(self, series: int, x: int) -> Optional[int]:
+        """
+        The edge of `series` found scanning column x upward: past the
+        series' lowest pixel, then a stretch of other (gray) pixels, the
+        first white pixel above them. Used at the right end of a chart,
+        where a plain top-down scan can stop at the legend.
+        """
+        own = self.labels[:, x] == series + 1
+        white = self.white[:, x]
+        rows = np.flatnonzero(own)
+        if rows.size == 0:
+            return None
+        lowest = rows[-1]
+        other = np.flatnonzero(~own[:lowest] & ~white[:lowest])
+        if other.size == 0:
+            return None
+        whites = np.flatnonzero(white[:other[-1]])
+        return int(whites[-1]) if whites.size else None
+
+@pooled
+def trace_lines(image: np.ndarray, series_ranges: Sequence[Sequence[Tuple]] = ([BLUE_RANGE],),
+                white_range: Tuple = WHITE_RANGE) -> LineTrace:
+    """
+    Builds the per-series label map of a line or area chart in one pass
+    and traces every series across all columns.
+
+    Parameters:
+      - image: Input image as a NumPy array (BGR format).
+      - series_ranges: For each series, its list of HSV (lower, upper) ranges (see hsv_ranges).
+        Where ranges overlap, later series win.
+      - white_range: HSV range of the background.
+
+    Returns:
+      A LineTrace.
+    """
+    H, W = image.shape[:2]
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=scratch(image.shape))
+    white = cv2.inRange(hsv, *white_range).view(bool)
+
+    labels = np.zeros((H, W), dtype=np.uint8)
+    mask = scratch((H, W))
+    for index, ranges in enumerate(series_ranges):
+        for lower, upper in ranges:
+            cv2.inRange(hsv, lower, upper, dst=mask)
+            labels[mask.view(bool)] = index + 1
+    return LineTrace(labels, white, len(series_ranges))
+
+def sample_series(trace: LineTrace, count: int, colors: Sequence[str]) -> List[dict]:
+    """
+    The top edge of every series at `count` evenly spaced columns, in the
+    point-group form the scatter dense mode returns.
+
+    Parameters:
+      - trace: A LineTrace.
+      - count: Number of columns to sample (at most the image width).
+      - colors: The hex color of each series, for labeling.
+
+    Returns:
+      A list with one dict per series:
+         - "color": The series color.
+         - "radius": Always 0 (the points are line positions, not marks).
+         - "count": Number of columns where the series was found.
+         - "xy": The (x, y) positions as a flat [x0, y0, x1, y1, ...] list.
+    """
+    W = trace.top.shape[1]
+    xs = np.unique(np.linspace(0, W - 1, max(1, min(count, W))).round().astype(np.int32))
+    groups = []
+    for series, color in enumerate(colors):
+        ys = trace.top[series, xs]
+        found = ys >= 0
+        groups.append({
+            "color": color,
+            "radius": 0.0,
+            "count": int(found.sum()),
+            "xy": np.column_stack([xs[found], ys[found]]).ravel().tolist(),
+        })
+    return groups
+
+def series_values(trace: LineTrace, xs: Sequence[int], colors: Sequence[str]) -> List[dict]:
+    """
+    The top edge of every series at the columns `xs` a client asked for.
+
+    Returns:
+      A list with one dict per series:
+         - "color": The series color.
+         - "x": The requested columns, in request order.
+         - "y": The series position at each of them (None where the series
+           was not found or x is outside the image).
+    """
+    return [{"color": color, "x": [int(x) for x in xs], "y": trace.ys_at(series, xs)}
+            for series, color in enumerate(colors)]
@@ -0,0 +1,183 @@
+import cv2
+import numpy as np
+from app.buffers import scratch
+
+# Colors are quantized to 4 bits per channel, giving 4096 histogram bins.
+QUANT_SHIFT = 4
+BIN_WIDTH = 1 << QUANT_SHIFT
+LEVELS = 256 // BIN_WIDTH
+
+def color_histogram(image: np.ndarray, max_samples: int = 100000):
+    """
+    Computes a quantized color histogram of a subsampled image.
+
+    Parameters:
+      - image: Input image (BGR format) as a NumPy array.
+      - max_samples: Upper bound on the number of pixels sampled; the image is
+                     strided evenly in both directions to stay under it.
+
+    Returns:
+      A dictionary with:
+         "counts": (LEVELS, LEVELS, LEVELS) array of sampled pixel counts, indexed [b, g, r].
+         "sums": (LEVELS**3, 3) array of summed BGR values per bin (for mean colors).
+         "sampled_pixels": Number of pixels sampled.
+         "stride": Sampling step in both directions (1: every pixel).
+    """
+    height, width = image.shape[:2]
+    stride = max(1, int(np.ceil(np.sqrt(height * width / max_samples))))
+    sample = image[::stride, ::stride].reshape(-1, 3)
+
+    quantized = (sample >> QUANT_SHIFT).astype(np.uint16)
+    codes = (quantized[:, 0] * LEVELS + quantized[:, 1]) * LEVELS + quantized[:, 2]
+    bins = LEVELS ** 3
+    counts = np.bincount(codes, minlength=bins)
+    sums = np.stack([np.bincount(codes, weights=sample[:, c], minlength=bins) for c in range(3)], axis=1)
+    return {
+        "counts": counts.reshape(LEVELS, LEVELS, LEVELS),
+        "sums": sums,
+        "sampled_pixels": int(sample.shape[0]),
+        "stride": stride,
+    }
+
+def color_fraction(histogram, target_hex: str, color_tolerance=30) -> float:
+    """
+    Returns the fraction of sampled pixels whose quantized bin overlaps the
+    inRange box (target ± color_tolerance per channel) used by the color
+    detectors. Overlapping bins are counted whole, so this never under-counts
+    what a full-resolution inRange pass on the sampled pixels would find.
+    """
+    target_rgb = tuple(int(target_hex[i:i+2], 16) for i in (1, 3, 5))
+    target_bgr = target_rgb[::-1]
+    lo = [max(0, c - color_tolerance) >> QUANT_SHIFT for c in target_bgr]
+    hi = [min(255, c + color_tolerance) >> QUANT_SHIFT for c in target_bgr]
+    counts = histogram["counts"]
+    hits = counts[lo[0]:hi[0] + 1, lo[1]:hi[1] + 1, lo[2]:hi[2] + 1].sum()
+    return float(hits) / max(1, histogram["sampled_pixels"])
+
+def covers_fraction(image: np.ndarray, target_hex: str, color_tolerance=30, min_fraction=0.0) -> bool:
+    """
+    Whether the full-resolution inRange mask of the color detectors holds
+    any pixel (min_fraction 0) or at least min_fraction of the image.
+    """
+    target_rgb = tuple(int(target_hex[i:i+2], 16) for i in (1, 3, 5))
+    target_bgr = target_rgb[::-1]
+    lower_bound = np.array([max(0, c - color_tolerance) for c in target_bgr], dtype=np.uint8)
+    upper_bound = np.array([min(255, c + color_tolerance) for c in target_bgr], dtype=np.uint8)
+    mask = cv2.inRange(image, lower_bound, upper_bound, dst=scratch(image.shape[:2]))
+    if min_fraction <= 0:
+        return cv2.hasNonZero(mask)
+    return cv2.countNonZero(mask) >= min_fraction * mask.size
+
+def present_colors(image: np.ndarray, color_list: list, color_tolerance=30, min_fraction=0.0, histogram=None):
+    """
+    Filters a hard-coded palette down to the colors that appear in the image,
+    so absent colors don't cost a full-resolution segmentation pass.
+
+    When the histogram was subsampled, marks smaller than its stride can fall
+    between the sampled pixels, so a color it rejects is checked again on
+    the full-resolution inRange mask before it is dropped.
+
+    Parameters:
+      - image: Input image (BGR format) as a NumPy array.
+      - color_list: List of hex color codes.
+      - color_tolerance: Per-channel tolerance used by the color detectors.
+      - min_fraction: Minimum fraction of sampled pixels for a color to count
+                      as present (0 keeps any color with a single sampled hit).
+      - histogram: A precomputed color_histogram(image), if available.
+
+    Returns:
+      The colors from color_list that are present, in their original order.
+    """
+    if histogram is None:
+        histogram = color_histogram(image)
+    colors = []
+    for color_hex in color_list:
+        fraction = color_fraction(histogram, color_hex, color_tolerance)
+        if fraction > 0 and fraction >= min_fraction:
+            colors.append(color_hex)
+        elif histogram["stride"] > 1 and covers_fraction(image, color_hex, color_tolerance, min_fraction):
+            colors.append(color_hex)
+    return colors
+
+def discover_palette(image: np.ndarray, max_colors=12, min_fraction=0.002, merge_tolerance=16,
+                     white_thresh=224, gray_spread=24, histogram=None):
+    """
+    Finds the dominant non-background colors of a chart image.
+
+    Bins whose mean color is near white (every channel >= white_thresh) or
+    near gray (channel spread <= gray_spread, e.g. text, axes and gridlines)
+    are treated as background. Remaining bins covering at least min_fraction
+    of the sampled pixels are merged when their mean colors are within
+    merge_tolerance per channel (anti-aliasing often splits one color across
+    neighboring bins).
+
+    Parameters:
+      - image: Input image (BGR format) as a NumPy array.
+      - max_colors: Maximum number of colors returned.
+      - min_fraction: Minimum fraction of sampled pixels for a color to be reported.
+      - merge_tolerance: Per-channel distance under which two colors are merged.
+      - white_thresh: Channel value above which a color counts as white background.
+      - gray_spread: Maximum channel spread for a color to count as gray.
+      - histogram: A precomputed color_histogram(image), if available.
+
+    Returns:
+      A dictionary with:
+         "colors": List of {"color": hex, "fraction": float}, most common first.
+         "sampled_pixels": Number of pixels sampled.
+    """
+    if histogram is None:
+        histogram = color_histogram(image)
+    counts = histogram["counts"].reshape(-1)
+    total = max(1, histogram["sampled_pixels"])
+
+    occupied = np.flatnonzero(counts)
+    means = histogram["sums"][occupied] / counts[occupied, None]
+    spread = means.max(axis=1) - means.min(axis=1)
+    foreground = ~np.all(means >= white_thresh, axis=1) & (spread > gray_spread)
+
+    order = np.argsort(counts[occupied][foreground])[::-1]
+    candidates = means[foreground][order]
+    candidate_counts = counts[occupied][foreground][order]
+
+    palette = []  # [mean_bgr, count]
+    for mean_bgr, count in zip(candidates, candidate_counts):
+        for entry in palette:
+            if np.all(np.abs(entry[0] - mean_bgr) <= merge_tolerance):
+                entry[1] += count
+                break
+        else:
+            palette.append([mean_bgr, count])
+
+    colors = []
+    for mean_bgr, count in sorted(palette, key=lambda e: e[1], reverse=True):
+        fraction = count / total
+        if fraction < min_fraction or len(colors) >= max_colors:
+            break
+        b, g, r = (int(round(c)) for c in mean_bgr)
+        colors.append({
+            "color": "#{:02x}{:02x}{:02x}".format(r, g, b),
+            "fraction": round(float(fraction), 5)
+        })
+
+    return {
+        "colors": colors,
+        "sampled_pixels": histogram["sampled_pixels"]
+    }
+
+def resolve_palette(image: np.ndarray, color_list: list, color_tolerance=30, min_fraction=0.0):
+    """
+    Returns the colors of color_list that are present in the image. If none of
+    them are, falls back to the same number of the image's dominant colors, so
+    charts drawn with a different color scheme are still segmented.
+    """
+    histogram = color_histogram(image)
+    colors = present_colors(image, color_list, color_tolerance, min_fraction, histogram=histogram)
+    if colors:
+        return colors
+    discovered = discover_palette(image, max_colors=len(color_list), histogram=histogram)
+    return [entry["color"] for entry in discovered["colors"]]
+
+# Example usage:
+# image = cv2.imread("bar_chart.png")
+# print(discover_palette(image))
+# print(present_colors(image, ['#3182bd', '#ff0000']))
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 import math
+from app.buffers import pooled, scratch
+from app.cancellation import within_deadline
 
 def largestRectangleArea(heights):
     """
@@ -26,18 +28,20 @@ def largestRectangleArea(heights):
 def largest_rectangle_in_binary_mask(binary_mask):
     """
     Computes the largest axis-aligned rectangle of ones within a binary mask.
-    Returns (left, top, width, height).
+    Returns (left, top, width, height). Past the analysis deadline the
+    sweep stops and the largest rectangle of the rows seen so far is returned.
     """
     rows, cols = binary_mask.shape
-    dp = [0] * cols
+    dp = np.zeros(cols, dtype=np.int64)
     max_area = 0
     best_rect = (0, 0, 0, 0)  # (left, top, width, height)
     
     for i in range(rows):
-        for j in range(cols):
-            dp[j] = dp[j] + 1 if binary_mask[i, j] == 1 else 0
+        if not within_deadline():
+            break
+        dp = np.where(binary_mask[i] == 1, dp + 1, 0)
         
-        area, (start, end, height_rect, width_rect) = largestRectangleArea(dp)
+        area, (start, end, height_rect, width_rect) = largestRectangleArea(dp.tolist())
         if area > max_area:
             max_area = area
             top = i - height_rect + 1
@@ -45,7 +49,141 @@ def largest_rectangle_in_binary_mask(binary_mask):
             best_rect = (left, top, width_rect, height_rect)
     return best_rect
 
-def detect_pie_slice_largest_rectangle(image: np.ndarray, target_hex: str, color_tolerance=30):
+def largest_rectangle_in_region(binary_mask):
+    """
+    Exact largest rectangle, searched only within the bounding box of the
+    mask's ones. Returns (left, top, width, height) in mask coordinates.
+    """
+    x0, y0, w, h = cv2.boundingRect(binary_mask)
+    if w == 0 or h == 0:
+        return (0, 0, 0, 0)
+    left, top, rect_width, rect_height = largest_rectangle_in_binary_mask(binary_mask[y0:y0 + h, x0:x0 + w])
+    return (x0 + left, y0 + top, rect_width, rect_height)
+
+def expand_rectangle(binary_mask, rect):
+    """
+    Greedily grows a rectangle of ones one row or column at a time, on
+    whichever side still borders only ones, until no side can grow.
+    Returns (left, top, width, height).
+    """
+    rows, cols = binary_mask.shape
+    left, top, width, height = rect
+    right, bottom = left + width, top + height
+    grown = True
+    while grown:
+        grown = False
+        if top > 0 and binary_mask[top - 1, left:right].all():
+            top -= 1
+            grown = True
+        if bottom < rows and binary_mask[bottom, left:right].all():
+            bottom += 1
+            grown = True
+        if left > 0 and binary_mask[top:bottom, left - 1].all():
+            left -= 1
+            grown = True
+        if right < cols and binary_mask[top:bottom, right].all():
+            right += 1
+            grown = True
+    return (left, top, right - left, bottom - top)
+
+def refine_rectangle(binary_mask, rect, band):
+    """
+    Exact largest rectangle of ones among those containing `rect` shrunk by
+    `band` pixels per side (its core), with the top and bottom edges at
+    most `band` pixels from those of `rect`. Left and right extend as far
+    as the rows spanned allow, however far that is.
+
+    The core must be all ones. Each row gets the run of ones through the
+    core columns; the best edges then follow from running maxima and minima
+    of those runs above and below the core, over every (top, bottom) pair.
+    Returns (left, top, width, height).
+    """
+    rows, cols = binary_mask.shape
+    left, top, width, height = rect
+    shrink_x, shrink_y = min(band, (width - 1) // 2), min(band, (height - 1) // 2)
+    core_left, core_right = left + shrink_x, left + width - shrink_x
+    core_top, core_bottom = top + shrink_y, top + height - shrink_y
+    first, last = max(0, top - band), min(rows, top + height + band)
+
+    # Zero columns on both sides, so every row has a zero left and right of the core.
+    padded = np.pad(binary_mask[first:last], ((0, 0), (1, 1)))
+    run_left = core_left - np.argmax(padded[:, core_left::-1] == 0, axis=1)
+    run_right = core_right + np.argmax(padded[:, core_right + 1:] == 0, axis=1)
+    spans_core = padded[:, core_left + 1:core_right + 1].all(axis=1)
+    run_left[~spans_core], run_right[~spans_core] = cols, 0
+
+    core = slice(core_top - first, core_bottom - first)
+    above = slice(core_top - first - 1, None, -1) if core_top > first else slice(0, 0)
+    below = slice(core_bottom - first, None)
+    # Index k: the rectangle takes k more rows above (below) the core.
+    up_left = np.maximum.accumulate(np.r_[run_left[core].max(), run_left[above]])
+    up_right = np.minimum.accumulate(np.r_[run_right[core].min(), run_right[above]])
+    down_left = np.maximum.accumulate(np.r_[0, run_left[below]])
+    down_right = np.minimum.accumulate(np.r_[cols, run_right[below]])
+
+    widths = np.clip(np.minimum(up_right[:, None], down_right[None, :])
+                     - np.maximum(up_left[:, None], down_left[None, :]), 0, None)
+    heights = (core_bottom - core_top) + np.arange(len(up_left))[:, None] + np.arange(len(down_left))[None, :]
+    up, down = np.unravel_index(np.argmax(widths * heights), widths.shape)
+    best_left = max(up_left[up], down_left[down])
+    return (int(best_left), core_top - int(up), int(widths[up, down]), int(heights[up, down]))
+
+def approximate_largest_rectangle(binary_mask, max_side=40):
+    """
+    Coarse-to-fine approximation of largest_rectangle_in_binary_mask.
+
+    The bounding box of the mask's ones is reduced to at most `max_side`
+    cells per side, where a cell is set only if every pixel it covers is
+    set, so the exact rectangle found on the coarse grid always lies inside
+    the slice. At full resolution, refine_rectangle then searches exactly
+    the rectangles whose edges lie within a cell of it, and again around
+    each better one, until no such move gains area; the result is finally
+    grown greedily. When the slice is too thin to contain a whole cell, the
+    search starts from the pixel farthest from the slice edge instead.
+
+    The result is always a valid rectangle of ones. If the exact rectangle
+    is W x H and a cell is c pixels (bounding box / max_side), it contains
+    a (W - 2c) x (H - 2c) block of whole cells, so the result is at least
+    that large, and no rectangle with edges within a cell of the result's
+    is larger. It can still sit elsewhere when two rectangles far apart
+    have nearly the same area.
+    Returns (left, top, width, height).
+    """
+    x0, y0, w, h = cv2.boundingRect(binary_mask)
+    if w == 0 or h == 0:
+        return (0, 0, 0, 0)
+    crop = binary_mask[y0:y0 + h, x0:x0 + w]
+    cell = max(1, math.ceil(max(w, h) / max_side))
+
+    coarse_h, coarse_w = math.ceil(h / cell), math.ceil(w / cell)
+    padded = np.zeros((coarse_h * cell, coarse_w * cell), dtype=np.uint8)
+    padded[:h, :w] = crop
+    coarse = padded.reshape(coarse_h, cell, coarse_w, cell).min(axis=(1, 3))
+
+    left, top, rect_width, rect_height = largest_rectangle_in_binary_mask(coarse)
+    if rect_width and rect_height:
+        seed = (left * cell, top * cell, rect_width * cell, rect_height * cell)
+        # Each pass moves the edges by up to a cell; stop when one gains nothing.
+        while True:
+            refined = refine_rectangle(crop, seed, cell)
+            if refined[2] * refined[3] <= seed[2] * seed[3]:
+                break
+            seed = refined
+    else:
+        distance = cv2.distanceTransform(crop, cv2.DIST_L2, 3)
+        _, _, _, (cx, cy) = cv2.minMaxLoc(distance)
+        seed = (cx, cy, 1, 1)
+
+    left, top, rect_width, rect_height = expand_rectangle(crop, seed)
+    return (x0 + left, y0 + top, rect_width, rect_height)
+
+RECTANGLE_MODES = {
+    "exact": largest_rectangle_in_region,
+    "approx": approximate_largest_rectangle,
+}
+
+@pooled
+def detect_pie_slice_largest_rectangle(image: np.ndarray, target_hex: str, color_tolerance=30, rect_mode="exact"):
     """
     Detects a pie chart slice defined by a specific target color and computes the largest 
     inscribed axis-aligned rectangle within that slice.
@@ -54,6 +192,8 @@ def detect_pie_slice_largest_rectangle(image: np.ndarray, target_hex: str, color
       - image: Input image (BGR format) as a NumPy array.
       - target_hex: The target slice color as a hex string (e.g., '#ff0000').
       - color_tolerance: Tolerance for color thresholding.
+      - rect_mode: "exact" for the largest inscribed rectangle, or "approx"
+        for the much cheaper approximate_largest_rectangle.
     
     Returns:
       A dictionary with keys:
@@ -70,7 +210,7 @@ def detect_pie_slice_largest_rectangle(image: np.ndarray, target_hex: str, color
     upper_bound = np.array([min(255, c + color_tolerance) for c in target_bgr], dtype=np.uint8)
     
     # Create a mask isolating the target slice.
-    mask = cv2.inRange(image, lower_bound, upper_bound)
+    mask = cv2.inRange(image, lower_bound, upper_bound, dst=scratch(image.shape[:2]))
     
     # Find contours in the mask; assume the largest one is the desired slice.
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -79,15 +219,14 @@ def detect_pie_slice_largest_rectangle(image: np.ndarray, target_hex: str, color
     
     largest_contour = max(contours, key=cv2.contourArea)
     
-    # Create a filled binary mask for the detected slice.
-    filled_mask = np.zeros_like(mask)
-    cv2.drawContours(filled_mask, [largest_contour], -1, 255, thickness=-1)
-    
-    # Convert to binary (1's and 0's).
-    binary_mask = (filled_mask == 255).astype(np.uint8)
+    # Create a filled binary mask (1's and 0's) for the detected slice,
+    # reusing the color mask's buffer now that its contours are extracted.
+    binary_mask = mask
+    binary_mask.fill(0)
+    cv2.drawContours(binary_mask, [largest_contour], -1, 1, thickness=-1)
     
     # Compute the largest inscribed rectangle in the binary mask.
-    left, top, rect_width, rect_height = largest_rectangle_in_binary_mask(binary_mask)
+    left, top, rect_width, rect_height = RECTANGLE_MODES[rect_mode](binary_mask)
     
     return {
         "label": "pie-slice",
@@ -100,7 +239,7 @@ def detect_pie_slice_largest_rectangle(image: np.ndarray, target_hex: str, color
         "color": target_hex
     }
 
-def detect_pie_slices(image: np.ndarray, color_list: list, expected_count: int, color_tolerance=30):
+def detect_pie_slices(image: np.ndarray, color_list: list, expected_count: int, color_tolerance=30, rect_mode="exact"):
     """
     Detects pie slices given a list of target colors and an expected number of slices.
     For each target color, the function computes the largest inscribed rectangle within 
@@ -111,6 +250,7 @@ def detect_pie_slices(image: np.ndarray, color_list: list, expected_count: int,
       - color_list: List of target slice colors as hex strings (e.g., ['#ff0000', '#00ff00']).
       - expected_count: The expected number of pie slices.
       - color_tolerance: Tolerance value for color thresholding.
+      - rect_mode: "exact" or "approx" (see detect_pie_slice_largest_rectangle).
     
     Returns:
       A dictionary containing:
@@ -121,7 +261,9 @@ def detect_pie_slices(image: np.ndarray, color_list: list, expected_count: int,
     """
     regions = []
     for target_hex in color_list:
-        result = detect_pie_slice_largest_rectangle(image, target_hex, color_tolerance=color_tolerance)
+        if not within_deadline():
+            break
+        result = detect_pie_slice_largest_rectangle(image, target_hex, color_tolerance=color_tolerance, rect_mode=rect_mode)
         if "error" not in result:
             regions.append(result)
     detected_count = len(regions)
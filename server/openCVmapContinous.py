@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Sequence, Tuple, Optional
+from openCVdetectGlyphs import extract_glyphs
+from app.layout import layout_cached
+from openCVdetectLines import BLUE_RANGE, LineTrace, trace_lines
 
 def detect_characters(
     img: np.ndarray,
@@ -13,30 +16,13 @@ def detect_characters(
     Returns a list of dicts in the form:
       { "label": "", "box": (x, y, w, h) }
     """
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    blur = cv2.GaussianBlur(gray, (3, 3), 0)
-    # Threshold (invert => text is white on black)
-    _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, morph_kernel_size)
-    morph = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-
-    contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    results = []
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area < min_area or area > max_area:
-            continue
-        x, y, w, h = cv2.boundingRect(cnt)
-        results.append({
-            "label": "",  # will be assigned later
-            "box": (x, y, w, h)
-        })
-    return results
+    # Otsu threshold (invert => text is white on black), filtered by contour area
+    boxes = extract_glyphs(img, method="otsu", blur=True, open_kernel=morph_kernel_size,
+                           min_area=min_area, max_area=max_area, area_measure="contour")
+    return [
+        {"label": "", "box": tuple(box)}  # label will be assigned later
+        for box in boxes.tolist()
+    ]
 
 def combine_boxes(box_list: List[Dict]) -> Optional[Dict]:
     """
@@ -120,6 +106,7 @@ def group_vertically(detections: List[Dict], gap_threshold: int = 20) -> List[Di
         groups.append(combined)
     return groups
 
+@layout_cached
 def extract_specific_axis_labels(img: np.ndarray) -> List[Dict]:
     """
     1. Combine all detections in top margin => single bounding box => label = "title"
@@ -219,20 +206,27 @@ def find_intersection_bounding_boxes(
     img: np.ndarray,
     x_positions: List[int],
     box_offset: int = 20,
-    default_y: Optional[int] = None
+    default_y: Optional[int] = None,
+    series_ranges: Sequence[Sequence[Tuple]] = ([BLUE_RANGE],),
+    trace: Optional[LineTrace] = None,
+    series: Optional[Sequence[int]] = None
 ) -> List[Dict]:
     """
-    For each x in x_positions, this function:
-      1. Converts the image to HSV.
-      2. Constructs a white mask and a blue mask (for 3282bd).
-      3. For all x positions except the last, it scans vertically from top to bottom 
-         to find a white-to-blue transition: it waits until at least one white pixel is 
-         observed, then the first pixel that qualifies as blue is the boundary.
-      4. For the last element in x_positions, it subtracts box_offset from x and scans upward
+    For each series and each x in x_positions, finds where the series meets
+    the white background and boxes that point:
+      1. The chart is traced once (see trace_lines): a label map of the
+         series colors (series_ranges; by default the blue of 3282bd) and a
+         white mask, from which the top edge of every series in every
+         column is read. A trace the caller already built can be passed
+         as `trace`, and `series` limits the boxes to some of its series
+         (all by default).
+      2. For all x positions except the last, the boundary is the first
+         series pixel below a white pixel, scanning top to bottom.
+      3. For the last element in x_positions, it subtracts box_offset from x and scans upward
          (from bottom to top) to find a transition that shows the presence of three color zones:
-         first a blue region, then an intermediate (gray) region, and finally white.
-      5. If no boundary is found, it uses a fallback y value (default_y; if not provided, uses bottom-of-image).
-      6. It then creates a bounding box at that x by extending ±box_offset in both x and y.
+         first a series region, then an intermediate (gray) region, and finally white.
+      4. If no boundary is found, it uses a fallback y value (default_y; if not provided, uses bottom-of-image).
+      5. It then creates a bounding box at that x by extending ±box_offset in both x and y.
     
     Returns a list of region dictionaries in the following format:
       {
@@ -246,120 +240,50 @@ def find_intersection_bounding_boxes(
           "color": "#000000"
       }
     
-    The number of bounding boxes returned equals len(x_positions).
+    The number of bounding boxes returned equals len(x_positions) per boxed
+    series, series after series.
     """
     H, W = img.shape[:2]
-    # Convert image to HSV
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    
-    # White mask: low saturation, high brightness.
-    lower_white = np.array([0, 0, 200])
-    upper_white = np.array([180, 30, 255])
-    white_mask = cv2.inRange(hsv, lower_white, upper_white)
-    
-    # Blue mask: use a range around the expected blue for 0x3282bd.
-    lower_blue = np.array([90, 100, 50])
-    upper_blue = np.array([110, 255, 255])
-    blue_mask = cv2.inRange(hsv, lower_blue, upper_blue)
-    
+    if trace is None:
+        trace = trace_lines(img, series_ranges)
+
     # Determine default_y if needed.
     if default_y is None:
         default_y = H - box_offset - 1
         
     boundary_regions = []
     
-    # For each x, determine boundary_y.
-    for idx, x in enumerate(x_positions):
-        if x < 0 or x >= W:
-            continue
-        
-        boundary_y = None
-        
-        # For all but the last element, do the standard top-down scan.
-        if idx < len(x_positions) - 1:
-            found_white = False
-            for y in range(H):
-                if white_mask[y, x] == 255:
-                    found_white = True
-                elif found_white and blue_mask[y, x] == 255:
-                    boundary_y = y
-                    break
+    for series in (range(trace.series_count) if series is None else series):
+        for idx, x in enumerate(x_positions):
+            if x < 0 or x >= W:
+                continue
+
+            if idx < len(x_positions) - 1:
+                boundary_y = trace.y_at(series, x)
+            else:
+                # For the last element, scan upward slightly left of x.
+                boundary_y = trace.upward_edge(series, max(x - box_offset, 0))
             if boundary_y is None:
                 boundary_y = default_y
-        else:
-            # For the last element, modify x by subtracting box_offset.
-            x_adjusted = x - box_offset
-            if x_adjusted < 0:
-                x_adjusted = 0
-            # Scan upward (from bottom to top) for a triple-color boundary.
-            boundary_y = find_last_boundary_upward(hsv, white_mask, blue_mask, x_adjusted, box_offset, default_y)
-        
-        # Create bounding box at (x, boundary_y) with offset ±box_offset.
-        xmin = max(x - box_offset, 0)
-        xmax = min(x + box_offset, W - 1)
-        ymin = max(boundary_y - box_offset, 0)
-        ymax = min(boundary_y + box_offset, H - 1)
-        region = {
-            "label": "area_boundary_value",
-            "rectangular": {
-                "xmin": int(xmin),
-                "ymin": int(ymin),
-                "xmax": int(xmax),
-                "ymax": int(ymax)
-            },
-            "color": "#000000"
-        }
-        boundary_regions.append(region)
-    
-    return boundary_regions
 
-
-def find_last_boundary_upward(
-    hsv: np.ndarray,
-    white_mask: np.ndarray,
-    blue_mask: np.ndarray,
-    x: int,
-    box_offset: int,
-    default_y: int
-) -> int:
-    """
-    For the last x position (after x has been adjusted by subtracting box_offset),
-    scan upward (from bottom to top) to find the boundary where
-      1. We first encounter blue pixels (area chart color),
-      2. Then, after that, an intermediate region (neither blue nor white, hence “gray”),
-      3. And finally white pixels.
-      
-    Only when all three zones are observed (in that order, scanning upward) do we mark 
-    the boundary at the white transition. If no such tripartite transition is found, return default_y.
-    """
-    H, W = hsv.shape[:2]
+            # Create bounding box at (x, boundary_y) with offset ±box_offset.
+            xmin = max(x - box_offset, 0)
+            xmax = min(x + box_offset, W - 1)
+            ymin = max(boundary_y - box_offset, 0)
+            ymax = min(boundary_y + box_offset, H - 1)
+            region = {
+                "label": "area_boundary_value",
+                "rectangular": {
+                    "xmin": int(xmin),
+                    "ymin": int(ymin),
+                    "xmax": int(xmax),
+                    "ymax": int(ymax)
+                },
+                "color": "#000000"
+            }
+            boundary_regions.append(region)
     
-    found_blue = False
-    found_intermediate = False
-    boundary_y = None
-    
-    # Scan upward from bottom.
-    for y in range(H - 1, -1, -1):
-        # Check the pixel at position (y, x) using the existing masks.
-        is_white = (white_mask[y, x] == 255)
-        is_blue = (blue_mask[y, x] == 255)
-        # Define "intermediate" as not white and not blue.
-        is_intermediate = (not is_white and not is_blue)
-        
-        if not found_blue:
-            if is_blue:
-                found_blue = True
-        elif not found_intermediate:
-            if is_intermediate:
-                found_intermediate = True
-        else:
-            if is_white:
-                boundary_y = y
-                break
-    
-    if boundary_y is None:
-        boundary_y = default_y
-    return boundary_y
+    return boundary_regions
 
 def group_by_y_overlap(detections: List[Dict], y_gap_threshold: int = 20) -> List[Dict]:
     """
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 from typing import Dict, List, Optional, Tuple
+from openCVdetectGlyphs import extract_glyphs
+from app.cancellation import within_deadline
 
 
 
@@ -191,23 +193,10 @@ def detect_all_characters(img: np.ndarray, min_area: int = 30, max_area: int = 1
     dark characters on a light background. Then, it finds contours and returns a list
     of candidate bounding boxes (x, y, w, h) that pass area filtering.
     """
-    # Convert to grayscale.
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
     # Adaptive threshold so that letters become white on a black background.
-    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
-                                   cv2.THRESH_BINARY_INV, 11, 2)
-    
-    # Find contours.
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    boxes = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        area = w * h
-        if area < min_area or area > max_area:
-            continue
-        boxes.append((x, y, w, h))
-    return boxes
+    boxes = extract_glyphs(img, method="adaptive_mean", block_size=11, c=2,
+                           min_area=min_area, max_area=max_area, area_measure="box")
+    return [tuple(box) for box in boxes.tolist()]
 
 def group_boxes_by_y(boxes: List[Tuple[int, int, int, int]], vertical_thresh: int = 10) -> List[List[Tuple[int, int, int, int]]]:
     """
@@ -221,6 +210,8 @@ def group_boxes_by_y(boxes: List[Tuple[int, int, int, int]], vertical_thresh: in
     
     groups = []
     for box, center_y in boxes_with_center:
+        if not within_deadline():
+            break
         placed = False
         for group in groups:
             # Compute average center y for the group.
@@ -0,0 +1,40 @@
+import threading
+
+import numpy as np
+
+from app.buffers import BufferPool, IdleBudget
+
+MB = 2**20
+
+
+def test_pools_sharing_a_budget_keep_at_most_its_total():
+    budget = IdleBudget(4 * MB)
+    pools = [BufferPool(4 * MB, budget) for _ in range(8)]
+
+    def work(pool):
+        for _ in range(20):
+            pool.release(pool.acquire((MB,)))
+            pool.release(np.empty(MB, np.uint8))
+
+    threads = [threading.Thread(target=work, args=(pool,)) for pool in pools]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert budget.used_bytes == sum(pool.free_bytes for pool in pools)
+    assert budget.used_bytes <= 4 * MB
+
+def test_release_over_budget_evicts_own_buffers_first():
+    budget = IdleBudget(3 * MB)
+    full, pool = BufferPool(3 * MB, budget), BufferPool(3 * MB, budget)
+    full.release(np.empty(2 * MB, np.uint8))
+    pool.release(np.empty(MB, np.uint8))
+    # No room left: the pool's own 1 MB buffer makes way for the new one.
+    pool.release(np.empty(MB // 4, np.float32))
+    assert pool.free_bytes == MB and budget.used_bytes == 3 * MB
+    pool.acquire((MB,))
+    assert pool.misses == 1
+    pool.release(np.empty(MB // 4, np.float32))
+    # With nothing of its own to evict, the buffer is dropped.
+    pool.release(np.empty(2 * MB, np.uint8))
+    assert pool.free_bytes == 0 and budget.used_bytes == 2 * MB
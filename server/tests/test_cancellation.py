@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import main
+from app.cancellation import within_deadline
+from app.scheduler import Scheduler
+
+CONTENTS = cv2.imencode(".png", np.full((32, 32, 3), 255, np.uint8))[1].tobytes()
+
+
+class FakeRequest:
+    """A client that disconnects `after` seconds from now (never with None)."""
+
+    def __init__(self, after=None):
+        self.at = None if after is None else time.monotonic() + after
+
+    async def is_disconnected(self) -> bool:
+        return self.at is not None and time.monotonic() > self.at
+
+
+@pytest.fixture
+def analyzers(monkeypatch):
+    release = threading.Event()
+    stopped = threading.Event()
+
+    def slow(image):
+        try:
+            while not release.wait(0.01):
+                within_deadline()
+            return {"regions": []}
+        finally:
+            stopped.set()
+
+    monkeypatch.setitem(main.ANALYZERS, "slow", slow)
+    monkeypatch.setitem(main.ANALYZERS, "fast", lambda image: {"regions": []})
+    monkeypatch.setattr(main, "analysis_scheduler", Scheduler(1))
+    monkeypatch.setattr(main.near_duplicates, "max_entries", 0)
+    return release, stopped
+
+def analyze(chart_type: str, request: FakeRequest):
+    return main.analyze_upload(chart_type, main.AnalysisInput(CONTENTS, None, "interactive", "c", request))
+
+
+def test_disconnect_while_queued_leaves_scheduler_usable(analyzers):
+    release, _ = analyzers
+
+    async def scenario():
+        running = asyncio.create_task(analyze("slow", FakeRequest()))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc:
+            await analyze("fast", FakeRequest(after=0.05))
+        assert exc.value.status_code == 499
+
+        release.set()
+        assert await running == {"regions": []}
+        assert await asyncio.wait_for(analyze("fast", FakeRequest()), timeout=2) == {"regions": []}
+        assert main.analysis_scheduler.running == {"interactive": 0, "bulk": 0}
+
+    asyncio.run(scenario())
+
+def test_disconnect_while_running_stops_the_analysis(analyzers):
+    _, stopped = analyzers
+
+    async def scenario():
+        with pytest.raises(HTTPException) as exc:
+            await analyze("slow", FakeRequest(after=0.05))
+        assert exc.value.status_code == 499
+        # The worker thread stops at its next check.
+        assert await asyncio.to_thread(stopped.wait, 1)
+        assert await asyncio.wait_for(analyze("fast", FakeRequest()), timeout=2) == {"regions": []}
+
+    asyncio.run(scenario())
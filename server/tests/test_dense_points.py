@@ -0,0 +1,21 @@
+import json
+
+import numpy as np
+
+import main
+from app.density import cell_marks
+
+
+def test_dense_point_centers_are_rounded_to_one_decimal(monkeypatch):
+    centers = np.array([[1182.3, 412.7], [10.25, 3.96]], dtype=np.float32)
+    monkeypatch.setattr(main, "resolve_palette", lambda image, colors: colors)
+    monkeypatch.setattr(main, "detect_dense_points", lambda image, colors: [
+        {"color": colors[0], "radius": 2.5, "centers": centers}])
+    result = main.analyze_scatter_plot(np.full((600, 800, 3), 255, np.uint8), dense=True)
+    group, = result["points"]
+    assert json.dumps(group["xy"]) == "[1182.3, 412.7, 10.2, 4.0]"
+
+def test_cell_drill_down_keeps_point_centers_rounded():
+    points = [{"color": "#3182bd", "radius": 2.5, "count": 2, "xy": [312.7, 10.3, 790.1, 590.9]}]
+    _, kept, _ = cell_marks([], points, 800, 600, 2, (0, 0))
+    assert json.dumps(kept[0]["xy"]) == "[312.7, 10.3]"
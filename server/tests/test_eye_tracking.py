@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.gaze import GazeHub
+from app.gazemap import GazeSession
+from app.routers import eye_tracking
+
+
+class FakeWebSocket:
+    """A websocket client that disconnects `after` seconds after accept."""
+
+    def __init__(self, hub: GazeHub, after: float):
+        self.app = SimpleNamespace(state=SimpleNamespace(gaze=hub))
+        self.after = after
+        self.sent = []
+
+    async def accept(self):
+        self.disconnected = asyncio.get_running_loop().time() + self.after
+
+    async def receive(self):
+        await asyncio.sleep(max(0.0, self.disconnected - asyncio.get_running_loop().time()))
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+def test_idle_gaze_stream_ends_when_client_disconnects():
+    websocket = FakeWebSocket(GazeHub(1024), after=0.05)
+    asyncio.run(asyncio.wait_for(eye_tracking.stream_gaze(websocket, batch_hz=20), timeout=2))
+    assert websocket.sent == []
+
+def test_idle_session_watcher_ends_when_client_disconnects():
+    hub = GazeHub(1024)
+    hub.sessions["s"] = GazeSession(hub.ring, [], 100, 100)
+    websocket = FakeWebSocket(hub, after=0.05)
+    asyncio.run(asyncio.wait_for(eye_tracking.watch_session(websocket, "s", batch_hz=20), timeout=2))
+    assert websocket.sent == [] and "s" in hub.sessions
@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+
+from openCVdetectGlyphs import glyph_boxes
+
+
+def contour_boxes(mask, min_area, max_area, area_measure):
+    # The boxes and areas of the external contours, filtered one by one.
+    boxes = []
+    for contour in cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]:
+        x, y, w, h = cv2.boundingRect(contour)
+        area = cv2.contourArea(contour) if area_measure == "contour" else w * h
+        if min_area <= area <= max_area:
+            boxes.append([x, y, w, h])
+    return np.array(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def test_glyph_boxes_match_external_contours():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        shape = tuple(rng.integers(1, 80, size=2))
+        mask = (rng.random(shape) < rng.random()).astype(np.uint8) * 255
+        for area_measure in ("box", "contour"):
+            expected = contour_boxes(mask, 2, 200, area_measure)
+            np.testing.assert_array_equal(
+                glyph_boxes(mask, min_area=2, max_area=200, area_measure=area_measure), expected)
+
+def test_glyph_boxes_skip_blobs_inside_holes():
+    mask = np.zeros((20, 20), np.uint8)
+    cv2.rectangle(mask, (2, 2), (17, 17), 255, 1)
+    mask[9:11, 9:11] = 255
+    np.testing.assert_array_equal(glyph_boxes(mask), [[2, 2, 16, 16]])
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from app.jobs import JobQueue, SQLiteJobStore
+
+
+class SlowStore(SQLiteJobStore):
+    """A SQLite store whose writes take `delay` seconds, like a slow disk."""
+
+    delay = 0.2
+
+    def create(self, job):
+        time.sleep(self.delay)
+        super().create(job)
+
+    def update(self, job_id, **fields):
+        time.sleep(self.delay)
+        super().update(job_id, **fields)
+
+
+def test_store_writes_do_not_block_the_event_loop(tmp_path):
+    async def scenario():
+        run = lambda chart_type, contents, debug: {"n": len(contents)}
+        queue = JobQueue(SlowStore(str(tmp_path / "jobs.db")), run, ["bar_chart"])
+        await queue.start()
+        updates = None
+        lags = []
+
+        async def tick():
+            while True:
+                started = time.monotonic()
+                await asyncio.sleep(0.01)
+                lags.append(time.monotonic() - started)
+
+        ticker = asyncio.create_task(tick())
+        try:
+            job = await queue.submit("bar_chart", b"chart")
+            updates = queue.watch(job["id"])
+            statuses = []
+            while not statuses or statuses[-1] not in ("done", "failed"):
+                statuses.append((await asyncio.wait_for(updates.get(), timeout=5))["status"])
+            assert statuses == ["running", "done"]
+            assert (await queue.get(job["id"]))["result"] == {"n": 5}
+            assert (await queue.submit("bar_chart", b"chart"))["id"] == job["id"]
+        finally:
+            ticker.cancel()
+            if updates is not None:
+                queue.unwatch(job["id"], updates)
+            await queue.stop()
+        assert max(lags) < SlowStore.delay / 2
+
+    asyncio.run(scenario())
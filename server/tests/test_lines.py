@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+
+import main
+from tools.synthetic import generate
+
+
+def line_chart():
+    image, truth = generate("line_chart", 800, 600, marks=8, seed=2)
+    xs = [(r["rectangular"]["xmin"] + r["rectangular"]["xmax"]) // 2 for r in truth["regions"]]
+    return image, xs
+
+
+def boundary_boxes(result):
+    return [r["rectangular"] for r in result["regions"] if r["label"] == "area_boundary_value"]
+
+
+def test_colored_element_off_the_plot_is_not_a_series():
+    image, _ = line_chart()
+    expected = main.analyze_line_chart(image, samples=10)
+    logo = image.copy()
+    cv2.rectangle(logo, (0, 0), (99, 39), (0, 0, 230), thickness=-1)
+    result = main.analyze_line_chart(logo, samples=10)
+    assert [group["color"] for group in result["points"]] == ["#3282bd"]
+    assert boundary_boxes(result) == boundary_boxes(expected)
+
+def test_extra_series_are_only_in_points_and_values():
+    image, xs = line_chart()
+    expected = main.analyze_line_chart(image)
+    ys = np.random.default_rng(0).integers(150, 450, len(xs))
+    cv2.polylines(image, [np.column_stack([xs, ys]).astype(np.int32)], False, (40, 40, 220), 2, cv2.LINE_8)
+    result = main.analyze_line_chart(image, samples=10, at=xs[1:-1])
+    assert [group["color"] for group in result["points"]] == ["#3282bd", "#dc2828"]
+    # One box per tick, all for the expected series.
+    assert len(boundary_boxes(result)) == len(boundary_boxes(expected)) == len(xs)
+    red = result["values"][1]
+    assert np.abs(np.array(red["y"]) - ys[1:-1]).max() <= 3
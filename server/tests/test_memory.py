@@ -0,0 +1,40 @@
+import threading
+
+import numpy as np
+
+from app import memory
+
+
+def traced_allocation(profiles, inside, release):
+    with memory.profile_request(True, required=True) as profile:
+        with memory.stage("allocate"):
+            data = np.ones(2**20)
+            inside.set()
+            release.wait(2)
+            del data
+    profiles.append(profile)
+
+def test_lone_trace_is_not_concurrent():
+    with memory.profile_request(True) as profile:
+        with memory.stage("allocate"):
+            np.ones(2**20)
+    assert profile is not None and not profile.concurrent
+    assert profile.stages["allocate"] >= 8 * 2**20
+
+def test_overlapping_analyses_mark_the_trace_and_are_not_learned(monkeypatch):
+    monkeypatch.setattr(memory, "_observed_bytes_per_pixel", {})
+    profiles, inside, release = [], threading.Event(), threading.Event()
+    thread = threading.Thread(target=traced_allocation, args=(profiles, inside, release))
+    thread.start()
+    inside.wait(2)
+    # A trace that is not required is skipped while another one runs, but
+    # the untraced request still marks the running trace as concurrent.
+    with memory.profile_request(True) as skipped:
+        assert skipped is None
+    release.set()
+    thread.join()
+
+    profile, = profiles
+    assert profile.concurrent
+    memory.record_observed_peak("bar_chart", profile, 1000)
+    assert "bar_chart" not in memory._observed_bytes_per_pixel
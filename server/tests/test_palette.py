@@ -0,0 +1,16 @@
+import main
+from openCVdetectPalette import color_histogram, present_colors
+from tools.synthetic import generate
+
+
+def test_marks_between_sampled_pixels_keep_their_color():
+    image, truth = generate("scatter_plot", 4000, 3000, marks=3, seed=1)
+    # The dots are smaller than the histogram's sampling stride.
+    assert color_histogram(image)["stride"] > 10
+    assert present_colors(image, ["#3182bd"]) == ["#3182bd"]
+    dots = [r for r in main.analyze_scatter_plot(image)["regions"] if r["label"] == "series-legend-item"]
+    assert len(dots) == 3
+
+def test_absent_colors_are_still_dropped():
+    image, _ = generate("scatter_plot", 4000, 3000, marks=3, seed=1)
+    assert present_colors(image, ["#3182bd", "#e6550d"]) == ["#3182bd"]
@@ -0,0 +1,52 @@
+import asyncio
+
+from app.scheduler import Scheduler
+
+
+async def _hold(scheduler: Scheduler, started: asyncio.Event, release: asyncio.Event):
+    async with scheduler.slot():
+        started.set()
+        await release.wait()
+
+async def _acquire(scheduler: Scheduler) -> bool:
+    async with scheduler.slot():
+        return True
+
+
+def test_release_and_cancel_in_same_tick_keeps_slot():
+    async def scenario():
+        scheduler = Scheduler(1)
+        started, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, started, release))
+        await started.wait()
+        waiter = asyncio.create_task(_acquire(scheduler))
+        await asyncio.sleep(0)
+        assert scheduler.queued("interactive") == 1
+
+        # The slot is freed in the same tick the queued waiter goes away.
+        release.set()
+        waiter.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+        assert scheduler.running == {"interactive": 0, "bulk": 0}
+
+        assert await asyncio.wait_for(_acquire(scheduler), timeout=1)
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        scheduler = Scheduler(1)
+        started, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler, started, release))
+        await started.wait()
+        cancelled = asyncio.create_task(_acquire(scheduler))
+        kept = asyncio.create_task(_acquire(scheduler))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.wait_for(kept, timeout=1)
+        await holder
+        assert scheduler.running == {"interactive": 0, "bulk": 0}
+
+    asyncio.run(scenario())
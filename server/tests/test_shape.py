@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+from openCVdetectShape import approximate_largest_rectangle, largest_rectangle_in_region, refine_rectangle
+
+
+def best_containing(mask, rect, band):
+    # Brute force over the rectangles refine_rectangle searches.
+    rows, cols = mask.shape
+    left, top, width, height = rect
+    shrink_x, shrink_y = min(band, (width - 1) // 2), min(band, (height - 1) // 2)
+    best = 0
+    for t in range(max(0, top - band), top + shrink_y + 1):
+        for b in range(top + height - shrink_y, min(rows, top + height + band) + 1):
+            for l in range(left + shrink_x + 1):
+                for r in range(left + width - shrink_x, cols + 1):
+                    if mask[t:b, l:r].all():
+                        best = max(best, (b - t) * (r - l))
+    return best
+
+def test_refine_rectangle_is_exact_within_its_band():
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        mask = np.zeros((16, 20), np.uint8)
+        for _ in range(3):
+            x, y = rng.integers(0, 16), rng.integers(0, 12)
+            mask[y:y + rng.integers(2, 8), x:x + rng.integers(2, 10)] = 1
+        x, y = np.argwhere(mask)[0][::-1]
+        band = int(rng.integers(0, 3))
+        left, top, width, height = refine_rectangle(mask, (x, y, 1, 1), band)
+        assert mask[top:top + height, left:left + width].all()
+        assert width * height == best_containing(mask, (x, y, 1, 1), band)
+
+def test_approximate_rectangle_edges_are_within_a_cell_of_exact():
+    mask = np.zeros((400, 400), np.uint8)
+    cv2.ellipse(mask, (200, 200), (180, 180), 0, 200, 290, 1, thickness=-1)
+    exact = np.array(largest_rectangle_in_region(mask))
+    approx = np.array(approximate_largest_rectangle(mask))
+    cell = int(np.ceil(max(cv2.boundingRect(mask)[2:]) / 40))
+    assert np.abs(np.r_[exact[:2], exact[:2] + exact[2:]] - np.r_[approx[:2], approx[:2] + approx[2:]]).max() <= cell
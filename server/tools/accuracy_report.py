@@ -0,0 +1,113 @@
+"""
+Measures each analyzer on synthetic charts (see tools/synthetic.py):
+recall and mean IoU of the ground-truth marks, and runtime, as mark counts
+and resolution grow.
+
+Run from the server directory:
+
+    python -m tools.accuracy_report [--types ...] [--marks 5,20,80]
+        [--sizes 800x600,1600x1200] [--palette default|random]
+        [--iou 0.5] [--json OUT.json] [--compare BEFORE.json]
+
+--json saves every analyzer output; --compare lists the charts whose
+regions differ from a saved run, to check that an optimization did not
+change results.
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+
+import cv2
+
+from main import run_analysis
+from tools.synthetic import add_sweep_arguments, sweep_from_args
+
+
+def iou(a, b):
+    a, b = a["rectangular"], b["rectangular"]
+    w = min(a["xmax"], b["xmax"]) - max(a["xmin"], b["xmin"])
+    h = min(a["ymax"], b["ymax"]) - max(a["ymin"], b["ymin"])
+    if w <= 0 or h <= 0:
+        return 0.0
+    overlap = w * h
+    area_a = (a["xmax"] - a["xmin"]) * (a["ymax"] - a["ymin"])
+    area_b = (b["xmax"] - b["xmin"]) * (b["ymax"] - b["ymin"])
+    return overlap / (area_a + area_b - overlap)
+
+def match_regions(truth, predicted, threshold=0.5):
+    """
+    Greedily pairs ground-truth and predicted regions with the same label,
+    best IoU first. Returns the IoUs of the pairs at or above `threshold`.
+    """
+    by_label = defaultdict(list)
+    for p in predicted:
+        if "rectangular" in p:
+            by_label[p["label"]].append(p)
+    candidates = []
+    for i, t in enumerate(truth):
+        for j, p in enumerate(by_label[t["label"]]):
+            score = iou(t, p)
+            if score >= threshold:
+                candidates.append((score, i, t["label"], j))
+    used_truth, used_predicted, matches = set(), set(), []
+    for score, i, label, j in sorted(candidates, reverse=True):
+        if i not in used_truth and (label, j) not in used_predicted:
+            used_truth.add(i)
+            used_predicted.add((label, j))
+            matches.append(score)
+    return matches
+
+def evaluate(name, image, truth, threshold):
+    ok, encoded = cv2.imencode(".png", image)
+    start = time.perf_counter()
+    result = run_analysis(truth["chart_type"], encoded.tobytes())
+    elapsed = time.perf_counter() - start
+    regions = result.get("regions", [])
+    labels = {t["label"] for t in truth["regions"]}
+    matches = match_regions(truth["regions"], regions, threshold)
+    return {
+        "name": name,
+        "chart_type": truth["chart_type"],
+        "marks": truth["marks"],
+        "size": f"{truth['width']}x{truth['height']}",
+        "truth": len(truth["regions"]),
+        "predicted": sum(1 for r in regions if r.get("label") in labels),
+        "recall": len(matches) / len(truth["regions"]) if truth["regions"] else 1.0,
+        "mean_iou": sum(matches) / len(matches) if matches else 0.0,
+        "ms": elapsed * 1000,
+        "regions": regions,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_sweep_arguments(parser)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU at which a mark counts as found")
+    parser.add_argument("--json", help="write every result, including analyzer regions, to this file")
+    parser.add_argument("--compare", help="report charts whose regions differ from this saved --json run")
+    args = parser.parse_args()
+
+    print(f"{'chart':<22} {'marks':>5} {'size':>10} {'truth':>5} {'found':>5} "
+          f"{'recall':>6} {'IoU':>5} {'ms':>8}")
+    results = []
+    for name, image, truth in sweep_from_args(args):
+        row = evaluate(name, image, truth, args.iou)
+        results.append(row)
+        print(f"{row['chart_type']:<22} {row['marks']:>5} {row['size']:>10} {row['truth']:>5} "
+              f"{row['predicted']:>5} {row['recall']:>6.2f} {row['mean_iou']:>5.2f} {row['ms']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f)
+    if args.compare:
+        with open(args.compare) as f:
+            before = {row["name"]: row["regions"] for row in json.load(f)}
+        changed = [row["name"] for row in results if row["name"] in before and before[row["name"]] != row["regions"]]
+        compared = sum(1 for row in results if row["name"] in before)
+        print(f"\n{len(changed)} of {compared} compared charts changed")
+        for name in changed:
+            print(f"  {name}")
+
+
+if __name__ == "__main__":
+    main()
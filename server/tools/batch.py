@@ -0,0 +1,187 @@
+"""
+Analyzes a large image corpus offline: reads a manifest, keeps the images
+of one shard, runs them through the analyzers on all local cores, and
+appends the results to chunked JSON-lines files. An interrupted run picks
+up where it stopped when started again with the same arguments.
+
+Run from the server directory:
+
+    python -m tools.batch MANIFEST OUT_DIR [--shard I/N] [--jobs N]
+        [--chunk-size 1000] [--type CHART_TYPE]
+
+MANIFEST has one JSON object per line: {"path": ..., "chart_type": ...}
+(relative paths are resolved against the manifest's directory; --type
+supplies the chart type of lines without one). Images are sharded by
+content hash, so N machines given --shard 0/N ... N-1/N split any
+manifest the same way, and copies of an image land in the same shard.
+
+Results go to OUT_DIR/shard-I-of-N/results-00000.jsonl, -00001, ...,
+one line per image: path, chart type, input hash, detector version,
+elapsed ms, and the analyzer "result" or an "error". Chunks are only ever
+appended to; the images already recorded in them are skipped on resume.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+from app.hashing import content_hash, detector_version
+from main import ANALYZERS, run_analysis
+
+# Set in each worker process by init_worker.
+_shard = (0, 1)
+
+
+def parse_shard(spec):
+    index, _, count = spec.partition("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard must be I/N with 0 <= I < N, got {spec}")
+    return index, count
+
+def shard_of(input_hash, count):
+    return int(input_hash[:16], 16) % count
+
+def read_manifest(path, default_type=None):
+    """
+    Yields (path, chart type) for every manifest line.
+    """
+    base = path.parent
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            chart_type = entry.get("chart_type") or default_type
+            if chart_type not in ANALYZERS:
+                raise SystemExit(f"{path}:{number}: unknown chart type {chart_type!r}")
+            yield str(base / entry["path"]), chart_type
+
+def init_worker(shard):
+    global _shard
+    _shard = shard
+
+def analyze_entry(entry):
+    """
+    Analyzes one manifest entry if it belongs to this shard. Runs in a
+    pool worker.
+
+    Returns:
+      The output record, or None for an image of another shard.
+    """
+    path, chart_type = entry
+    record = {"path": path, "chart_type": chart_type}
+    try:
+        contents = Path(path).read_bytes()
+    except OSError as exc:
+        # Unreadable images cannot be hashed; shard them by path instead.
+        if shard_of(content_hash(path.encode()), _shard[1]) != _shard[0]:
+            return None
+        return {**record, "error": f"{type(exc).__name__}: {exc}"}
+    input_hash = content_hash(contents)
+    if shard_of(input_hash, _shard[1]) != _shard[0]:
+        return None
+    record.update(input_hash=input_hash, detector_version=detector_version())
+    start = time.perf_counter()
+    try:
+        record["result"] = run_analysis(chart_type, contents)
+    except Exception as exc:
+        record["error"] = f"{type(exc).__name__}: {getattr(exc, 'detail', exc)}"
+    record["ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+class ChunkWriter:
+    """
+    Appends records to numbered JSON-lines chunks of at most `chunk_size`
+    lines in `directory`, starting a new chunk on every run.
+    """
+
+    def __init__(self, directory, chunk_size):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.file = None
+        self.lines = 0
+        self.next_number = len(list(directory.glob("results-*.jsonl")))
+
+    def write(self, record):
+        if self.file is None or self.lines >= self.chunk_size:
+            self.close()
+            self.file = open(self.directory / f"results-{self.next_number:05d}.jsonl", "a")
+            self.next_number += 1
+            self.lines = 0
+        self.file.write(json.dumps(record) + "\n")
+        # Flushed per record, so a crash loses at most the line being written.
+        self.file.flush()
+        self.lines += 1
+
+    def close(self):
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+def completed_paths(directory):
+    """
+    Paths already recorded in the chunks of `directory`. A torn last line
+    (from a run killed mid-write) is cut off so the chunk stays valid.
+    """
+    done = set()
+    for chunk in sorted(directory.glob("results-*.jsonl")):
+        with open(chunk, "rb+") as f:
+            valid = 0
+            for line in f:
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    break
+                valid += len(line)
+            f.truncate(valid)
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", type=Path)
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1), help="I/N: this machine's shard")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="records per output file")
+    parser.add_argument("--type", choices=sorted(ANALYZERS), help="chart type of manifest lines without one")
+    parser.add_argument("--max-tasks-per-child", type=int, default=1000,
+                        help="restart each worker after this many images (bounds leaked memory)")
+    args = parser.parse_args()
+
+    out = args.out_dir / f"shard-{args.shard[0]}-of-{args.shard[1]}"
+    out.mkdir(parents=True, exist_ok=True)
+    done = completed_paths(out)
+    pending = [entry for entry in read_manifest(args.manifest, args.type) if entry[0] not in done]
+    print(f"shard {args.shard[0]}/{args.shard[1]}, detector version {detector_version()}: "
+          f"{len(done)} done, {len(pending)} manifest entries to check, {args.jobs} workers")
+
+    writer = ChunkWriter(out, args.chunk_size)
+    analyzed = failed = 0
+    start = last_report = time.perf_counter()
+    with multiprocessing.Pool(args.jobs, initializer=init_worker, initargs=(args.shard,),
+                              maxtasksperchild=args.max_tasks_per_child) as pool:
+        try:
+            for record in pool.imap_unordered(analyze_entry, pending, chunksize=4):
+                if record is None:
+                    continue
+                writer.write(record)
+                analyzed += 1
+                failed += "error" in record
+                if time.perf_counter() - last_report > 10:
+                    last_report = time.perf_counter()
+                    print(f"{analyzed} analyzed ({failed} failed), "
+                          f"{analyzed / (last_report - start):.1f} images/s", flush=True)
+        finally:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{analyzed} analyzed ({failed} failed) in {elapsed:.1f}s -> {out}")
+
+
+if __name__ == "__main__":
+    main()
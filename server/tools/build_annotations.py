@@ -0,0 +1,138 @@
+"""
+Builds the analyzer results of a fixed image corpus ahead of time, so the
+server (VISTRUCT_PREBUILT_DIR) or a static host can serve them without
+running any analysis.
+
+Run from the server directory:
+
+    python -m tools.build_annotations IMAGE_DIR OUT_DIR [--jobs N]
+        [--type CHART_TYPE] [--force]
+
+Each image's chart type is --type if given, else the name of its
+subdirectory when that is a chart type (IMAGE_DIR/pie_chart/x.png), else
+the study file it is named after (pie.png -> pie_chart). Results go to
+OUT_DIR/<detector version>/<chart type>/<content hash>.json, together
+with OUT_DIR/<detector version>/index.json mapping each source file to
+its artifact. The detector version is a hash of the detector sources,
+so editing a detector starts a fresh tree; artifacts already built for
+the current version are skipped unless --force is given.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from app.assets import ASSET_EXTENSIONS
+from app.hashing import content_hash, detector_version, output_settings
+from app.prebuilt import artifact_path
+from main import ANALYZERS, run_analysis
+from tools.load_test import STUDY_FILES
+
+STUDY_CHART_TYPES = {Path(name).stem: chart_type for chart_type, name in STUDY_FILES.items()}
+
+
+def chart_type_of(path, image_dir, forced=None):
+    if forced:
+        return forced
+    parent = path.parent.name if path.parent != image_dir else None
+    if parent in ANALYZERS:
+        return parent
+    return STUDY_CHART_TYPES.get(path.stem)
+
+def find_images(image_dir, forced=None):
+    """
+    (path, chart type) of every image under `image_dir`; images whose
+    chart type cannot be told are reported and left out.
+    """
+    tasks = []
+    for path in sorted(image_dir.rglob("*")):
+        if path.suffix.lower() not in ASSET_EXTENSIONS:
+            continue
+        chart_type = chart_type_of(path, image_dir, forced)
+        if chart_type is None:
+            print(f"skipping {path}: unknown chart type (use --type or a chart-type subdirectory)")
+            continue
+        tasks.append((path, chart_type))
+    return tasks
+
+def write_json(path, data):
+    # Written under a temporary name first so readers never see half a file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(f".{os.getpid()}.tmp")
+    partial.write_text(json.dumps(data))
+    os.replace(partial, path)
+
+def build_one(path, chart_type, out_dir, version, force=False):
+    """
+    Analyzes one image into its artifact. Runs in a pool worker.
+
+    Returns:
+      (status, input hash, milliseconds), status being "built", "cached" or the error.
+    """
+    contents = path.read_bytes()
+    input_hash = content_hash(contents)
+    target = artifact_path(out_dir, version, chart_type, input_hash)
+    if target.exists() and not force:
+        return "cached", input_hash, 0.0
+    start = time.perf_counter()
+    try:
+        result = run_analysis(chart_type, contents)
+    except Exception as exc:
+        return f"{type(exc).__name__}: {getattr(exc, 'detail', exc)}", input_hash, 0.0
+    elapsed = (time.perf_counter() - start) * 1000
+    write_json(target, {
+        "chart_type": chart_type,
+        "input_hash": input_hash,
+        "detector_version": version,
+        "settings": output_settings(),
+        "source": path.name,
+        "elapsed_ms": round(elapsed, 1),
+        "result": result,
+    })
+    return "built", input_hash, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", type=Path)
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--type", choices=sorted(ANALYZERS), help="chart type of every image")
+    parser.add_argument("--force", action="store_true", help="rebuild artifacts that already exist")
+    args = parser.parse_args()
+
+    version = detector_version()
+    tasks = find_images(args.image_dir, args.type)
+    print(f"detector version {version}: {len(tasks)} images, {args.jobs} workers")
+
+    index, counts, failures = {}, {"built": 0, "cached": 0}, 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(build_one, path, chart_type, args.out_dir, version, args.force): (path, chart_type)
+            for path, chart_type in tasks
+        }
+        for future in as_completed(futures):
+            path, chart_type = futures[future]
+            status, input_hash, elapsed = future.result()
+            source = str(path.relative_to(args.image_dir))
+            if status in counts:
+                counts[status] += 1
+                index[source] = {
+                    "chart_type": chart_type,
+                    "input_hash": input_hash,
+                    "artifact": str(artifact_path("", version, chart_type, input_hash).relative_to(version)),
+                }
+                print(f"{status:>6} {source} ({chart_type}) {elapsed:.0f}ms")
+            else:
+                failures += 1
+                print(f"FAILED {source} ({chart_type}): {status}")
+
+    write_json(args.out_dir / version / "index.json", dict(sorted(index.items())))
+    print(f"{counts['built']} built, {counts['cached']} already built, {failures} failed "
+          f"in {time.perf_counter() - start:.1f}s -> {args.out_dir / version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Load-tests the analysis API: starts the app locally with uvicorn, replays
+a weighted mix of /analyze/* uploads of the study images at increasing
+concurrency, and reports latency percentiles, throughput, error rate and
+server memory (RSS) per concurrency level.
+
+Run from the server directory:
+
+    python -m tools.load_test [--levels 1,2,4,8] [--duration 15]
+        [--mix pie_chart=1,bar_chart=3] [--workers 1]
+        [--env VISTRUCT_ANALYSIS_CONCURRENCY=2] [--out report.json]
+        [--compare baseline.json]
+
+Each upload gets a few unique trailing bytes (ignored by the PNG decoder)
+so requests are not coalesced or served from a cache; pass --identical to
+measure the coalescing path instead. Reports are JSON and carry the git
+commit and server configuration so runs can be compared across commits
+and worker settings.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+STUDY_IMAGES = SERVER_DIR.parent / "client/public/studyProblem"
+
+# Study image for each analysis endpoint.
+STUDY_FILES = {
+    "100_stacked_bar_chart": "100stackedbar.png",
+    "bar_chart": "bar.png",
+    "stacked_bar_chart": "stackedBar.png",
+    "histogram": "histogram.png",
+    "line_chart": "line.png",
+    "area_chart": "area.png",
+    "stacked_area_chart": "stackedArea.png",
+    "scatter_plot": "scatter.png",
+    "bubble_chart": "bubble.png",
+    "treemap": "treemap.png",
+    "pie_chart": "pie.png",
+    "map": "map.png",
+}
+
+
+def parse_mix(spec):
+    """
+    "pie_chart=1,bar_chart=3" -> {"pie_chart": 1.0, "bar_chart": 3.0};
+    an empty spec weights every chart type equally.
+    """
+    if not spec:
+        return {chart_type: 1.0 for chart_type in STUDY_FILES}
+    mix = {}
+    for item in spec.split(","):
+        chart_type, _, weight = item.partition("=")
+        if chart_type not in STUDY_FILES:
+            raise SystemExit(f"Unknown chart type in --mix: {chart_type}")
+        mix[chart_type] = float(weight or 1)
+    return mix
+
+def multipart_body(contents, filename):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + contents + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def process_tree(pid):
+    """
+    `pid` and all its descendants (uvicorn --workers forks one process per worker).
+    """
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if entry.name.isdigit():
+            try:
+                ppid = int((entry / "stat").read_text().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry.name))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+def rss_bytes(pid):
+    """
+    Resident memory of a process and its children (Linux /proc only;
+    returns None elsewhere).
+    """
+    total = 0
+    for member in process_tree(pid):
+        try:
+            for line in Path(f"/proc/{member}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total or None
+
+
+class Server:
+    """
+    The app under test, run with uvicorn in a subprocess.
+    """
+
+    def __init__(self, port, workers, env):
+        self.port = port
+        self.workers = workers
+        self.env = env
+        self.process = None
+
+    def __enter__(self):
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                   "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"]
+        self.process = subprocess.Popen(command, cwd=SERVER_DIR, env={**os.environ, **self.env})
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f"Server exited with code {self.process.returncode}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+                conn.request("GET", "/")
+                if conn.getresponse().status == 200:
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        raise SystemExit("Server did not start within 60s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_level(port, concurrency, duration, mix, images, identical, timeout, server_pid, seed=0):
+    """
+    Runs `concurrency` clients for `duration` seconds and returns the
+    level's statistics.
+    """
+    chart_types, weights = list(mix), list(mix.values())
+    latencies, errors, lock = [], {}, threading.Lock()
+    stop_at = time.perf_counter() + duration
+    peak_rss = [rss_bytes(server_pid)]
+
+    def client(client_seed):
+        rng = random.Random(client_seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        while time.perf_counter() < stop_at:
+            chart_type = rng.choices(chart_types, weights)[0]
+            contents = images[chart_type] if identical else images[chart_type] + uuid.uuid4().bytes
+            body, content_type = multipart_body(contents, STUDY_FILES[chart_type])
+            start = time.perf_counter()
+            try:
+                conn.request("POST", f"/analyze/{chart_type}", body, {"Content-Type": content_type})
+                response = conn.getresponse()
+                response.read()
+                outcome = response.status
+            except (OSError, http.client.HTTPException) as exc:
+                outcome = type(exc).__name__
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if outcome == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+        conn.close()
+
+    def sample_rss():
+        while time.perf_counter() < stop_at:
+            rss = rss_bytes(server_pid)
+            if rss is not None:
+                peak_rss[0] = max(peak_rss[0] or 0, rss)
+            time.sleep(0.25)
+
+    threads = [threading.Thread(target=client, args=(seed * 1000 + i,)) for i in range(concurrency)]
+    threads.append(threading.Thread(target=sample_rss))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies) + sum(errors.values())
+    ms = lambda value: round(value * 1000, 1) if value is not None else None
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "rss_peak_mb": round(peak_rss[0] / 2**20, 1) if peak_rss[0] else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_levels(levels, previous=None):
+    before = {level["concurrency"]: level for level in (previous or {}).get("levels", [])}
+    print(f"{'conc':>4} {'reqs':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6} {'rss MB':>7}")
+    for level in levels:
+        print(f"{level['concurrency']:>4} {level['requests']:>6} {level['throughput_rps']:>7} "
+              f"{level['p50_ms']!s:>8} {level['p95_ms']!s:>8} {level['p99_ms']!s:>8} "
+              f"{level['error_rate'] * 100:>6.1f} {level['rss_peak_mb']!s:>7}")
+        old = before.get(level["concurrency"])
+        if old:
+            deltas = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "rss_peak_mb"):
+                if old.get(key) and level.get(key) is not None:
+                    deltas.append(f"{key} {100 * (level[key] - old[key]) / old[key]:+.0f}%")
+            print("       vs baseline: " + ", ".join(deltas))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,2,4,8", help="comma-separated client concurrency levels")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--mix", default="", help="chart_type=weight pairs (default: all types equally)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="server environment setting, e.g. VISTRUCT_ANALYSIS_CONCURRENCY=2")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--identical", action="store_true", help="upload identical bytes (exercises coalescing)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="write the JSON report here")
+    parser.add_argument("--compare", type=Path, help="show changes against a saved report")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    images = {chart_type: (STUDY_IMAGES / STUDY_FILES[chart_type]).read_bytes() for chart_type in mix}
+    env = dict(item.split("=", 1) for item in args.env)
+
+    levels = []
+    with Server(args.port, args.workers, env) as server:
+        for concurrency in (int(level) for level in args.levels.split(",")):
+            print(f"concurrency {concurrency} for {args.duration:g}s ...", flush=True)
+            levels.append(run_level(args.port, concurrency, args.duration, mix, images, args.identical,
+                                    args.timeout, server.process.pid, args.seed))
+
+    report = {
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "workers": args.workers,
+            "env": env,
+            "mix": mix,
+            "duration_s": args.duration,
+            "identical_uploads": args.identical,
+            "cpu_count": os.cpu_count(),
+        },
+        "levels": levels,
+    }
+    previous = json.loads(args.compare.read_text()) if args.compare else None
+    print_levels(levels, previous)
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Reports how far the approximate pie-slice rectangles (rect_mode="approx")
+are from the exact ones, and what each mode costs.
+
+Run from the server directory:
+
+    python -m tools.pie_rect_error [IMAGE ...]
+
+With no arguments the study pie chart is used.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+
+from openCVdetectPalette import resolve_palette
+from openCVdetectShape import detect_pie_slices
+
+DEFAULT_IMAGES = [Path(__file__).resolve().parents[2] / "client/public/studyProblem/pie.png"]
+# The palette analyze_pie_chart looks for.
+PIE_COLORS = ['#9e97c8', '#5295c4', '#f47562', '#fec981', '#a9daaa', '#ffffc9']
+
+
+def box_area(box):
+    return max(0, box["xmax"] - box["xmin"]) * max(0, box["ymax"] - box["ymin"])
+
+def compare_boxes(exact, approx):
+    """
+    Returns (area ratio, IoU, largest edge offset in pixels) of an
+    approximate rectangle against the exact one.
+    """
+    inter = {
+        "xmin": max(exact["xmin"], approx["xmin"]),
+        "ymin": max(exact["ymin"], approx["ymin"]),
+        "xmax": min(exact["xmax"], approx["xmax"]),
+        "ymax": min(exact["ymax"], approx["ymax"]),
+    }
+    overlap = box_area(inter)
+    union = box_area(exact) + box_area(approx) - overlap
+    offset = max(abs(exact[k] - approx[k]) for k in ("xmin", "ymin", "xmax", "ymax"))
+    ratio = box_area(approx) / box_area(exact) if box_area(exact) else 1.0
+    return ratio, (overlap / union if union else 1.0), offset
+
+def timed_slices(image, colors, rect_mode, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = detect_pie_slices(image, colors, expected_count=len(colors), rect_mode=rect_mode)
+        best = min(best, time.perf_counter() - start)
+    return {r["color"]: r["rectangular"] for r in result["regions"]}, best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", type=Path, default=DEFAULT_IMAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode; the fastest is reported")
+    args = parser.parse_args()
+
+    for path in args.images:
+        image = cv2.imread(str(path))
+        if image is None:
+            print(f"{path}: could not read image")
+            continue
+        colors = resolve_palette(image, PIE_COLORS, min_fraction=0.0005)
+        exact, exact_ms = timed_slices(image, colors, "exact", args.repeat)
+        approx, approx_ms = timed_slices(image, colors, "approx", args.repeat)
+
+        print(f"{path.name}: exact {exact_ms:.1f}ms, approx {approx_ms:.1f}ms "
+              f"({exact_ms / approx_ms:.0f}x faster)")
+        print(f"  {'color':<9} {'area':>6} {'IoU':>6} {'offset':>6}")
+        for color, box in exact.items():
+            if color not in approx:
+                print(f"  {color:<9} missing in approx mode")
+                continue
+            ratio, iou, offset = compare_boxes(box, approx[color])
+            print(f"  {color:<9} {ratio:>6.3f} {iou:>6.3f} {offset:>4d}px")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares two ways of handing a decoded image to a process-pool worker:
+pickling the array with the task, or copying it once into shared memory
+(app/shm.py) and sending only its handle.
+
+Run from the server directory:
+
+    python -m tools.shm_benchmark [--sizes 800x600,1920x1080,3840x2160]
+        [--repeat 30] [--workers 2] [--analyzer bar_chart]
+
+Each handoff is timed from submit to result. The worker only touches one
+pixel, so the numbers are the transport cost alone, unless --analyzer is
+given: then the worker runs that analyzer, to put the transport next to
+real work. The "shm" timing includes creating the segment and copying
+the image into it; "reused" hands over an existing segment, as for an
+image analyzed more than once.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.shm import SharedImage, attached
+
+
+def parse_sizes(spec):
+    return [tuple(int(v) for v in size.split("x")) for size in spec.split(",")]
+
+def analyze(image, analyzer):
+    if analyzer is None:
+        return {"first_pixel": image[0, 0].tolist()}
+    from main import ANALYZERS
+    return ANALYZERS[analyzer](image)
+
+def work_pickled(image, analyzer):
+    return analyze(image, analyzer)
+
+def work_shared(handle, analyzer):
+    with attached(handle) as image:
+        return analyze(image, analyzer)
+
+def time_handoffs(pool, image, repeat, analyzer, mode):
+    """
+    Median milliseconds per handoff. mode is "pickle", "shm" (a new
+    segment per handoff) or "shm-reused" (one segment for all of them, as
+    for an image shared by several analyses).
+    """
+    timings = []
+    reused = SharedImage(image) if mode == "shm-reused" else None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if mode == "pickle":
+            pool.submit(work_pickled, image, analyzer).result()
+        elif mode == "shm":
+            with SharedImage(image) as segment:
+                pool.submit(work_shared, segment.handle, analyzer).result()
+        else:
+            handle = reused.retain()
+            try:
+                pool.submit(work_shared, handle, analyzer).result()
+            finally:
+                reused.release()
+        timings.append((time.perf_counter() - start) * 1000)
+    if reused is not None:
+        reused.release()
+    return statistics.median(timings)
+
+def chart_image(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        image[y:y + height // 10, x:x + width // 40] = rng.integers(0, 255, 3)
+    return image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("800x600,1920x1080,3840x2160"))
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--analyzer", help="run this analyzer in the worker (e.g. bar_chart)")
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'MB':>6} {'pickle ms':>10} {'shm ms':>8} {'reused ms':>10} {'speedup':>8}")
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # Start the workers (and their imports) before timing anything.
+        list(pool.map(work_pickled, [chart_image(8, 8)] * args.workers, [args.analyzer] * args.workers))
+        for width, height in args.sizes:
+            image = chart_image(width, height)
+            pickled = time_handoffs(pool, image, args.repeat, args.analyzer, "pickle")
+            shared = time_handoffs(pool, image, args.repeat, args.analyzer, "shm")
+            reused = time_handoffs(pool, image, args.repeat, args.analyzer, "shm-reused")
+            print(f"{width}x{height:<5} {image.nbytes / 2**20:>6.1f} {pickled:>10.2f} {shared:>8.2f} "
+                  f"{reused:>10.2f} {pickled / shared:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
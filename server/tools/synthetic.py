@@ -0,0 +1,450 @@
+"""
+Renders synthetic charts with OpenCV drawing primitives, together with
+ground-truth regions in the schema the analyzers return.
+
+Ground truth covers the data marks each analyzer reports: bars and
+segments ("rectangular region"), pie slices (their largest inscribed
+rectangle), scatter dots, bubbles, line/area values at each x tick,
+stacked-area boundaries, treemap cells and map labels.
+
+Run from the server directory to write PNG + JSON pairs:
+
+    python -m tools.synthetic OUT_DIR [--types bar_chart,pie_chart]
+        [--marks 5,20,80] [--sizes 800x600,1600x1200]
+        [--palette default|random] [--font-scale 0.5] [--seed 0]
+"""
+import argparse
+import colorsys
+import itertools
+import json
+import math
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from openCVdetectShape import largest_rectangle_in_region
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+# The palettes the analyzers in main.py look for.
+DEFAULT_PALETTES = {
+    "100_stacked_bar_chart": ['#cd7f32', '#bec36f', '#feb24c'],
+    "bar_chart": ['#3182bd'],
+    "stacked_bar_chart": ['#386cb0', '#fb9a99', '#fdc086', '#beaed4', '#7fc97f'],
+    "histogram": ['#3182bd'],
+    "scatter_plot": ['#3182bd'],
+    "bubble_chart": ['#6ea7d1'],
+    "line_chart": ['#3282bd'],
+    "area_chart": ['#3282bd'],
+    "stacked_area_chart": ["#3282bd", "#9ecae1", "#deebf7"],
+    "pie_chart": ['#9e97c8', '#5295c4', '#f47562', '#fec981', '#a9daaa', '#ffffc9'],
+    "treemap": ['#a5d9a5', '#fed3aa', '#fcb8b7', '#d1c6e1', '#7398c8'],
+    "map": ['#08468f', '#4f7fba', '#86a6ce', '#b8cbe4', '#e6eef8'],
+}
+
+
+def hex_to_bgr(hex_color):
+    r, g, b = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+    return (b, g, r)
+
+def random_palette(rng, count):
+    """
+    `count` saturated colors with evenly spread hues, so every pair is
+    farther apart than the analyzers' color tolerance.
+    """
+    offset = rng.random()
+    colors = []
+    for i in range(count):
+        hue = (offset + i / count) % 1.0
+        r, g, b = colorsys.hsv_to_rgb(hue, rng.uniform(0.45, 0.75), rng.uniform(0.7, 0.9))
+        colors.append("#{:02x}{:02x}{:02x}".format(int(r * 255), int(g * 255), int(b * 255)))
+    return colors
+
+def region(label, xmin, ymin, xmax, ymax, color="#000000"):
+    return {
+        "label": label,
+        "rectangular": {"xmin": int(xmin), "ymin": int(ymin), "xmax": int(xmax), "ymax": int(ymax)},
+        "color": color,
+    }
+
+def fill_rect(canvas, xmin, ymin, xmax, ymax, color):
+    """
+    Fills [xmin, xmax) x [ymin, ymax), matching cv2.boundingRect's extent.
+    """
+    canvas[int(ymin):int(ymax), int(xmin):int(xmax)] = color
+
+def put_text(canvas, text, center, font_scale, thickness=1, color=BLACK):
+    (w, h), _ = cv2.getTextSize(text, FONT, font_scale, thickness)
+    org = (int(center[0] - w / 2), int(center[1] + h / 2))
+    cv2.putText(canvas, text, org, FONT, font_scale, color, thickness, cv2.LINE_AA)
+
+def text_box(text, center, font_scale, thickness=1):
+    """
+    The ink bounds of text drawn by put_text at `center`.
+    """
+    (w, h), baseline = cv2.getTextSize(text, FONT, font_scale, thickness)
+    patch = np.zeros((h + baseline + 2 * thickness + 4, w + 2 * thickness + 4), np.uint8)
+    cv2.putText(patch, text, (thickness + 2, h + thickness + 2), FONT, font_scale, 255, thickness, cv2.LINE_AA)
+    x, y, bw, bh = cv2.boundingRect(patch)
+    left = int(center[0] - w / 2) - thickness - 2 + x
+    top = int(center[1] + h / 2) - h - thickness - 2 + y
+    return left, top, left + bw, top + bh
+
+
+class Frame:
+    """
+    Canvas plus the plot area of a chart with a title, axes and ticks laid
+    out the way the study charts are (title in the top 10%, x tick labels in
+    the bottom 15%, y tick labels left of the plot).
+    """
+
+    def __init__(self, width, height, font_scale, right=0.92):
+        self.canvas = np.full((height, width, 3), 255, np.uint8)
+        self.width, self.height, self.font_scale = width, height, font_scale
+        self.x0, self.x1 = int(0.12 * width), int(right * width)
+        self.y0, self.y1 = int(0.15 * height), int(0.8 * height)
+
+    def title(self, text="Synthetic chart"):
+        put_text(self.canvas, text, (self.width / 2, 0.05 * self.height), self.font_scale * 1.4, 2)
+
+    def axes(self, y_ticks=5):
+        cv2.line(self.canvas, (self.x0, self.y0), (self.x0, self.y1), BLACK, 1)
+        cv2.line(self.canvas, (self.x0, self.y1), (self.x1, self.y1), BLACK, 1)
+        for i in range(y_ticks + 1):
+            y = self.y1 - (self.y1 - self.y0) * i / y_ticks
+            (w, _), _ = cv2.getTextSize(str(i * 20), FONT, self.font_scale, 1)
+            put_text(self.canvas, str(i * 20), (self.x0 - 8 - w / 2, y), self.font_scale)
+
+    def x_labels(self, xs):
+        y = 0.9 * self.height
+        for i, x in enumerate(xs):
+            put_text(self.canvas, str(2000 + i), (x, y), self.font_scale)
+
+
+def bar_chart(rng, width, height, marks, palette, font_scale, gap=None):
+    frame = Frame(width, height, font_scale)
+    frame.title()
+    slot = (frame.x1 - frame.x0) / marks
+    bar_width = slot * 0.7 if gap is None else slot - gap
+    truth = []
+    for i in range(marks):
+        xmin = frame.x0 + i * slot + (slot - bar_width) / 2
+        xmax = xmin + max(1, bar_width)
+        ymin = frame.y1 - rng.uniform(0.1, 1.0) * (frame.y1 - frame.y0)
+        fill_rect(frame.canvas, xmin, ymin, xmax, frame.y1, hex_to_bgr(palette[0]))
+        truth.append(region("rectangular region", int(xmin), int(ymin), int(xmax), frame.y1, palette[0]))
+    frame.axes()
+    return frame.canvas, truth
+
+def histogram(rng, width, height, marks, palette, font_scale):
+    # Adjacent bins are separated only by a 1px white gap.
+    return bar_chart(rng, width, height, marks, palette, font_scale, gap=1)
+
+def stacked_bar_chart(rng, width, height, marks, palette, font_scale, normalized=False):
+    frame = Frame(width, height, font_scale)
+    frame.title()
+    slot = (frame.x1 - frame.x0) / marks
+    truth = []
+    for i in range(marks):
+        xmin = int(frame.x0 + i * slot + slot * 0.15)
+        xmax = int(xmin + max(1, slot * 0.7))
+        shares = rng.uniform(0.2, 1.0, len(palette))
+        total = (frame.y1 - frame.y0) * (1.0 if normalized else rng.uniform(0.3, 1.0))
+        edges = frame.y1 - np.concatenate([[0], np.cumsum(shares / shares.sum() * total)])
+        for color, bottom, top in zip(palette, edges[:-1], edges[1:]):
+            bottom, top = int(round(bottom)), int(round(top))
+            fill_rect(frame.canvas, xmin, top, xmax, bottom, hex_to_bgr(color))
+            truth.append(region("rectangular region", xmin, top, xmax, bottom, color))
+    frame.axes()
+    return frame.canvas, truth
+
+def stacked_100_bar_chart(rng, width, height, marks, palette, font_scale):
+    return stacked_bar_chart(rng, width, height, marks, palette, font_scale, normalized=True)
+
+def place_circles(rng, count, radii, bounds, tries=200):
+    """
+    Rejection-samples non-overlapping circles; once a circle finds no free
+    spot in `tries` attempts it is placed anyway, so dense charts overlap.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    placed = []
+    for radius in radii:
+        for _ in range(tries):
+            x = rng.uniform(xmin + radius, xmax - radius)
+            y = rng.uniform(ymin + radius, ymax - radius)
+            if all(math.hypot(x - px, y - py) > radius + pr + 2 for px, py, pr in placed):
+                break
+        placed.append((x, y, radius))
+    return [(int(round(x)), int(round(y)), r) for x, y, r in placed]
+
+def circle_truth(canvas, label, circles, palette):
+    truth = []
+    for i, (x, y, r) in enumerate(circles):
+        color = palette[i % len(palette)]
+        cv2.circle(canvas, (x, y), r, hex_to_bgr(color), -1, cv2.LINE_8)
+        truth.append(region(label, x - r, y - r, x + r + 1, y + r + 1, color))
+    return truth
+
+def scatter_plot(rng, width, height, marks, palette, font_scale):
+    frame = Frame(width, height, font_scale)
+    frame.title()
+    circles = place_circles(rng, marks, [4] * marks, (frame.x0 + 2, frame.y0, frame.x1, frame.y1 - 2))
+    truth = circle_truth(frame.canvas, "series-legend-item", circles, palette)
+    frame.axes()
+    return frame.canvas, truth
+
+def bubble_chart(rng, width, height, marks, palette, font_scale):
+    frame = Frame(width, height, font_scale)
+    frame.title()
+    scale = min(width, height) / 600
+    radii = sorted((int(rng.uniform(6, 30) * scale) for _ in range(marks)), reverse=True)
+    circles = place_circles(rng, marks, radii, (frame.x0 + 2, frame.y0, frame.x1, frame.y1 - 2))
+    truth = circle_truth(frame.canvas, "bubble", circles, palette)
+    frame.axes()
+    return frame.canvas, truth
+
+def series_xs(frame, marks):
+    step = (frame.x1 - frame.x0 - 40) / max(1, marks - 1)
+    return [int(frame.x0 + 20 + i * step) for i in range(marks)]
+
+def random_walk(rng, count, low, high):
+    values = [rng.uniform(low, high)]
+    for _ in range(count - 1):
+        values.append(float(np.clip(values[-1] + rng.normal(0, (high - low) * 0.15), low, high)))
+    return values
+
+def line_chart(rng, width, height, marks, palette, font_scale, filled=False):
+    frame = Frame(width, height, font_scale)
+    frame.title()
+    frame.axes()
+    xs = series_xs(frame, max(2, marks))
+    ys = [int(y) for y in random_walk(rng, len(xs), frame.y0 + 20, frame.y1 - 20)]
+    points = np.array(list(zip(xs, ys)), np.int32)
+    if filled:
+        polygon = np.vstack([points, [[xs[-1], frame.y1 - 1], [xs[0], frame.y1 - 1]]])
+        cv2.fillPoly(frame.canvas, [polygon], hex_to_bgr(palette[0]))
+        cv2.polylines(frame.canvas, [points], False, (85, 85, 85), 2, cv2.LINE_8)
+    else:
+        cv2.polylines(frame.canvas, [points], False, hex_to_bgr(palette[0]), 2, cv2.LINE_8)
+    frame.x_labels(xs)
+    truth = [region("area_boundary_value", x - 20, y - 20, x + 20, y + 20) for x, y in zip(xs, ys)]
+    return frame.canvas, truth
+
+def area_chart(rng, width, height, marks, palette, font_scale):
+    return line_chart(rng, width, height, marks, palette, font_scale, filled=True)
+
+def stacked_area_chart(rng, width, height, marks, palette, font_scale):
+    # The analyzer only reads the left 80% of the image for axes.
+    frame = Frame(width, height, font_scale, right=0.75)
+    frame.title()
+    frame.axes()
+    xs = series_xs(frame, max(2, marks))
+    span = frame.y1 - frame.y0
+    layers = [random_walk(rng, len(xs), 0.1 * span, 0.3 * span) for _ in range(3)]
+    tops = np.round(frame.y1 - np.cumsum(layers, axis=0)).astype(int)
+    # Paint the union of the layers top-down so each lower layer covers the rest.
+    for color, top in reversed(list(zip(palette, tops))):
+        polygon = np.vstack([np.column_stack([xs, top]), [[xs[-1], frame.y1 - 1], [xs[0], frame.y1 - 1]]])
+        cv2.fillPoly(frame.canvas, [polygon.astype(np.int32)], hex_to_bgr(color))
+    frame.x_labels(xs)
+    truth = []
+    for label, top in zip(("boundary_1_0", "boundary_2_1", "boundary_white_2"), tops):
+        truth.extend(region(label, x - 20, y - 20, x + 20, y + 20) for x, y in zip(xs, top))
+    return frame.canvas, truth
+
+def pie_chart(rng, width, height, marks, palette, font_scale):
+    frame = Frame(width, height, font_scale)
+    frame.title()
+    center = ((frame.x0 + frame.x1) // 2, (frame.y0 + frame.y1) // 2)
+    radius = int(0.45 * min(frame.x1 - frame.x0, frame.y1 - frame.y0))
+    shares = rng.uniform(0.3, 1.0, marks)
+    angles = np.concatenate([[0], np.cumsum(shares / shares.sum() * 360)]) - 90
+    masks = []
+    for i, (start, end) in enumerate(zip(angles[:-1], angles[1:])):
+        mask = np.zeros(frame.canvas.shape[:2], np.uint8)
+        cv2.ellipse(mask, center, (radius, radius), 0, float(start), float(end), 1, -1, cv2.LINE_8)
+        masks.append(mask)
+    for angle in angles[:-1]:
+        edge = (int(center[0] + radius * math.cos(math.radians(angle))),
+                int(center[1] + radius * math.sin(math.radians(angle))))
+        for mask in masks:
+            cv2.line(mask, center, edge, 0, 2)
+    truth = []
+    for i, mask in enumerate(masks):
+        color = palette[i % len(palette)]
+        frame.canvas[mask == 1] = hex_to_bgr(color)
+        left, top, w, h = largest_rectangle_in_region(mask)
+        truth.append(region("pie-slice", left, top, left + w, top + h, color))
+    return frame.canvas, truth
+
+def split_rect(rng, rect, count):
+    """
+    Slice-and-dice: splits a rect into `count` rects along its longer side.
+    """
+    if count == 1:
+        return [rect]
+    xmin, ymin, xmax, ymax = rect
+    first = count // 2
+    share = first / count * rng.uniform(0.8, 1.2)
+    if xmax - xmin >= ymax - ymin:
+        cut = int(xmin + (xmax - xmin) * share)
+        a, b = (xmin, ymin, cut, ymax), (cut, ymin, xmax, ymax)
+    else:
+        cut = int(ymin + (ymax - ymin) * share)
+        a, b = (xmin, ymin, xmax, cut), (xmin, cut, xmax, ymax)
+    return split_rect(rng, a, first) + split_rect(rng, b, count - first)
+
+def treemap(rng, width, height, marks, palette, font_scale):
+    canvas = np.full((height, width, 3), 255, np.uint8)
+    put_text(canvas, "Synthetic treemap", (width / 2, 0.04 * height), font_scale * 1.4, 2)
+    cells = split_rect(rng, (int(0.02 * width), int(0.1 * height), int(0.98 * width), int(0.98 * height)), marks)
+    truth = []
+    for i, (xmin, ymin, xmax, ymax) in enumerate(cells):
+        color = palette[i % len(palette)]
+        # A 2px white border separates neighboring cells.
+        xmin, ymin, xmax, ymax = xmin + 2, ymin + 2, xmax - 2, ymax - 2
+        if xmax <= xmin or ymax <= ymin:
+            continue
+        fill_rect(canvas, xmin, ymin, xmax, ymax, hex_to_bgr(color))
+        truth.append(region("rectangular region", xmin, ymin, xmax, ymax, color))
+        (tw, th), _ = cv2.getTextSize(f"N{i}", FONT, font_scale, 1)
+        if tw + 12 < xmax - xmin and th + 12 < ymax - ymin:
+            put_text(canvas, f"N{i}", (xmin + 6 + tw / 2, ymin + 6 + th / 2), font_scale, color=(60, 60, 60))
+    return canvas, truth
+
+def map_chart(rng, width, height, marks, palette, font_scale):
+    """
+    Choropleth-like map: a jittered grid of shaded cells with white borders,
+    each labeled with a bold two-letter abbreviation.
+    """
+    canvas = np.full((height, width, 3), 255, np.uint8)
+    cols = max(1, int(round(math.sqrt(marks * width / height))))
+    rows = math.ceil(marks / cols)
+    xs = np.linspace(0.05 * width, 0.95 * width, cols + 1)
+    ys = np.linspace(0.15 * height, 0.95 * height, rows + 1)
+    jitter = 0.2 * min(xs[1] - xs[0], ys[1] - ys[0])
+    grid = np.stack(np.meshgrid(xs, ys), axis=-1)
+    grid[1:-1, 1:-1] += rng.uniform(-jitter, jitter, grid[1:-1, 1:-1].shape)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    truth = []
+    for index, (r, c) in enumerate(itertools.islice(itertools.product(range(rows), range(cols)), marks)):
+        polygon = np.array([grid[r, c], grid[r, c + 1], grid[r + 1, c + 1], grid[r + 1, c]], np.int32)
+        cv2.fillPoly(canvas, [polygon], hex_to_bgr(palette[int(rng.integers(len(palette)))]))
+        cv2.polylines(canvas, [polygon], True, WHITE, 2, cv2.LINE_8)
+        text = letters[index % 26] + letters[(index // 26 + index * 7) % 26]
+        # Stagger labels vertically, as on real maps, instead of lining up rows.
+        center = polygon.mean(axis=0) + (0, rng.uniform(-0.25, 0.25) * (ys[1] - ys[0]))
+        truth.append(region("state_abbreviation", *put_spaced_text(canvas, text, center, font_scale * 1.2, 2)))
+    return canvas, truth
+
+def put_spaced_text(canvas, text, center, font_scale, thickness):
+    """
+    Draws each letter separately with a small gap (Hershey letters touch at
+    heavier weights) and returns the ink bounds of the whole label.
+    """
+    widths = [cv2.getTextSize(ch, FONT, font_scale, thickness)[0][0] for ch in text]
+    gap = max(2, int(4 * font_scale))
+    x = center[0] - (sum(widths) + gap * (len(text) - 1)) / 2
+    boxes = []
+    for ch, w in zip(text, widths):
+        put_text(canvas, ch, (x + w / 2, center[1]), font_scale, thickness)
+        boxes.append(text_box(ch, (x + w / 2, center[1]), font_scale, thickness))
+        x += w + gap
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+GENERATORS = {
+    "100_stacked_bar_chart": stacked_100_bar_chart,
+    "bar_chart": bar_chart,
+    "stacked_bar_chart": stacked_bar_chart,
+    "histogram": histogram,
+    "scatter_plot": scatter_plot,
+    "bubble_chart": bubble_chart,
+    "line_chart": line_chart,
+    "area_chart": area_chart,
+    "stacked_area_chart": stacked_area_chart,
+    "pie_chart": pie_chart,
+    "treemap": treemap,
+    "map": map_chart,
+}
+
+
+def generate(chart_type, width=800, height=600, marks=10, palette="default", font_scale=0.5, seed=0):
+    """
+    Renders one synthetic chart.
+
+    Parameters:
+      - chart_type: A key of GENERATORS (the analyzer's chart type).
+      - width, height: Image size in pixels.
+      - marks: Number of bars, slices, dots, bubbles, x ticks, cells or labels.
+      - palette: "default" (the colors the analyzer looks for), "random",
+        or a list of hex colors.
+      - font_scale: Scale of all text.
+      - seed: Random seed; the same arguments always give the same image.
+
+    Returns:
+      (image, truth) where truth holds the parameters and "regions".
+    """
+    rng = np.random.default_rng(seed)
+    default = DEFAULT_PALETTES[chart_type]
+    if palette == "default":
+        colors = default
+    elif palette == "random":
+        colors = random_palette(rng, len(default))
+    else:
+        colors = list(palette)
+    image, regions = GENERATORS[chart_type](rng, width, height, marks, colors, font_scale)
+    truth = {
+        "chart_type": chart_type,
+        "width": width,
+        "height": height,
+        "marks": marks,
+        "palette": colors,
+        "font_scale": font_scale,
+        "seed": seed,
+        "regions": regions,
+    }
+    return image, truth
+
+def sweep(chart_types, marks_list, sizes, palette="default", font_scale=0.5, seed=0):
+    """
+    Yields (name, image, truth) for every combination of chart type, mark
+    count and size.
+    """
+    for chart_type, marks, (width, height) in itertools.product(chart_types, marks_list, sizes):
+        image, truth = generate(chart_type, width, height, marks, palette, font_scale, seed)
+        yield f"{chart_type}-{marks}-{width}x{height}-{palette}-{seed}", image, truth
+
+def add_sweep_arguments(parser):
+    parser.add_argument("--types", default=",".join(GENERATORS),
+                        help="comma-separated chart types (default: all)")
+    parser.add_argument("--marks", default="5,20,80", help="comma-separated mark counts")
+    parser.add_argument("--sizes", default="800x600,1600x1200", help="comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--palette", default="default", choices=("default", "random"))
+    parser.add_argument("--font-scale", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+
+def sweep_from_args(args):
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes.split(",")]
+    return sweep(args.types.split(","), [int(m) for m in args.marks.split(",")], sizes,
+                 args.palette, args.font_scale, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir", type=Path)
+    add_sweep_arguments(parser)
+    args = parser.parse_args()
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    for name, image, truth in sweep_from_args(args):
+        cv2.imwrite(str(args.out_dir / f"{name}.png"), image)
+        (args.out_dir / f"{name}.json").write_text(json.dumps(truth, indent=2))
+        print(f"{name}: {len(truth['regions'])} regions")
+
+
+if __name__ == "__main__":
+    main()